@@ -0,0 +1,28 @@
+import numpy as np
+
+from tsuchinoko.adaptive.batch import kriging_believer, local_penalization, mean_variance_acquisition_functions
+
+
+def rbf(a, b, length_scale=.1):
+    return np.exp(-np.sum((a[:, None, :] - b[None, :, :]) ** 2, axis=-1) / (2 * length_scale ** 2))
+
+
+def test_kriging_believer_spreads_batch():
+    candidates = np.random.random((200, 2))
+    covariance = rbf(candidates, candidates)
+    selected = kriging_believer(np.zeros(200), covariance, mean_variance_acquisition_functions['variance'], 5, 1e-6)
+
+    assert len(set(selected)) == 5
+    chosen = candidates[selected]
+    distances = np.linalg.norm(chosen[:, None] - chosen[None], axis=-1)[np.triu_indices(5, 1)]
+    assert np.min(distances) > .1  # fantasized measurements suppress the variance around each selection
+
+
+def test_local_penalization_spreads_batch():
+    candidates = np.random.random((200, 2))
+    mean = np.sin(4 * candidates[:, 0])
+    values = np.exp(-np.sum((candidates - .5) ** 2, axis=1) / .01)  # one sharp peak
+    selected = local_penalization(candidates, values, mean, np.full(200, .01), 4)
+
+    assert len(set(selected)) == 4
+    assert selected[0] == np.argmax(values)
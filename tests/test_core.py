@@ -1,7 +1,90 @@
 import time
 
+import numpy as np
+
+from tsuchinoko.adaptive import Data, Engine as AdaptiveEngine
+from tsuchinoko.adaptive.ndtree import NDTreeEngine
+from tsuchinoko.core import Core
+from tsuchinoko.execution.threaded_in_process import ThreadedInProcessEngine
+
 
 def test_core(core):
     time.sleep(1)
     assert len(core.data)
 
+
+def test_wait_for_measurements():
+    engine = ThreadedInProcessEngine(lambda target: (target, 1, 1, {}))
+    try:
+        engine.update_targets([(0, 0)])
+        assert engine.wait_for_measurements(timeout=5)
+        assert len(engine.get_measurements()) == 1
+        assert not engine.wait_for_measurements(timeout=.01)
+    finally:
+        engine.exiting = True
+
+
+class SlowTrainingEngine(AdaptiveEngine):
+    dimensionality = 2
+    thread_safe = True
+
+    def __init__(self):
+        self.training = False
+        self.requests_while_training = 0
+
+    def update_measurements(self, data):
+        pass
+
+    def request_targets(self, position):
+        self.requests_while_training += self.training
+        return [tuple(np.random.random(2))]
+
+    def reset(self):
+        pass
+
+    def train(self):
+        self.training = True
+        time.sleep(.5)
+        self.training = False
+
+    def update_metrics(self, data):
+        pass
+
+
+def test_pipelined_training_does_not_block_targets():
+    engine = SlowTrainingEngine()
+    execution = ThreadedInProcessEngine(lambda target: (target, 1, 1, {}))
+    core = Core(execution, engine, compute_metrics=False, pipelined=True)
+    core.data = Data(dimensionality=2)
+    start = time.time()
+    try:
+        while not engine.requests_while_training and time.time() - start < 2:
+            core.experiment_iteration()
+        assert engine.requests_while_training
+    finally:
+        execution.exiting = True
+
+
+def test_pipelined_tree_engine():
+    # the tree engine keeps telling and evaluating its model while the background stage retrains it
+    engine = NDTreeEngine(2, [(0, 1), (0, 1)], [1, .3, .3], [(.1, 10), (.01, 1), (.01, 1)])
+    execution = ThreadedInProcessEngine(lambda target: (target, np.sin(3 * target[0]), 1e-3, {}))
+    core = Core(execution, engine, compute_metrics=True, pipelined=True)
+    core.data = Data(dimensionality=2)
+    start = time.time()
+    try:
+        while len(core.data) < 60 and time.time() - start < 60:
+            core.experiment_iteration()
+        while core._background_thread and time.time() - start < 120:
+            time.sleep(.1)
+    finally:
+        execution.exiting = True
+    assert not core._background_thread
+    assert engine._completed_training['global']
+
+    # once told of the retrained model, every acquisition value is current
+    engine.update_measurements(core.data)
+    positions = engine.tree.positions.view()
+    acquisition_function = engine.acquisition_function(engine.parameters['acquisition_function'])
+    values = np.ravel(engine.optimizer.evaluate_acquisition_function(positions, acquisition_function=acquisition_function))
+    assert np.allclose(engine.acq_func_values, values * engine.tree.leaf_volumes(engine.tree.locate(positions)))
@@ -0,0 +1,177 @@
+import pickle
+import time
+from threading import Thread, Event
+
+import numpy as np
+
+from tsuchinoko.adaptive import Data
+from tsuchinoko.utils.buffers import ColumnBuffer, RingBuffer
+from tsuchinoko.utils.mutex import FairRWLock
+
+
+def test_column_buffer_growth():
+    buffer = ColumnBuffer(dtype=float)
+    for i in range(100):
+        buffer.append((i, i))
+    assert len(buffer) == 100
+    assert np.asarray(buffer).shape == (100, 2)
+
+    view = np.asarray(buffer)
+    assert not view.flags.writeable
+
+    # views taken earlier are unaffected by later appends
+    buffer.extend(np.zeros((1000, 2)))
+    assert len(view) == 100
+    assert np.all(view[-1] == (99, 99))
+
+
+def test_column_buffer_ragged():
+    buffer = ColumnBuffer([1, 2])
+    buffer.append([3, 4])
+    assert len(buffer) == 3
+    assert buffer[-1] == [3, 4]
+    assert len(pickle.loads(pickle.dumps(buffer))) == 3
+
+
+
+def test_ring_buffer():
+    buffer = RingBuffer(4)
+    for i in range(3):
+        assert buffer.put(i)
+    assert buffer.drain() == [0, 1, 2]
+
+    # wraps around the end of the array
+    for i in range(4):
+        buffer.put(i)
+    assert buffer.drain() == [0, 1, 2, 3]
+    assert buffer.high_water == 4
+    assert buffer.drain() == []
+
+    # a full buffer blocks producers until drained, and nothing is lost
+    items = []
+    producer = Thread(target=lambda: [buffer.put(i) for i in range(100)])
+    producer.start()
+    while len(items) < 100:
+        items.extend(buffer.drain(timeout=1))
+    producer.join()
+    assert items == list(range(100))
+
+    # closing wakes a producer blocked on a full buffer, and later puts don't block
+    for i in range(4):
+        buffer.put(i)
+    refused = []
+    producer = Thread(target=lambda: refused.append(not buffer.put(4)))
+    producer.start()
+    time.sleep(.05)
+    buffer.close()
+    producer.join(1)
+    assert refused == [True] and not buffer.put(5)
+    assert buffer.drain() == [0, 1, 2, 3]
+    assert buffer.put(6) and buffer.drain() == [6]
+
+def test_data():
+    data = Data()
+    data.inject_new([((i, i), i, 1, {'metric': i}) for i in range(50)])
+
+    assert len(data) == 50
+    assert np.asarray(data.positions).shape == (50, 2)
+    assert data['metric'][-1] == 49
+
+    copy = Data(**data.as_dict())
+    copy.extend(data[10:])
+    assert len(copy) == 90
+    assert len(copy.metrics['metric']) == 90
+
+
+def test_data_snapshot():
+    data = Data()
+    data.inject_new([((0, 0), 0, 1, {})])
+    snapshot = data.snapshot()
+
+    data.inject_new([((1, 1), 1, 1, {})])
+    with data.w_lock():
+        data.states['state'] = np.zeros((2, 2))
+
+    # earlier snapshots are unaffected by later writes
+    assert len(snapshot) == 1
+    assert 'state' not in snapshot
+
+    latest = data.snapshot()
+    assert latest.version > snapshot.version
+    assert latest.states_version > snapshot.states_version
+    assert len(latest) == 2 and 'state' in latest
+    assert len(latest[1:]) == 1
+
+    data.inject_new([((2, 2), 2, 1, {})])
+    assert data.snapshot().states_version == latest.states_version
+
+
+def test_fair_rwlock():
+    lock = FairRWLock()
+    writer_done = Event()
+
+    def write():
+        with lock.w_locked():
+            writer_done.set()
+
+    with lock.r_locked():
+        writer = Thread(target=write)
+        writer.start()
+        while not lock._waiting_writers:
+            time.sleep(.001)
+
+        # a waiting writer blocks new readers from other threads
+        assert not _run_in_thread(lambda: lock.r_acquire(timeout=.05))
+
+        # ...but not re-entrant reads
+        with lock.r_locked():
+            pass
+
+    writer.join()
+    assert writer_done.is_set()
+
+    statistics = lock.statistics()
+    assert statistics.timeouts == 1
+    assert statistics.write_acquisitions == 1
+    assert statistics.longest_holder is not None
+
+
+def test_lock_holder_call_site():
+    data = Data()
+    with data.w_lock():
+        time.sleep(.01)
+    # reported at the caller, not within Data.w_lock
+    assert data.lock_statistics().longest_holder.endswith('(test_lock_holder_call_site)')
+
+
+def _run_in_thread(func):
+    result = []
+    thread = Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_data_delta():
+    server = Data()
+    server.inject_new([((0, 0), 0, 1, {})])
+    with server.w_lock():
+        server.states['static'] = np.zeros((50, 50))
+        server.states['dynamic'] = 0
+
+    client = Data(**server.snapshot().as_dict())
+    state_versions = dict(server.snapshot().state_versions)
+
+    server.inject_new([((1, 1), 1, 1, {})])
+    with server.w_lock():
+        server.states['dynamic'] = 1
+
+    snapshot = server.snapshot()
+    delta = snapshot.delta(len(client), state_versions)
+    assert len(delta) == 1
+    assert set(delta.states) == {'dynamic'}
+
+    client.extend(Data(**delta.as_dict()), state_keys=snapshot.state_versions.keys())
+    assert len(client) == 2
+    assert client.states['dynamic'] == 1
+    assert client.states['static'].shape == (50, 50)
@@ -0,0 +1,209 @@
+import asyncio
+import itertools
+import multiprocessing
+import time
+from functools import partial
+
+import numpy as np
+
+from tsuchinoko.execution.async_in_process import AsyncExecutionEngine
+from tsuchinoko.execution.distributed import DistributedEngine, run_worker
+from tsuchinoko.execution.scheduling import MotionScheduler
+from tsuchinoko.execution.simple import SimpleEngine, SimplestEngine
+from tsuchinoko.execution.threaded_in_process import ThreadedInProcessEngine
+
+
+def slow_measurement(position, delay=.2):
+    time.sleep(delay)
+    return position, sum(position), 1, {}
+
+
+def collect(engine, count, timeout=10):
+    measurements = []
+    start = time.time()
+    while len(measurements) < count and time.time() - start < timeout:
+        engine.wait_for_measurements(.1)
+        measurements.extend(engine.get_measurements())
+    return measurements
+
+
+def test_pooled_measurements():
+    engine = SimpleEngine(slow_measurement, workers=4)
+    targets = [(i, i) for i in range(8)]
+    start = time.time()
+    engine.update_targets(targets)
+    assert engine.in_flight == 8
+    measurements = collect(engine, 8)
+    assert time.time() - start < 1.2  # 8 measurements of .2 s on 4 workers
+    assert sorted(measurements) == sorted(slow_measurement(target, 0) for target in targets)
+
+
+def test_pooled_measurements_cancel_superseded_targets():
+    engine = SimpleEngine(slow_measurement, workers=1, max_in_flight=4)
+    engine.update_targets([(i, 0) for i in range(4)])
+    time.sleep(.05)
+    # the first target is being measured; the rest haven't started
+    engine.update_targets([(10, 10)])
+    assert engine.cancelled == 3
+    measurements = collect(engine, 2)
+    assert [measurement[0] for measurement in measurements] == [(0, 0), (10, 10)]
+
+
+def test_pooled_measurements_finished_before_their_callbacks():
+    engine = SimplestEngine(sum, workers=2, max_in_flight=64)
+    engine.update_targets([(i, i) for i in range(64)])
+    assert sorted(collect(engine, 64)) == [((i, i), 2 * i, .1, {}) for i in range(64)]
+    assert engine.in_flight == 0
+
+
+def test_process_pooled_measurements():
+    engine = SimplestEngine(sum, workers=2, pool='process')
+    engine.update_targets([(1, 2), (3, 4), (5, 6)])
+    assert sorted(collect(engine, 3, timeout=60)) == [((1, 2), 3, .1, {}), ((3, 4), 7, .1, {}), ((5, 6), 11, .1, {})]
+
+
+def test_threaded_measurements():
+    engine = ThreadedInProcessEngine(lambda target: (target, sum(target), 1, {}), workers=4, buffer_size=64)
+    targets = [(i, i) for i in range(5000)]
+    engine.update_targets(targets)
+    measurements = collect(engine, 5000)
+    engine.stop()
+    # nothing is lost or duplicated, even though the buffer overflows
+    assert sorted(measurements) == sorted((target, sum(target), 1, {}) for target in targets)
+    statistics = engine.statistics
+    assert statistics['queue_depth'] == 0 and statistics['buffered'] == 0
+    assert statistics['measured'] == 5000
+    assert statistics['buffer_high_water'] <= 64
+    assert 0 < statistics['utilization'] <= 1
+
+
+def test_threaded_stop_with_full_buffer():
+    engine = ThreadedInProcessEngine(lambda target: (target, sum(target), 1, {}), workers=2, buffer_size=1)
+    engine.update_targets([(i, i) for i in range(10)])
+    while engine.statistics['buffer_full_waits'] < 2:
+        time.sleep(.01)
+    # workers blocked on the uncollected buffer still stop
+    start = time.time()
+    engine.stop()
+    assert time.time() - start < 1
+    assert not any(thread.is_alive() for thread in engine.measure_threads)
+    assert len(engine.get_measurements()) == 1
+
+
+async def async_measurement(position, delay=.2):
+    await asyncio.sleep(delay)
+    return position, sum(position), 1, {}
+
+
+def test_async_measurements():
+    engine = AsyncExecutionEngine(async_measurement, concurrency=10)
+    try:
+        targets = [(i, i) for i in range(20)]
+        start = time.time()
+        engine.update_targets(targets)
+        measurements = collect(engine, 20)
+        assert time.time() - start < 1  # 20 measurements of .2 s, 10 at a time
+        assert sorted(measurements) == sorted((target, sum(target), 1, {}) for target in targets)
+    finally:
+        engine.stop()
+
+
+def test_async_measurements_timeout_and_cancel():
+    engine = AsyncExecutionEngine(lambda target: async_measurement(target, target[0]), concurrency=2, timeout=.5)
+    try:
+        engine.update_targets([(0, 0), (5, 0)])
+        assert collect(engine, 1) == [((0, 0), 0, 1, {})]
+        time.sleep(.6)
+        assert engine.statistics['timed_out'] == 1
+
+        engine.update_targets([(5, 0), (5, 0), (0, 1)])
+        time.sleep(.1)
+        engine.cancel()
+        assert engine.statistics['cancelled'] == 3
+        assert engine.statistics['in_flight'] == 0
+        assert engine.get_measurements() == []
+    finally:
+        engine.stop()
+
+
+def start_workers(engine, count, delay):
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(partial(slow_measurement, delay=delay), engine.endpoint),
+                               kwargs=dict(heartbeat_interval=engine.heartbeat_interval)) for i in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def wait_until(condition, timeout=60):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(.01)
+    return condition()
+
+
+def test_distributed_measurements():
+    engine = DistributedEngine('tcp://127.0.0.1:*', heartbeat_interval=.1)
+    workers = start_workers(engine, 2, delay=.05)
+    try:
+        targets = [(i, i) for i in range(20)]
+        engine.update_targets(targets)
+        measurements = collect(engine, 20, timeout=60)
+        assert sorted(measurements) == sorted(slow_measurement(target, 0) for target in targets)
+        assert engine.statistics['measured'] == 20
+    finally:
+        engine.stop()
+        for worker in workers:
+            worker.join(10)
+    assert not any(worker.is_alive() for worker in workers)
+
+
+def test_distributed_measurements_redispatched_from_dead_workers():
+    engine = DistributedEngine('tcp://127.0.0.1:*', heartbeat_interval=.1)
+    workers = start_workers(engine, 2, delay=.5)
+    try:
+        assert wait_until(lambda: engine.workers == 2)
+        targets = [(i, i) for i in range(4)]
+        engine.update_targets(targets)
+        assert wait_until(lambda: engine.statistics['in_flight'] == 2)
+        workers[0].kill()
+
+        measurements = collect(engine, 4, timeout=60)
+        assert sorted(measurements) == sorted(slow_measurement(target, 0) for target in targets)
+        assert engine.statistics['redispatched'] == 1
+        assert engine.workers == 1
+    finally:
+        engine.stop()
+        for worker in workers:
+            worker.join(10)
+
+
+def test_motion_scheduler_move_times():
+    scheduler = MotionScheduler(velocity=[1, 2], acceleration=4)
+    # reaches top speed on long moves (1 s + 1/4 s for the ramps), but not on short moves (2 * sqrt(.04 / 4) s)
+    assert np.allclose(scheduler.move_times([[0, 0]], [[1, 0], [.04, 0], [0, 1]]), [[1.25, .2, 1]])
+
+
+def test_motion_scheduler_ordering():
+    scheduler = MotionScheduler(velocity=1)
+    targets = [tuple(point) for point in np.random.default_rng(0).random((7, 2))]
+    ordered = scheduler.schedule((0, 0), targets)
+    assert sorted(ordered) == sorted(targets)
+
+    # close to the best of all orders
+    points = np.array([(0, 0)] + targets)
+    cost = scheduler.move_times(points, points)
+    route_time = lambda route: cost[route[:-1], route[1:]].sum()
+    best_time = min(route_time([0, *order]) for order in itertools.permutations(range(1, 8)))
+    assert route_time([0, *(targets.index(target) + 1 for target in ordered)]) <= 1.1 * best_time
+    assert scheduler.estimated_savings > 0
+
+    scheduler.observe([(ordered[0], 1, 1, {}), ((-1, -1), 1, 1, {})])
+    assert scheduler.statistics['measured'] == 1 and scheduler.statistics['actual_time'] > 0
+
+
+def test_motion_scheduler_snake():
+    scheduler = MotionScheduler(velocity=1, snake=True, two_opt=False)
+    grid = [(x, y) for y in range(3) for x in range(4)]
+    ordered = scheduler.schedule((3, 0), grid[::-1])
+    assert ordered == [(3, 0), (2, 0), (1, 0), (0, 0), (0, 1), (1, 1), (2, 1), (3, 1), (3, 2), (2, 2), (1, 2), (0, 2)]
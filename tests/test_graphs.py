@@ -0,0 +1,73 @@
+import threading
+from dataclasses import dataclass, field
+
+from tsuchinoko.adaptive import Data
+from tsuchinoko.graphs import Graph, ComputeMode
+from tsuchinoko.graphs.scheduler import GraphComputeScheduler, model_inputs
+from tsuchinoko.utils.mutex import FairRWLock
+
+
+@dataclass(eq=False)
+class SlowGraph(Graph):
+    compute_mode: ComputeMode = ComputeMode.Threaded
+    release: threading.Event = field(default_factory=threading.Event)
+    computed: list = field(default_factory=list)
+
+    def compute(self, data, engine):
+        self.release.wait(5)
+        self.computed.append(len(data))
+
+
+def test_threaded_graphs_skip_stale_data():
+    scheduler = GraphComputeScheduler()
+    graph = SlowGraph()
+    data = Data()
+
+    for i in range(5):
+        data.inject_new([((i, i), i, 1, {})])
+        scheduler.compute([graph], data, None)
+    graph.release.set()
+
+    assert scheduler.wait(timeout=5)
+    statistics = scheduler.statistics[graph.id]
+    assert statistics.computations == len(graph.computed) <= 2
+    assert statistics.computations + statistics.skipped == 5
+    assert graph.computed[-1] == 5
+
+
+def test_blocking_graphs_compute_inline():
+    scheduler = GraphComputeScheduler()
+    graph = SlowGraph(compute_mode=ComputeMode.Blocking)
+    graph.release.set()
+
+    scheduler.compute([graph], Data(), None)
+    assert graph.computed == [0]
+    assert scheduler.statistics[graph.id].computations == 1
+
+
+
+class VersionedEngine:
+    def __init__(self):
+        self.model_lock = FairRWLock()
+        self.model_version = 0
+
+    def update(self):
+        with self.model_lock.w_locked():
+            self.model_version += 1
+
+
+def test_model_inputs_lock_only_while_taking_inputs():
+    engine = VersionedEngine()
+    writer = threading.Thread(target=engine.update)
+
+    with model_inputs(engine) as current:
+        # the model's writers wait for the inputs to be taken...
+        writer.start()
+        writer.join(.1)
+        assert writer.is_alive()
+        assert current()
+
+    # ...but not for the results to be computed and published; results of a superseded model are dropped
+    writer.join(5)
+    assert not writer.is_alive()
+    assert not current()
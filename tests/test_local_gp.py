@@ -0,0 +1,92 @@
+import pickle
+
+import numpy as np
+
+from tsuchinoko.adaptive.acquisition_functions import explore_target_100
+from tsuchinoko.adaptive.gpCAM_in_process import gpcam_acquisition_functions
+from tsuchinoko.adaptive.local_gp import LocalGPOptimizer, LocalGPEngine, _LeavesView
+from tsuchinoko.adaptive.sparse_gp import matern_kernel
+
+bounds = np.array([[0., 1.], [0., 1.]])
+
+
+def test_local_gp_matches_exact_gp_within_one_leaf():
+    hyperparameters = np.array([2., .3, .5])
+    x = np.random.random((60, 2))
+    y = np.sin(5 * x[:, 0]) + x[:, 1]
+    v = np.full(60, .01)
+    x_pred = np.random.random((20, 2))
+
+    optimizer = LocalGPOptimizer(x, y, init_hyperparameters=hyperparameters, noise_variances=v,
+                                 parameter_bounds=bounds, max_leaf_points=100)
+    assert len(optimizer.leaves) == 1
+
+    K = matern_kernel(x, x, hyperparameters) + np.diag(v)
+    k = matern_kernel(x_pred, x, hyperparameters)
+    mean = np.mean(y) + k @ np.linalg.solve(K, y - np.mean(y))
+    variance = hyperparameters[0] - np.sum(k * np.linalg.solve(K, k.T).T, axis=1)
+    assert np.allclose(optimizer.posterior_mean(x_pred)['m(x)'], mean, atol=1e-5)
+    assert np.allclose(optimizer.posterior_covariance(x_pred, variance_only=True)['v(x)'], variance, atol=1e-5)
+
+
+def test_local_gp_updates_only_nearby_leaves():
+    def f(x):
+        return np.cos(3 * x[:, 0]) * np.sin(3 * x[:, 1])
+
+    x = np.random.random((3000, 2))
+    optimizer = LocalGPOptimizer(x, f(x), init_hyperparameters=np.array([1., .2, .2]),
+                                 noise_variances=np.full(3000, 1e-4), parameter_bounds=bounds, max_leaf_points=50,
+                                 workers=4)
+    assert len(optimizer.leaves) > 16
+
+    # blended predictions are accurate (and continuous) across leaf boundaries
+    x_pred = np.random.random((500, 2))
+    assert np.max(np.abs(optimizer.posterior_mean(x_pred)['m(x)'] - f(x_pred))) < .05
+
+    targets = optimizer.ask(bounds, n=3)['x']
+    assert targets.shape == (3, 2)
+    assert optimizer.reoptimized_count == len(optimizer.leaves)
+
+    # a new measurement refits and re-optimizes only the leaves around it
+    optimizer.tell(targets[:1], f(targets[:1]), [1e-4])
+    assert 0 < optimizer.refit_count <= 9
+    optimizer.ask(bounds, n=3)
+    assert 0 < optimizer.reoptimized_count < len(optimizer.leaves) / 2
+    optimizer.ask(bounds, n=3)
+    assert optimizer.reoptimized_count == 0
+
+
+def test_local_gp_leaves_view_evaluates_within_its_leaves():
+    x = np.random.random((2000, 2))
+    optimizer = LocalGPOptimizer(x, np.sin(5 * x[:, 0]) + x[:, 1], init_hyperparameters=np.array([1., .2, .2]),
+                                 noise_variances=np.full(2000, 1e-3), parameter_bounds=bounds, max_leaf_points=50,
+                                 workers=1)
+    leaf = optimizer.leaves[len(optimizer.leaves) // 2]
+    view = _LeavesView(optimizer, [leaf])
+    # only the leaf and its neighbours are sent to pool processes, without the measurements
+    assert leaf in view.models and len(view.models) < len(optimizer.models) / 4
+    assert len(pickle.dumps(view)) < len(pickle.dumps(optimizer)) / 4
+    assert len(view.points) == 2000
+
+    index = optimizer._leaf_index[leaf]
+    x_pred = np.random.uniform(optimizer._core_min[index], optimizer._core_max[index], (50, 2))
+    for name in ['variance', 'ucb', 'gradient', explore_target_100]:
+        assert np.allclose(view.evaluate_acquisition_function(x_pred, acquisition_function=name),
+                           optimizer.evaluate_acquisition_function(x_pred, acquisition_function=name))
+
+
+def test_local_gp_evaluates_offered_acquisition_functions():
+    x = np.random.random((150, 2))
+    y = np.sin(5 * x[:, 0]) + x[:, 1]
+    optimizer = LocalGPOptimizer(x, y, init_hyperparameters=np.array([1., .3, .3]), noise_variances=np.full(150, .01),
+                                 parameter_bounds=bounds, max_leaf_points=50, workers=2)
+    x_pred = np.random.random((20, 2))
+
+    names = LocalGPEngine.acquisition_function_names()
+    assert 'explore_target_100' in names and 'shannon_ig' not in names
+    for name in names:
+        acquisition_function = gpcam_acquisition_functions[name]
+        values = optimizer.evaluate_acquisition_function(x_pred, acquisition_function=acquisition_function)
+        assert values.shape == (20,) and np.all(np.isfinite(values)), name
+        # leaves are optimized in worker processes
+        assert optimizer.ask(bounds, acquisition_function=acquisition_function, n=2)['x'].shape == (2, 2), name
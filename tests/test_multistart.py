@@ -0,0 +1,60 @@
+import numpy as np
+
+from tsuchinoko.adaptive import Data
+from tsuchinoko.adaptive.gpCAM_in_process import distinct_optima
+from tsuchinoko.adaptive.sparse_gp import SparseGPEngine
+
+bounds = np.array([[0., 1.], [0., 1.]])
+separation = 1e-3 * np.ptp(bounds, axis=1)
+
+
+def test_distinct_optima():
+    a, b = np.array([.2, .2]), np.array([.8, .8])
+    # the second best optimum is the same as the best; the rest are distinct
+    optima = [(b, 1.), (a + 1e-5, 2.9), (a, 3.), (b + [0, .1], .5)]
+    assert [tuple(target) for target in distinct_optima(optima, 3, separation)] == [(.2, .2), (.8, .8), (.8, .9)]
+    assert len(distinct_optima(optima, 1, separation)) == 1
+
+
+def test_multistart_ask():
+    engine = SparseGPEngine(2, bounds, [1, .3, .3], [(.1, 10), (.01, 1), (.01, 1)])
+    engine.parameters['method'] = 'multistart'
+    engine.parameters['workers'] = 2
+    engine.parameters['n'] = 2
+    x = np.random.random((50, 2))
+    data = Data(2, x, np.sin(3 * x[:, 0]), np.full(50, 1e-3))
+    engine.update_measurements(data)
+
+    try:
+        # starts are seeded from the previous optima, the position, and the best points of the last acquisition
+        # function graph; the rest are random
+        grid, values = np.random.random((100, 2)), np.random.random(100)
+        engine._last_optima = [np.array([.1, .2])]
+        engine.acquisition_grid = grid, values
+        seeds = engine._multistart_seeds((.3, .4), bounds, 12)
+        assert seeds.shape == (12, 2)
+        assert np.array_equal(seeds[:2], [[.1, .2], [.3, .4]])
+        assert np.array_equal(seeds[2:5], grid[np.argsort(values)[::-1][:3]])
+        assert np.all((seeds >= 0) & (seeds <= 1))
+
+        targets = engine.request_targets((.3, .4))
+        assert targets.shape == (2, 2)
+        assert np.any(np.abs(targets[0] - targets[1]) > separation)
+        assert np.array_equal(engine._last_optima, targets)
+        assert engine.last_ask_time > 0
+
+        # the workers' copies of the model follow new measurements and hyperparameters
+        pool = engine._multistart_pool
+        new = np.random.random((10, 2))
+        data.inject_new([(position, np.sin(3 * position[0]), 1e-3, {}) for position in new])
+        engine.update_measurements(data)
+        with engine.model_lock.w_locked():
+            engine._set_hyperparameters([2, .2, .4])
+        engine.request_targets((.3, .4))
+        assert engine._multistart_pool is pool
+
+        for position, value in pool.maximize(np.random.random((4, 2)), bounds, 'variance'):
+            assert np.isclose(value, engine.optimizer.evaluate_acquisition_function(position)[0])
+    finally:
+        engine.reset()
+    assert engine._multistart_pool is None
@@ -0,0 +1,35 @@
+import numpy as np
+
+from tsuchinoko.adaptive.ndtree import LinearNDTree, morton_interleave, morton_deinterleave
+
+
+def test_morton_codes_round_trip_in_n_dimensions():
+    cells = np.random.randint(0, 2 ** 14, (1000, 4))
+    assert np.array_equal(morton_deinterleave(morton_interleave(cells, 14), 4, 14), cells)
+    assert np.array_equal(morton_interleave([[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 1, 1]], 1), [1, 2, 4, 7])
+
+
+def test_linear_octree_queries():
+    lower, upper = np.array([0., -1, 10]), np.array([1., 1, 20])
+    positions = lower + np.random.random((4000, 3)) * (upper - lower)
+    tree = LinearNDTree(lower, upper, max_points=8)
+    for chunk in np.array_split(positions, 5):
+        tree.insert(chunk)
+    assert tree.max_depth == 19
+    assert len(tree) == 4000
+    assert tree.leaf_point_counts().max() <= 8
+    assert np.isclose(np.sum(tree.leaf_volumes()), tree.volume)
+
+    leaves = tree.locate(positions)
+    assert np.all((positions >= tree.leaf_min[leaves]) & (positions < tree.leaf_max[leaves]))
+
+    box_lower, box_upper = np.array([.2, -.5, 12]), np.array([.6, .3, 15])
+    inside = np.all((positions >= box_lower) & (positions < box_upper), axis=1)
+    assert np.array_equal(np.sort(tree.query_box(box_lower, box_upper)), np.flatnonzero(inside))
+
+    # dividing a leaf gives 2^D children holding its points
+    leaf = leaves[0]
+    rows = tree.points_in(leaf)
+    children = tree.divide(leaf)
+    assert len(children) == 8
+    assert sorted(tree.points_in(children)) == sorted(rows)
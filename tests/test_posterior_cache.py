@@ -0,0 +1,106 @@
+import numpy as np
+
+from tsuchinoko.adaptive.acquisition_functions import mean_variance_acquisition
+from tsuchinoko.adaptive.posterior_cache import PosteriorEvaluationCache, cached_posterior, grid_evaluation
+
+
+class CountingGP:
+    def __init__(self):
+        self.y_data = np.zeros(3)
+        self.hyperparameters = np.ones(2)
+        self.evaluations = 0
+
+    def get_hyperparameters(self):
+        return self.hyperparameters
+
+    def posterior_mean(self, x):
+        self.evaluations += 1
+        return {'x': x, 'f(x)': np.sum(x, axis=1)}
+
+
+def test_cache_hits_until_model_changes():
+    gp = CountingGP()
+    cache = PosteriorEvaluationCache()
+    cache.bind(gp)
+    assert cached_posterior(gp) is cache
+
+    x = np.random.random((100, 2))
+    with grid_evaluation(gp):
+        assert np.array_equal(cache.posterior_mean(x)['f(x)'], cache.posterior_mean(x.copy())['f(x)'])
+        assert gp.evaluations == 1
+
+        gp.y_data = np.zeros(4)
+        cache.posterior_mean(x)
+        gp.hyperparameters = np.zeros(2)
+        cache.posterior_mean(x)
+        cache.invalidate()
+        cache.posterior_mean(x)
+    assert gp.evaluations == 4
+    assert cache.hits == 1
+
+
+def test_cache_evicts_least_recently_used():
+    gp = CountingGP()
+    grids = [np.random.random((100, 2)) for _ in range(3)]
+    cache = PosteriorEvaluationCache(max_bytes=2 * 2400)  # two results, each 100x2 positions and 100 values
+    cache.bind(gp)
+
+    with cache.storing():
+        cache.posterior_mean(grids[0])
+        cache.posterior_mean(grids[1])
+        cache.posterior_mean(grids[0])
+        cache.posterior_mean(grids[2])  # evicts grids[1]
+        assert cache.nbytes <= cache.max_bytes
+
+        cache.posterior_mean(grids[0])
+        assert gp.evaluations == 3
+        cache.posterior_mean(grids[1])
+        assert gp.evaluations == 4
+
+
+def test_only_grid_evaluations_are_stored():
+    gp = CountingGP()
+    grid = np.random.random((100, 2))
+    cache = PosteriorEvaluationCache(max_bytes=2400)  # one grid result
+    cache.bind(gp)
+
+    with grid_evaluation(gp):
+        cache.posterior_mean(grid)
+
+    # evaluations outside of a grid evaluation reuse the stored grid result, but don't displace it
+    for _ in range(3):
+        cache.posterior_mean(np.random.random((100, 2)))
+        cache.posterior_mean(np.random.random((20, 2)))
+    cache.posterior_mean(grid)
+    assert gp.evaluations == 7
+    assert cache.hits == 1
+    assert cache.bypassed == 3
+    assert len(cache._entries) == 1
+
+
+class MeanVarianceGP(CountingGP):
+    def posterior_mean(self, x):
+        self.evaluations += 1
+        return {'x': x, 'm(x)': np.sum(x, axis=1)}
+
+    def posterior_covariance(self, x, variance_only=False):
+        self.evaluations += 1
+        return {'x': x, 'v(x)': np.prod(x, axis=1)}
+
+
+def test_acquisition_functions_share_graph_evaluations():
+    gp = MeanVarianceGP()
+    grid = np.random.random((100, 2))
+    cache = PosteriorEvaluationCache()
+    cache.bind(gp)
+
+    # the posterior mean and variance graphs evaluate the grid...
+    with grid_evaluation(gp):
+        mean = cache.posterior_mean(grid)['m(x)']
+        variance = cache.posterior_covariance(grid, variance_only=True)['v(x)']
+    assert gp.evaluations == 2
+
+    # ...which the acquisition function graph reuses
+    with grid_evaluation(gp):
+        assert np.array_equal(mean_variance_acquisition(grid, gp, 'ucb'), mean + 3 * np.sqrt(variance))
+    assert gp.evaluations == 2
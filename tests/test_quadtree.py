@@ -0,0 +1,42 @@
+import numpy as np
+
+from tsuchinoko.adaptive.quadtree import LinearQuadTree, QuadTree, Point, Rect, morton_encode, morton_decode
+
+
+def test_morton_codes_round_trip():
+    ix, iy = np.random.randint(0, 2 ** 24, (2, 1000))
+    assert np.array_equal(morton_encode([1, 0, 1, 2], [0, 1, 1, 0]), [1, 2, 3, 4])
+    decoded_x, decoded_y = morton_decode(morton_encode(ix, iy))
+    assert np.array_equal(decoded_x, ix) and np.array_equal(decoded_y, iy)
+
+
+def test_linear_quadtree_queries():
+    domain = Rect(5, 5, 10, 10)
+    positions = np.random.random((3000, 2)) * 10
+    tree = LinearQuadTree(domain, max_points=4)
+    for chunk in np.array_split(positions, 7):
+        tree.insert(chunk)
+    assert len(tree) == 3000
+    assert tree.leaf_point_counts().max() <= 4
+    assert np.isclose(np.sum(tree.leaf_areas()), domain.area)
+
+    # each point lies within the leaf located for it
+    leaves = tree.locate(positions)
+    assert np.all((positions >= tree.leaf_min[leaves]) & (positions < tree.leaf_max[leaves]))
+    assert tree.locate([[11, 5]])[0] == -1
+
+    # range and radius queries agree with the pointer-based quadtree
+    reference = QuadTree(domain)
+    for row, position in enumerate(positions):
+        reference.insert(Point(*position, value=row))
+    boundary = Rect(3, 6, 2.5, 4)
+    assert sorted(tree.query(boundary)) == sorted(point.value for point in reference.query(boundary, []))
+    assert sorted(tree.query_radius((4, 4), 1.5)) == \
+           sorted(point.value for point in reference.query_radius((4, 4), 1.5, []))
+
+    # dividing a leaf keeps its points, split among the children
+    leaf = tree.locate(positions[:1])[0]
+    rows = tree.points_in(leaf)
+    children = tree.divide(leaf)
+    assert sorted(tree.points_in(children)) == sorted(rows)
+    assert np.isclose(np.sum(tree.leaf_areas(children)), domain.area / 4 ** (tree.leaf_depths[children[0]] - 1))
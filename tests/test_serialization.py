@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from tsuchinoko.adaptive import Data
+from tsuchinoko.core import CoreState
+from tsuchinoko.core.messages import FullDataResponse, StateResponse, ExceptionResponse, SetParameterRequest
+from tsuchinoko.core.serialization import encode_message, decode_message, is_pickled, SerializationError, \
+    encode_values, decode_values
+
+
+def test_data_round_trip():
+    data = Data()
+    data.inject_new([((i, i), i, 1, {'metric': i}) for i in range(10)])
+    with data.w_lock():
+        data.states['state'] = np.random.random((5, 5))
+
+    frames = encode_message(FullDataResponse(data.snapshot().as_dict(as_lists=False), {'state': 1}))
+    response = decode_message([bytes(frame) for frame in frames])
+
+    assert isinstance(response, FullDataResponse)
+    received = Data(**response.data)
+    assert np.array_equal(received.positions, data.positions)
+    assert np.array_equal(received.states['state'], data.states['state'])
+    assert response.state_versions == {'state': 1}
+
+
+def test_tagged_types_round_trip():
+    response = decode_message(encode_message(StateResponse(CoreState.Running, True)))
+    assert response.state is CoreState.Running
+
+    request = decode_message(encode_message(SetParameterRequest(('a', 'b'), {1: 2})))
+    assert request.child_path == ('a', 'b')
+    assert request.value == {1: 2}
+
+    response = decode_message(encode_message(ExceptionResponse(KeyError('missing'))))
+    assert isinstance(response.exception, KeyError)
+
+
+def test_pickle_opt_in():
+    frames = encode_message(StateResponse(CoreState.Paused, False), use_pickle=True)
+    assert is_pickled(frames)
+
+    with pytest.raises(SerializationError):
+        decode_message(frames)
+    assert decode_message(frames, allow_pickle=True).state is CoreState.Paused
+
+
+def test_array_shapes_round_trip():
+    arrays = {'empty': np.zeros((0, 2)), 'scalar': np.array(1.5), 'strided': np.arange(10)[::2]}
+    response = decode_message(encode_message(FullDataResponse(arrays, {}, 0)))
+    for key, array in arrays.items():
+        assert response.data[key].shape == array.shape
+        assert np.array_equal(response.data[key], array)
+
+
+def test_values_round_trip():
+    measurement = ((1., 2.), np.float64(3.), 1, {'image': np.arange(6).reshape(2, 3)})
+    position, value, variance, metrics = decode_values(encode_values(measurement))
+    assert position == (1., 2.) and value == 3. and variance == 1
+    assert np.array_equal(metrics['image'], measurement[3]['image'])
+
+    with pytest.raises(SerializationError):
+        decode_values([b'not json'])
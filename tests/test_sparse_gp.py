@@ -0,0 +1,78 @@
+import numpy as np
+
+from tsuchinoko.adaptive.gpCAM_in_process import gpcam_acquisition_functions
+from tsuchinoko.adaptive.sparse_gp import SparseGPOptimizer, SparseGPEngine, matern_kernel
+
+
+def exact_posterior(x, y, v, x_pred, hyperparameters):
+    K = matern_kernel(x, x, hyperparameters) + np.diag(v)
+    k = matern_kernel(x_pred, x, hyperparameters)
+    mean = np.mean(y) + k @ np.linalg.solve(K, y - np.mean(y))
+    variance = hyperparameters[0] - np.sum(k * np.linalg.solve(K, k.T).T, axis=1)
+    return mean, variance
+
+
+def test_sparse_gp_matches_exact_gp_with_all_inducing_points():
+    hyperparameters = np.array([2., .3, .5])
+    x = np.random.random((60, 2))
+    y = np.sin(5 * x[:, 0]) + x[:, 1]
+    v = np.full(60, .01)
+    x_pred = np.random.random((20, 2))
+
+    # told incrementally, with every measurement as an inducing point
+    optimizer = SparseGPOptimizer(init_hyperparameters=hyperparameters, inducing_distance=0)
+    for rows in np.array_split(np.arange(60), 4):
+        optimizer.tell(x[rows], y[rows], v[rows])
+    assert len(optimizer.inducing_points) == 60
+
+    mean, variance = exact_posterior(x, y, v, x_pred, hyperparameters)
+    assert np.allclose(optimizer.posterior_mean(x_pred)['m(x)'], mean, atol=1e-5)
+    assert np.allclose(optimizer.posterior_covariance(x_pred, variance_only=True)['v(x)'], variance, atol=1e-5)
+
+    # gradients agree with finite differences
+    epsilon = 1e-6
+    gradient = optimizer.posterior_mean_grad(x_pred)['dm/dx']
+    shifted = optimizer.posterior_mean(x_pred + [epsilon, 0])['m(x)']
+    assert np.allclose(gradient[:, 0], (shifted - optimizer.posterior_mean(x_pred)['m(x)']) / epsilon, atol=1e-3)
+
+
+def test_sparse_gp_bounds_inducing_points():
+    x = np.random.random((2000, 2))
+    y = np.cos(3 * x[:, 0]) * np.sin(3 * x[:, 1])
+    optimizer = SparseGPOptimizer(x, y, init_hyperparameters=np.array([1., .2, .2]), noise_variances=np.full(2000, 1e-3),
+                                  max_inducing_points=50)
+    assert len(optimizer.inducing_points) == 50
+    assert np.max(np.abs(optimizer.posterior_mean(x)['m(x)'] - y)) < .5
+
+    # training improves the evidence bound
+    v = np.full(2000, 1e-3)
+    before = optimizer.negative_log_evidence(optimizer.hyperparameters, x, y, v, optimizer.inducing_points)
+    optimizer.train(hyperparameter_bounds=[[.1, 10], [.05, 1], [.05, 1]], method='local', max_iter=20)
+    assert optimizer.negative_log_evidence(optimizer.hyperparameters, x, y, v, optimizer.inducing_points) <= before
+
+
+def test_sparse_gp_evaluates_offered_acquisition_functions():
+    x = np.random.random((150, 2))
+    y = np.sin(5 * x[:, 0]) + x[:, 1]
+    optimizer = SparseGPOptimizer(x, y, init_hyperparameters=np.array([1., .3, .3]), noise_variances=np.full(150, .01))
+    x_pred = np.random.random((20, 2))
+
+    names = SparseGPEngine.acquisition_function_names()
+    assert 'explore_target_100' in names and 'shannon_ig' not in names
+    for name in names:
+        values = optimizer.evaluate_acquisition_function(x_pred, acquisition_function=gpcam_acquisition_functions[name])
+        assert values.shape == (20,) and np.all(np.isfinite(values)), name
+
+
+def test_sparse_gp_asks_for_diverse_batches():
+    x = np.random.random((150, 2))
+    optimizer = SparseGPOptimizer(x, np.sin(5 * x[:, 0]) + x[:, 1], init_hyperparameters=np.array([1., .3, .3]),
+                                  noise_variances=np.full(150, .01))
+    bounds = np.array([[0., 1.], [0., 1.]])
+    batch = optimizer.ask(bounds, acquisition_function='ucb', n=4)
+    assert batch['x'].shape == (4, 2)
+    assert batch['f(x)'][0] == np.max(batch['f(x)'])
+
+    # the batch is spread out by local penalization, rather than crowding around the optimum
+    distance = np.linalg.norm(batch['x'][:, None] - batch['x'][None], axis=-1)
+    assert np.min(distance[np.triu_indices(4, 1)]) > .05
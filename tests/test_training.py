@@ -0,0 +1,82 @@
+import time
+
+import numpy as np
+
+from tsuchinoko.adaptive.gpCAM_in_process import BackgroundTrainer, TrainingStatus
+
+
+class MeanOptimizer:
+    # stands in for a GPOptimizer; "training" sets the hyperparameters to the mean of the data
+    def __init__(self, x, y, noise_variances=None, init_hyperparameters=None, delay=0):
+        self.y = y
+        self.delay = delay
+        self.hyperparameters = init_hyperparameters
+
+    def train(self, hyperparameter_bounds, init_hyperparameters, method):
+        time.sleep(self.delay)
+        self.hyperparameters = np.clip(np.full_like(init_hyperparameters, np.mean(self.y)), *hyperparameter_bounds.T)
+
+    def get_hyperparameters(self):
+        return self.hyperparameters
+
+
+def wait_for_result(trainer, timeout=30):
+    start = time.time()
+    while time.time() - start < timeout:
+        result = trainer.result()
+        if result is not None or not trainer.training:
+            return result
+        time.sleep(.01)
+
+
+def test_background_training():
+    trainer = BackgroundTrainer()
+    bounds = np.array([[0, 10], [0, 10]])
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.array([1., 2, 3]), np.ones(3), np.ones(2), bounds,
+                  {'delay': 60}, ['global'])
+    assert trainer.training
+
+    # newer data supersedes the (slow) training in progress
+    trainer.start(MeanOptimizer, np.zeros((4, 2)), np.array([1., 2, 3, 6]), np.ones(4), np.ones(2), bounds,
+                  {}, ['global', 'local'])
+    assert trainer.superseded == 1
+
+    assert np.array_equal(wait_for_result(trainer), [3, 3])
+    assert trainer.status == TrainingStatus.Completed
+    assert trainer.as_dict()['Measurements'] == 4
+
+
+def test_background_training_cancel_and_failure():
+    trainer = BackgroundTrainer()
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.ones(3), np.ones(3), np.ones(2), np.array([[0, 1]] * 2),
+                  {'delay': 60}, ['global'])
+    trainer.cancel()
+    assert trainer.status == TrainingStatus.Cancelled
+    assert trainer.result() is None
+
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.ones(3), np.ones(3), np.ones(2), np.array([[0, 1]] * 2),
+                  {'unknown_option': True}, ['global'])
+    assert wait_for_result(trainer) is None
+    assert trainer.status == TrainingStatus.Failed
+    assert 'unknown_option' in trainer.error
+
+
+def test_background_training_reuses_process():
+    trainer = BackgroundTrainer()
+    bounds = np.array([[0, 10], [0, 10]])
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.array([1., 2, 3]), np.ones(3), np.ones(2), bounds, {}, ['global'])
+    assert np.array_equal(wait_for_result(trainer), [2, 2])
+    process = trainer._process
+
+    trainer.start(MeanOptimizer, np.zeros((4, 2)), np.array([1., 2, 3, 6]), np.ones(4), np.ones(2), bounds, {},
+                  ['global'])
+    assert np.array_equal(wait_for_result(trainer), [3, 3])
+    assert trainer._process is process and process.is_alive()
+
+    # the process is respawned after a failure
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.ones(3), np.ones(3), np.ones(2), bounds,
+                  {'unknown_option': True}, ['global'])
+    assert wait_for_result(trainer) is None
+    trainer.start(MeanOptimizer, np.zeros((3, 2)), np.ones(3), np.ones(3), np.ones(2), bounds, {}, ['global'])
+    assert np.array_equal(wait_for_result(trainer), [1, 1])
+    assert trainer.trainings == 3
@@ -19,7 +19,8 @@ except (ImportError, ModuleNotFoundError) as ex:
 
 @click.command()
 @click.argument('core_address', required=False, default='localhost')
-def launch_client(core_address='localhost'):
+@click.option('--publish-port', default=5556, help="The port on which the core server publishes updates.")
+def launch_client(core_address='localhost', publish_port=5556):
     if os.name == 'nt':
         # https://stackoverflow.com/questions/67599432/setting-the-same-icon-as-application-icon-in-task-bar-for-pyqt5-application
         myappid = 'camera.tsuchinoko'  # arbitrary string
@@ -28,7 +29,7 @@ def launch_client(core_address='localhost'):
     from .widgets.mainwindow import MainWindow
     qapp = mkQApp('Tsuchinoko')
 
-    main_window = MainWindow(core_address)
+    main_window = MainWindow(core_address, publish_port=publish_port)
     main_window.show()
 
     sys.exit(qapp.exec_())
@@ -1,41 +1,184 @@
 from collections import defaultdict
 from contextlib import contextmanager
-from copy import copy
-from dataclasses import dataclass, field, asdict
+from copy import deepcopy
+from dataclasses import dataclass, field, replace
 from abc import ABC, abstractmethod
-from typing import Tuple, Iterable, Set, List, Union
+from types import MappingProxyType
+from typing import Tuple, Iterable, Set, List, Union, Mapping, Any
 
+import numpy as np
 from loguru import logger
 from pyqtgraph.parametertree import Parameter
 
 from tsuchinoko.graphs import Graph
-from tsuchinoko.utils.mutex import RWLock
+from tsuchinoko.utils.buffers import ColumnBuffer
+from tsuchinoko.utils.mutex import FairRWLock, LockStatistics, lock_wrapper
+
+
+@dataclass(frozen=True)
+class DataSnapshot:
+    """
+    An immutable, versioned view of a `Data` object. Snapshots are published by `Data` whenever a write completes, and
+    can be read from any thread without locking or copying. Columns are read-only views of `Data`'s append-only
+    buffers; `states` and `metrics` are shallow copies taken at publish time.
+    """
+
+    version: int
+    states_version: int
+    state_versions: Mapping[str, int]
+    dimensionality: int
+    positions: np.ndarray
+    scores: np.ndarray
+    variances: np.ndarray
+    metrics: Mapping[str, np.ndarray]
+    states: Mapping[str, Any]
+    graphics_items: Mapping[str, Any]
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __bool__(self):
+        return bool(len(self))
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            return item in self.states or item in self.metrics
+
+    def __getitem__(self, item: Union[slice, str]):
+        if isinstance(item, str):
+            if item in self.metrics and item in self.states:
+                raise ValueError(f'{item} exists in both states and metrics.')
+            elif item in self.metrics:
+                return self.metrics[item]
+            elif item in self.states:
+                return self.states[item]
+            elif item.lower() in ['variances', 'scores', 'positions']:
+                return getattr(self, item.lower())
+        elif isinstance(item, slice):
+            return replace(self,
+                           positions=self.positions[item],
+                           scores=self.scores[item],
+                           variances=self.variances[item],
+                           metrics=MappingProxyType({key: value[item] for key, value in self.metrics.items()}))
+        raise ValueError(f'Unknown item: {item}')
+
+    def delta(self, start: int, state_versions: Mapping[str, int] = None) -> 'DataSnapshot':
+        """
+        Returns a snapshot containing only the rows from `start` onward, and only the state entries whose versions
+        differ from those in `state_versions` (i.e. the versions a client already holds).
+        """
+        state_versions = state_versions or {}
+        changed = {key: value for key, value in self.states.items()
+                   if state_versions.get(key) != self.state_versions[key]}
+        return replace(self[start:], states=MappingProxyType(changed))
+
+    def as_dict(self, as_lists: bool = True):
+        """
+        Returns a plain dict suitable for `Data(**d)`. Columns are converted to lists unless `as_lists` is False, in
+        which case they are left as (read-only) arrays for efficient transport.
+        """
+        convert = (lambda column: column.tolist()) if as_lists else (lambda column: column)
+        return {'dimensionality': self.dimensionality,
+                'positions': convert(self.positions),
+                'scores': convert(self.scores),
+                'variances': convert(self.variances),
+                'metrics': {key: convert(values) for key, values in self.metrics.items()},
+                'states': deepcopy(dict(self.states)),
+                'graphics_items': deepcopy(dict(self.graphics_items))}
 
 
 @dataclass
 class Data:
     """
-    A data class to track the data state of an experiment. This type can be appended to as new data is received. A
-    locking mechanism is provided to support read/write locking for parallelism.
+    A data class to track the data state of an experiment. This type can be appended to as new data is received.
+
+    Positions, scores, variances and metrics are stored column-wise in `ColumnBuffer`s, which grow in place and hand
+    out read-only NumPy views (i.e. `np.asarray(data.positions)` does not copy).
+
+    Writers serialize through `w_lock`; on release, a new `DataSnapshot` is published. Readers should prefer
+    `snapshot()`, which returns a consistent view without locking. `r_lock` is retained for compatibility.
     """
 
     dimensionality: int = None
-    positions: list = field(default_factory=list)
-    scores: list = field(default_factory=list)
-    variances: list = field(default_factory=list)
-    metrics: dict = field(default_factory=lambda: defaultdict(list))
+    positions: ColumnBuffer = field(default_factory=lambda: ColumnBuffer(dtype=float))
+    scores: ColumnBuffer = field(default_factory=ColumnBuffer)
+    variances: ColumnBuffer = field(default_factory=ColumnBuffer)
+    metrics: dict = field(default_factory=lambda: defaultdict(ColumnBuffer))
     states: dict = field(default_factory=dict)
     graphics_items: dict = field(default_factory=dict)
 
     @property
     def measurements(self):
-        return list(zip(self.positions, self.scores, self.variances, [{key: values[i] for key, values in self.metrics.items()} for i in range(len(self))]))
+        snapshot = self.snapshot()
+        return list(zip(snapshot.positions, snapshot.scores, snapshot.variances, [{key: values[i] for key, values in snapshot.metrics.items()} for i in range(len(snapshot))]))
 
     def __post_init__(self):
-        self._lock = RWLock()
-        self.w_lock = self._lock.w_locked
+        self.positions = ColumnBuffer(self.positions, dtype=float)
+        self.scores = ColumnBuffer(self.scores)
+        self.variances = ColumnBuffer(self.variances)
+        self.metrics = defaultdict(ColumnBuffer, {key: ColumnBuffer(values) for key, values in self.metrics.items()})
+        self._lock = FairRWLock(name='Data')
         self.r_lock = self._lock.r_locked
         self._completed_iterations = 0
+        self._snapshot = None
+        self._publish()
+
+    def _publish(self):
+        previous = self._snapshot
+        version = previous.version + 1 if previous else 0
+        states = dict(self.states)
+
+        # each state entry keeps the version at which its value was last replaced
+        state_versions = {key: previous.state_versions[key]
+                          if previous and key in previous.states and value is previous.states[key] else version
+                          for key, value in states.items()}
+
+        states_version = version
+        if previous and states.keys() == previous.states.keys() and version not in state_versions.values():
+            states_version = previous.states_version
+
+        # a single reference assignment; readers see either the previous snapshot or this one
+        self._snapshot = DataSnapshot(version=version,
+                                      states_version=states_version,
+                                      state_versions=MappingProxyType(state_versions),
+                                      dimensionality=self.dimensionality,
+                                      positions=self.positions.view(),
+                                      scores=self.scores.view(),
+                                      variances=self.variances.view(),
+                                      metrics=MappingProxyType({key: values.view() for key, values in self.metrics.items()}),
+                                      states=MappingProxyType(states),
+                                      graphics_items=MappingProxyType(dict(self.graphics_items)))
+
+    def snapshot(self) -> DataSnapshot:
+        """
+        Returns the most recently published snapshot. This does not lock, and does not copy.
+        """
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def lock_statistics(self) -> LockStatistics:
+        """
+        Returns the wait/hold/contention statistics accumulated by this object's lock.
+        """
+        return self._lock.statistics()
+
+    @lock_wrapper
+    @contextmanager
+    def w_lock(self, timeout: float = None):
+        """
+        Acquire exclusive write access. When released, a new snapshot is published to readers. Values assigned into
+        `states` should be replaced rather than mutated in place, so that previously published snapshots are unaffected.
+
+        Raises TimeoutError if a `timeout` (in seconds) is given and expires.
+        """
+        with self._lock.w_locked(timeout):
+            try:
+                yield
+            finally:
+                self._publish()
 
     def inject_new(self, data):
         with self.w_lock():
@@ -44,14 +187,10 @@ class Data:
                 self.scores.append(datum[1])
                 self.variances.append(datum[2])
                 for metric in datum[3]:  # TODO: handle logical cases
-                    if metric not in self.metrics:
-                        self.metrics[metric] = []
                     self.metrics[metric].append(datum[3][metric])
 
-    def as_dict(self):
-        self_copy = copy(self)
-        self_copy.metrics = dict(self_copy.metrics)
-        return asdict(self_copy)
+    def as_dict(self, as_lists: bool = True):
+        return self.snapshot().as_dict(as_lists)
 
     def __getitem__(self, item: Union[slice, str]):
         if isinstance(item, str):
@@ -64,15 +203,14 @@ class Data:
             elif item.lower() in ['variances', 'scores', 'positions']:
                 return getattr(self, item.lower())
         elif isinstance(item, slice):
-            if item.stop is None or item.stop > len(self):
-                item = slice(item.start, len(self), item.step)
-            return Data(self.dimensionality,
-                        self.positions[item],
-                        self.scores[item],
-                        self.variances[item],
-                        {key: value[item] for key, value in self.metrics.items()},
-                        self.states,
-                        self.graphics_items)
+            snapshot = self.snapshot()[item]
+            return Data(snapshot.dimensionality,
+                        snapshot.positions,
+                        snapshot.scores,
+                        snapshot.variances,
+                        dict(snapshot.metrics),
+                        dict(snapshot.states),
+                        dict(snapshot.graphics_items))
         raise ValueError(f'Unknown item: {item}')
 
     def __contains__(self, item):
@@ -81,30 +219,41 @@ class Data:
 
     def __setitem__(self, key, value):
         if isinstance(key, str):
-            self.metrics[key] = value
+            with self.w_lock():
+                self.metrics[key] = ColumnBuffer(value)
         else:
             raise ValueError()
 
     def __len__(self):
         return len(self.positions)
 
-    def extend(self, data: 'Data'):
+    def extend(self, data: 'Data', state_keys: Iterable[str] = None):
+        """
+        Appends the rows of `data`. By default, states are replaced by those of `data`. If `state_keys` is given,
+        `data.states` is treated as a delta: its entries are merged over the current states, and any state not
+        named in `state_keys` is dropped.
+        """
         with self.w_lock():
-            self.positions += data.positions
-            self.scores += data.scores
-            self.variances += data.variances
+            self.positions.extend(data.positions)
+            self.scores.extend(data.scores)
+            self.variances.extend(data.variances)
             for key in set(self.metrics) | set(data.metrics):
-                self.metrics[key] += data.metrics.get(key, [])
+                self.metrics[key].extend(data.metrics.get(key, []))
             self.dimensionality = data.dimensionality
             self.graphics_items.update(data.graphics_items)
-            self.states = data.states
+            if state_keys is None:
+                self.states = data.states
+            else:
+                self.states = {key: data.states[key] if key in data.states else self.states[key]
+                               for key in state_keys if key in data.states or key in self.states}
 
     def __enter__(self):
-        self.w_lock().__enter__()
+        self._lock.w_acquire()
         logger.exception(RuntimeError("deprecation in progress"))
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.w_lock().__exit__(exc_type, exc_val, exc_tb)
+        self._publish()
+        self._lock.w_release()
 
     def __bool__(self):
         return bool(len(self))
@@ -124,6 +273,9 @@ class Engine(ABC):
     parameters: Parameter = None
     graphs: List['Graph'] = None
     last_position: tuple = None
+    # engines that guard their own state (i.e. with a read-write lock on their model) set this, so that a pipelined
+    # Core may update metrics and train concurrently with `request_targets`
+    thread_safe: bool = False
 
     @abstractmethod
     def update_measurements(self, data: Data):
@@ -0,0 +1,61 @@
+import sys
+import traceback
+
+import numpy as np
+from scipy.optimize import minimize
+
+
+def serve(connection):
+    """
+    Holds a copy of the model in a pool process, kept current by the engine's updates, and maximizes the acquisition
+    function on request. Messages are `(command, *args)` tuples; only 'maximize' is answered, with an
+    `(outcome, value)` tuple.
+    """
+    optimizer = None
+    error = None  # a failed update leaves the copy unusable until it is rebuilt
+    while True:
+        try:
+            command, *args = connection.recv()
+        except EOFError:
+            return
+
+        try:
+            if command == 'stop':
+                return
+            elif command == 'init':
+                optimizer_class, x, y, v, hyperparameters, gp_opts = args
+                opts = gp_opts.copy()
+                if sys.platform == 'darwin':
+                    opts['compute_device'] = 'numpy'
+                optimizer = optimizer_class(x, y, noise_variances=v, init_hyperparameters=hyperparameters, **opts)
+                error = None
+            elif command == 'tell':
+                x, y, v, append = args
+                optimizer.tell(x, y, v, append=append, gp_rank_n_update=append)
+            elif command == 'hyperparameters':
+                optimizer.set_hyperparameters(*args)
+            elif command == 'maximize':
+                connection.send(('exception', error) if error else ('optima', maximize(optimizer, *args)))
+        except Exception:
+            if command == 'maximize':
+                connection.send(('exception', traceback.format_exc()))
+            else:
+                error = traceback.format_exc()
+
+
+def maximize(optimizer, starts, bounds, acquisition_function, origin=None, x_out=None, tol=1e-6):
+    """
+    Locally maximizes the acquisition function from each of `starts`. Returns a list of (position, acquisition function
+    value) pairs.
+    """
+
+    def objective(x):
+        value = optimizer.evaluate_acquisition_function(np.atleast_2d(x), x_out=x_out,
+                                                        acquisition_function=acquisition_function, origin=origin)
+        return -np.ravel(value)[0]
+
+    optima = []
+    for start in starts:
+        result = minimize(objective, start, method='L-BFGS-B', bounds=bounds, options={'ftol': tol})
+        optima.append((result.x, -result.fun))
+    return optima
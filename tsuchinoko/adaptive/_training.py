@@ -0,0 +1,37 @@
+import sys
+import traceback
+
+
+def serve(connection):
+    """
+    Trains throwaway optimizers in a training process, on request. Messages are `('train', *args)` tuples (see
+    `trained_hyperparameters`), each answered with an `(outcome, value)` tuple, or `('stop',)`.
+    """
+    while True:
+        try:
+            command, *args = connection.recv()
+        except EOFError:
+            return
+
+        if command == 'stop':
+            return
+        try:
+            connection.send(('hyperparameters', trained_hyperparameters(*args)))
+        except Exception:
+            connection.send(('exception', traceback.format_exc()))
+
+
+def trained_hyperparameters(optimizer_class, x, y, v, hyperparameters, hyperparameter_bounds, gp_opts, methods):
+    """
+    Trains a throwaway optimizer on the data, with each of `methods` in turn, and returns its hyperparameters.
+    """
+    opts = gp_opts.copy()
+    if sys.platform == 'darwin':
+        opts['compute_device'] = 'numpy'
+
+    optimizer = optimizer_class(x, y, noise_variances=v, init_hyperparameters=hyperparameters, **opts)
+    for method in methods:
+        optimizer.train(hyperparameter_bounds=hyperparameter_bounds,
+                        init_hyperparameters=optimizer.get_hyperparameters(),
+                        method=method)
+    return optimizer.get_hyperparameters()
@@ -2,6 +2,9 @@ from functools import partial
 
 import numpy as np
 
+from .batch import mean_variance_acquisition_functions
+from .posterior_cache import cached_posterior
+
 
 def transform(cc, k=100, tau=0.5):
     result = 0.5 + 0.5*np.tanh(k*(cc-tau))
@@ -9,8 +12,9 @@ def transform(cc, k=100, tau=0.5):
 
 
 def explore_target(x, gp, N, k=100, tau=0.5):
-    mean = gp.posterior_mean(x)["f(x)"]
-    cov = gp.posterior_covariance(x)["v(x)"]
+    posterior = cached_posterior(gp)
+    mean = posterior.posterior_mean(x)["m(x)"]
+    cov = posterior.posterior_covariance(x, variance_only=True)["v(x)"]
     i = len(gp.points)
     if i <= N:
         return cov
@@ -22,7 +26,17 @@ explore_target_100 = partial(explore_target, N=100, k=100, tau=.5)
 
 
 def radical_gradient(x, gp):
-    mean_grad = gp.posterior_mean_grad(x)["df/dx"]
-    std = np.sqrt(gp.posterior_covariance(x, variance_only=True)["v(x)"])
+    posterior = cached_posterior(gp)
+    mean_grad = posterior.posterior_mean_grad(x)["dm/dx"]
+    std = np.sqrt(posterior.posterior_covariance(x, variance_only=True)["v(x)"])
     res = np.sqrt(np.linalg.norm(mean_grad, axis=1)) * std
     return res
+
+
+def mean_variance_acquisition(x, gp, name):
+    # evaluates one of the named mean/variance acquisition functions through the posterior cache, sharing evaluations
+    # with the graphs
+    posterior = cached_posterior(gp)
+    mean = posterior.posterior_mean(x)["m(x)"]
+    variance = posterior.posterior_covariance(x, variance_only=True)["v(x)"]
+    return mean_variance_acquisition_functions[name](mean, variance)
@@ -0,0 +1,112 @@
+from typing import Callable, List
+
+import numpy as np
+from scipy.special import erfc
+
+# acquisition functions (by name) which can be re-evaluated from a fantasized posterior mean and variance
+mean_variance_acquisition_functions = {'variance': lambda mean, variance: np.sqrt(variance),
+                                       'ucb': lambda mean, variance: mean + 3.0 * np.sqrt(variance),
+                                       'maximum': lambda mean, variance: mean,
+                                       'minimum': lambda mean, variance: -mean}
+
+
+def kriging_believer(mean: np.ndarray, covariance: np.ndarray,
+                     acquisition_function: Callable[[np.ndarray, np.ndarray], np.ndarray],
+                     q: int, noise: float = 0) -> List[int]:
+    """
+    Greedily selects `q` of a set of candidates. Each selected candidate is believed to measure its posterior mean; the
+    posterior mean is then unchanged, and the posterior covariance of the candidates is updated with a rank-1 downdate.
+    Selecting `q` points therefore needs only one evaluation of the posterior over the candidates.
+
+    Parameters
+    ----------
+    mean
+        The posterior mean at each candidate.
+    covariance
+        The posterior covariance between the candidates.
+    acquisition_function
+        Computes the acquisition function at each candidate from the posterior mean and variance.
+    q
+        The number of candidates to select.
+    noise
+        The noise variance of the fantasized measurements.
+
+    Returns
+    -------
+    indices: list
+        The indices of the selected candidates, in order of selection.
+    """
+    covariance = np.array(covariance, dtype=float)
+    selected = []
+    for _ in range(min(q, len(mean))):
+        values = np.array(acquisition_function(mean, np.clip(np.diag(covariance), 0, None)), dtype=float)
+        values[selected] = -np.inf
+        j = int(np.argmax(values))
+        selected.append(j)
+
+        column = covariance[:, j].copy()
+        covariance -= np.outer(column, column) / max(column[j] + noise, np.finfo(float).tiny)
+    return selected
+
+
+def local_penalization(candidates: np.ndarray, values: np.ndarray, mean: np.ndarray, variance: np.ndarray, q: int,
+                       lipschitz: float = None) -> List[int]:
+    """
+    Greedily selects `q` of a set of candidates by local penalization (González et al., 2016). After each selection,
+    the acquisition function is multiplied by the probability that each candidate lies outside a ball around the
+    selected point which (given a Lipschitz constant for the posterior mean) excludes the maximum.
+
+    Parameters
+    ----------
+    candidates
+        The candidate positions, shape (M, D).
+    values
+        The acquisition function at each candidate.
+    mean
+        The posterior mean at each candidate.
+    variance
+        The posterior variance at each candidate.
+    q
+        The number of candidates to select.
+    lipschitz
+        A Lipschitz constant for the posterior mean. By default this is estimated from the candidates.
+
+    Returns
+    -------
+    indices: list
+        The indices of the selected candidates, in order of selection.
+    """
+    candidates = np.asarray(candidates, dtype=float)
+    mean = np.asarray(mean, dtype=float)
+    std = np.sqrt(np.clip(variance, np.finfo(float).tiny, None))
+    if lipschitz is None:
+        lipschitz = estimate_lipschitz(candidates, mean)
+    best = np.max(mean)
+
+    # penalizers require a positive acquisition function
+    penalized = np.asarray(values, dtype=float) - np.min(values) + np.finfo(float).eps
+    available = np.ones(len(candidates), dtype=bool)
+    selected = []
+    for _ in range(min(q, len(candidates))):
+        j = int(np.argmax(np.where(available, penalized, -np.inf)))
+        available[j] = False
+        selected.append(j)
+
+        distance = np.linalg.norm(candidates - candidates[j], axis=1)
+        z = (lipschitz * distance - best + mean[j]) / (np.sqrt(2) * std[j])
+        penalized *= 0.5 * erfc(-z)
+    return selected
+
+
+def estimate_lipschitz(candidates: np.ndarray, mean: np.ndarray, max_candidates: int = 512) -> float:
+    """
+    Estimates the Lipschitz constant of the posterior mean as the largest slope between any two candidates (or a random
+    subset of `max_candidates` of them).
+    """
+    if len(candidates) > max_candidates:
+        subset = np.random.choice(len(candidates), max_candidates, replace=False)
+        candidates, mean = candidates[subset], mean[subset]
+    distance = np.linalg.norm(candidates[:, None, :] - candidates[None, :, :], axis=-1)
+    np.fill_diagonal(distance, np.inf)
+    slopes = np.abs(mean[:, None] - mean[None, :]) / distance
+    return max(float(np.max(slopes, initial=0)), 1e-7)
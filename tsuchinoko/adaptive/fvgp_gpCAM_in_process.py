@@ -12,6 +12,7 @@ class FvgpGPCAMInProcessEngine(GPCAMInProcessEngine):
     """
     A multi-task adaptive engine powered by gpCAM: https://gpcam.readthedocs.io/en/latest/
     """
+    cached_acquisition_functions = tuple()  # the optimizer evaluates acquisition functions for each task (x_out)
 
     def __init__(self, dimensionality, output_number, parameter_bounds, hyperparameters, hyperparameter_bounds, **kwargs):
         self.kwargs = kwargs
@@ -42,9 +43,13 @@ class FvgpGPCAMInProcessEngine(GPCAMInProcessEngine):
                                        **opts)
 
     def _set_hyperparameter(self, parameter, value):
-        self.optimizer.gp_initialized = False  # Force re-initialization
-        self.optimizer.init_fvgp(np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
-                                           for i in range(self.num_hyperparameters)]))
+        with self.model_lock.w_locked():
+            self.optimizer.gp_initialized = False  # Force re-initialization
+            self.optimizer.init_fvgp(np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
+                                               for i in range(self.num_hyperparameters)]))
+            self._model_changed()
+            if self._multistart_pool:
+                self._multistart_pool.set_hyperparameters(self.optimizer.get_hyperparameters())
 
     def request_targets(self, position, **kwargs):
         kwargs.update({'x_out': np.arange(self.output_number)})
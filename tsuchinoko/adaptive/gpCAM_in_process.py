@@ -1,18 +1,28 @@
+import multiprocessing
+import os
 import sys
+import threading
+import time
 import uuid
-from functools import cached_property
-from typing import Callable
+from enum import Enum, auto
+from functools import cached_property, partial
+from typing import Callable, List, Optional, Sequence
 
 import numpy as np
 from pyqtgraph.parametertree.parameterTypes import SimpleParameter, GroupParameter, ListParameter
 from loguru import logger
 
 from gpcam.gp_optimizer import GPOptimizer
-from . import Engine, Data
-from .acquisition_functions import explore_target_100, radical_gradient
+from . import Engine, Data, DataSnapshot, _training, _acquisition
+from .acquisition_functions import explore_target_100, radical_gradient, mean_variance_acquisition
+from .batch import kriging_believer, local_penalization, mean_variance_acquisition_functions
+from .posterior_cache import PosteriorEvaluationCache, DEFAULT_MAX_BYTES, cached_posterior
 from ..graphs.common import Variance, GPCamPosteriorCovariance, Score, GPCamAcquisitionFunction, GPCamPosteriorMean, \
-    Table, HighDimensionalityGPCamPosteriorMean, GPCamHyperparameterPlot
+    Table, HighDimensionalityGPCamPosteriorMean, GPCamHyperparameterPlot, GPCamTrainingStatus
+from ..graphs.scheduler import GraphComputeScheduler
 from ..parameters import TrainingParameter
+from ..utils.logging import log_time
+from ..utils.mutex import FairRWLock
 
 gpcam_acquisition_functions = {s: s for s in ['variance', 'shannon_ig', 'ucb', 'maximum', 'minimum', 'covariance', 'gradient', 'explore_target_100']}
 gpcam_acquisition_functions['explore_target_100'] = explore_target_100
@@ -26,6 +36,196 @@ def prepend_update_acquisition_functions(acquisition_functions:dict):
     gpcam_acquisition_functions.update(cpy)
 
 
+class TrainingStatus(Enum):
+    Idle = auto()
+    Training = auto()
+    Completed = auto()
+    Cancelled = auto()
+    Failed = auto()
+
+
+class BackgroundTrainer:
+    """
+    Trains hyperparameters in a child process, so that training holds neither the GIL nor the experiment. Only one
+    training runs at a time; starting another supersedes (terminates) the one in progress. Otherwise, the process is
+    reused for each training, and only respawned after it is terminated or has failed.
+    """
+
+    def __init__(self):
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._connection = None
+        self.status = TrainingStatus.Idle
+        self.methods = tuple()
+        self.size = 0
+        self.started_at = None
+        self.duration = None
+        self.trainings = 0
+        self.superseded = 0
+        self.error = None
+
+    @property
+    def training(self) -> bool:
+        return self.status == TrainingStatus.Training
+
+    def start(self, optimizer_class: type, x, y, v, hyperparameters, hyperparameter_bounds, gp_opts: dict,
+              methods: Sequence[str]):
+        """
+        Starts training a new `optimizer_class` on the data, with each of `methods` in turn.
+        """
+        if self.training:
+            self.superseded += 1
+            self._stop()
+
+        if self._process is None:
+            self._connection, child_connection = self._context.Pipe()
+            self._process = self._context.Process(target=_training.serve, args=(child_connection,),
+                                                  name='tsuchinoko-training', daemon=True)
+            self._process.start()
+            child_connection.close()
+        self._connection.send(('train', optimizer_class, x, y, v, hyperparameters, hyperparameter_bounds, gp_opts,
+                               tuple(methods)))
+
+        self.status = TrainingStatus.Training
+        self.methods = tuple(methods)
+        self.size = len(y)
+        self.started_at = time.time()
+        self.duration = None
+        self.error = None
+        logger.info(f'Training {", ".join(self.methods)} in the background on {self.size} measurements...')
+
+    def cancel(self):
+        if self.training:
+            self._stop()
+            self.status = TrainingStatus.Cancelled
+
+    def result(self) -> Optional[np.ndarray]:
+        """
+        Returns the trained hyperparameters if training has completed since this was last called; otherwise None.
+        """
+        if not self.training or not (self._connection.poll() or not self._process.is_alive()):
+            return None
+
+        try:
+            outcome, value = self._connection.recv()
+        except EOFError:
+            outcome, value = 'exception', f'The training process exited unexpectedly ({self._process.exitcode}).'
+        self.duration = time.time() - self.started_at
+
+        if outcome == 'hyperparameters':
+            self.status = TrainingStatus.Completed
+            self.trainings += 1
+            return np.asarray(value)
+        else:
+            self._stop()
+            self.status = TrainingStatus.Failed
+            self.error = value
+            logger.error(f'Background training failed:\n{value}')
+
+    def as_dict(self) -> dict:
+        elapsed = self.duration if self.duration is not None or not self.started_at else time.time() - self.started_at
+        return {'Status': self.status.name,
+                'Methods': ', '.join(self.methods),
+                'Measurements': self.size,
+                'Elapsed (s)': round(elapsed, 1) if elapsed is not None else None,
+                'Completed': self.trainings,
+                'Superseded': self.superseded,
+                'Error': self.error.strip().splitlines()[-1] if self.error else ''}
+
+    def _stop(self):
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        self._process.close()
+        self._connection.close()
+        self._process = self._connection = None
+
+
+class MultistartPool:
+    """
+    A pool of long-lived processes, each holding a copy of the model, which maximize the acquisition function from
+    chunks of starting points. The copies are built once; afterwards, each tell (only the new rows, when incremental)
+    and hyperparameter change is forwarded, so that asking costs only the optimization itself.
+    """
+
+    def __init__(self, workers: int, optimizer_class: type, x, y, v, hyperparameters, gp_opts: dict):
+        context = multiprocessing.get_context('spawn')
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        for i in range(workers):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_acquisition.serve, args=(child_connection,),
+                                      name=f'tsuchinoko-multistart-{i}', daemon=True)
+            process.start()
+            child_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        self._broadcast('init', optimizer_class, x, y, v, hyperparameters, gp_opts)
+
+    @property
+    def workers(self) -> int:
+        return len(self._processes)
+
+    def tell(self, x, y, v, append: bool):
+        self._broadcast('tell', x, y, v, append)
+
+    def set_hyperparameters(self, hyperparameters):
+        self._broadcast('hyperparameters', hyperparameters)
+
+    def maximize(self, starts, bounds, acquisition_function, origin=None, x_out=None, tol=1e-6) -> list:
+        """
+        Locally maximizes the acquisition function from each of `starts`, split across the workers. Returns a list of
+        (position, acquisition function value) pairs.
+        """
+        with self._lock:
+            for connection, chunk in zip(self._connections, np.array_split(starts, self.workers)):
+                connection.send(('maximize', chunk, bounds, acquisition_function, origin, x_out, tol))
+            try:
+                results = [connection.recv() for connection in self._connections]
+            except EOFError:
+                raise RuntimeError('A multistart worker exited unexpectedly.')
+
+        for outcome, value in results:
+            if outcome == 'exception':
+                raise RuntimeError(f'Multistart optimization failed:\n{value}')
+        return [optimum for _, optima in results for optimum in optima]
+
+    def close(self):
+        with self._lock:
+            for connection in self._connections:
+                try:
+                    connection.send(('stop',))
+                except OSError:  # the worker already exited
+                    pass
+                connection.close()
+            for process in self._processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+            self._connections, self._processes = [], []
+
+    def _broadcast(self, *message):
+        with self._lock:
+            for connection in self._connections:
+                connection.send(message)
+
+
+def distinct_optima(optima: Sequence, n: int, separation: np.ndarray) -> List[np.ndarray]:
+    """
+    Returns the positions of the `n` best (position, value) `optima` which differ from each better one by more than
+    `separation` along some axis; starts converging to the same optimum land within a small fraction of the range.
+    """
+    targets = []
+    for x, value in sorted(optima, key=lambda optimum: -optimum[1]):
+        if all(np.any(np.abs(x - target) > separation) for target in targets):
+            targets.append(x)
+        if len(targets) == n:
+            break
+    return targets
+
+
 class GPCAMInProcessEngine(Engine):
     """
     An adaptive engine powered by gpCAM: https://gpcam.readthedocs.io/en/latest/
@@ -33,10 +233,29 @@ class GPCAMInProcessEngine(Engine):
     default_retrain_globally_at = (20, 50, 100, 400, 1000)
     default_retrain_locally_at = (20, 40, 60, 80, 100, 200, 400, 1000)
     default_retrain_mcmc_at = tuple()
+    thread_safe = True  # the model is only accessed under model_lock
+    unsupported_acquisition_functions = tuple()  # names not offered by this engine's optimizer
+    # names evaluated from the posterior mean and variance through the posterior cache, rather than by the optimizer
+    cached_acquisition_functions = tuple(mean_variance_acquisition_functions)
 
     def __init__(self, dimensionality, parameter_bounds, hyperparameters, hyperparameter_bounds,
                  acquisition_functions:dict[str, Callable]=None,
-                 gp_opts: dict = None, ask_opts: dict = None):
+                 gp_opts: dict = None, ask_opts: dict = None, graph_workers: int = 2,
+                 posterior_cache_size: int = DEFAULT_MAX_BYTES, async_training: bool = False):
+        # the model is only mutated under the write lock; graphs (possibly computed on other threads) read under the
+        # read lock, and skip publishing results of a superseded model_version
+        self.model_lock = FairRWLock(name='gpCAM model')
+        self.model_version = 0
+        self.graph_scheduler = GraphComputeScheduler(graph_workers)
+        # posterior evaluations shared by graphs and acquisition functions until the model next changes
+        self.posterior_cache = PosteriorEvaluationCache(posterior_cache_size)
+        # when training asynchronously, the current hyperparameters stay in service until training completes
+        self.background_trainer = BackgroundTrainer() if async_training else None
+        # multistart acquisition optimization state
+        self.acquisition_grid = None  # (positions, values) of the last acquisition function graph
+        self.last_ask_time = None
+        self._last_optima = []
+        self._multistart_pool = None
         self.dimensionality = dimensionality
         self.gp_opts = gp_opts or {}
         self.ask_opts = ask_opts or {}
@@ -69,6 +288,8 @@ class GPCAMInProcessEngine(Engine):
                            # GPCamAverageCovariance(),
                            GPCamHyperparameterPlot(),
                            Table()]
+        if async_training and dimensionality >= 2:
+            self.graphs.append(GPCamTrainingStatus())
 
     def init_optimizer(self):
         opts = self.gp_opts.copy()
@@ -83,8 +304,34 @@ class GPCAMInProcessEngine(Engine):
 
     def reset(self):
         self._completed_training = {'global': set(),
-                                    'local': set()}
-        self.init_optimizer()
+                                    'local': set(),
+                                    'mcmc': set()}
+        self._told_data = None
+        self._told_count = 0
+        self._last_optima = []
+        self.acquisition_grid = None
+        if self.background_trainer:
+            self.background_trainer.cancel()
+        self._close_multistart_pool()
+        with self.model_lock.w_locked():
+            self.init_optimizer()
+            self.posterior_cache.bind(self.optimizer)
+            self.model_version += 1
+
+    @classmethod
+    def acquisition_function_names(cls) -> List[str]:
+        """
+        The names of the acquisition functions offered by this engine.
+        """
+        return [name for name in gpcam_acquisition_functions if name not in cls.unsupported_acquisition_functions]
+
+    def acquisition_function(self, name: str):
+        """
+        The acquisition function (a name or callable, as accepted by the optimizer) offered as `name`.
+        """
+        if name in self.cached_acquisition_functions:
+            return partial(mean_variance_acquisition, name=name)
+        return gpcam_acquisition_functions[name]
 
     @cached_property
     def parameters(self):
@@ -94,11 +341,14 @@ class GPCAMInProcessEngine(Engine):
                                    for i in range(self.num_hyperparameters) for edge in ['min', 'max']]
         bounds_parameters = [SimpleParameter(title=f'Axis #{i + 1} {edge}', name=f'axis_{i}_{edge}', type='float')
                              for i in range(self.dimensionality) for edge in ['min', 'max']]
-        func_parameters = [ListParameter(title='Method', name='method', limits=['global', 'local', 'hgdl'], default='global'),
-                           ListParameter(title='Acquisition Function', name='acquisition_function', limits=list(gpcam_acquisition_functions.keys()), default=list(gpcam_acquisition_functions.keys())[0]),
+        func_parameters = [ListParameter(title='Method', name='method', limits=['global', 'local', 'hgdl', 'multistart'], default='global'),
+                           ListParameter(title='Acquisition Function', name='acquisition_function', limits=self.acquisition_function_names(), default=self.acquisition_function_names()[0]),
                            SimpleParameter(title='Queue Length', name='n', value=1, type='int'),
                            SimpleParameter(title='Population Size (global only)', name='pop_size', value=20, type='int'),
-                           SimpleParameter(title='Tolerance', name='tol', value=1e-6, type='float')]
+                           SimpleParameter(title='Tolerance', name='tol', value=1e-6, type='float'),
+                           SimpleParameter(title='Workers (multistart only)', name='workers', value=os.cpu_count() or 1, type='int'),
+                           ListParameter(title='Batch Strategy (n>1)', name='batch_strategy', limits=['none', 'kriging believer', 'local penalization'], default='none'),
+                           SimpleParameter(title='Incremental Updates', name='incremental_updates', value=True, type='bool')]
 
         global_train_parameter = TrainingParameter(title='Train globally at...', name='global_training', addText='Add', children=[
             SimpleParameter(title='N=', name=str(uuid.uuid4()), value=N, type='int') for N in self.default_retrain_globally_at
@@ -128,24 +378,58 @@ class GPCAMInProcessEngine(Engine):
     def _set_hyperparameter(self, parameter, value):
         hyperparameters = np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
                                            for i in range(self.num_hyperparameters)])
+        with self.model_lock.w_locked():
+            self._set_hyperparameters(hyperparameters)
+
+    def _set_hyperparameters(self, hyperparameters):
+        # must be called with the model write lock held
         self.optimizer.set_hyperparameters(hyperparameters)
+        self._model_changed()
+        if self._multistart_pool:
+            self._multistart_pool.set_hyperparameters(self.optimizer.get_hyperparameters())
 
     def update_measurements(self, data: Data):
-        with data.r_lock():  # quickly grab values within lock before passing to optimizer
-            positions = data.positions.copy()
-            scores = data.scores.copy()
-            variances = data.variances.copy()
-        self.optimizer.tell(np.asarray(positions), np.asarray(scores), np.asarray(variances))
+        snapshot = data.snapshot()  # consistent, read-only views; no lock or copy required
+        with self.model_lock.w_locked():
+            self._tell(data, snapshot)
+
+    def _tell(self, data: Data, snapshot: DataSnapshot):
+        """
+        Tells the optimizer about new measurements. Must be called with the model write lock held.
+
+        With incremental updates, only the measurements not yet told are passed, and gpCAM extends its existing
+        Cholesky factor with a rank-k update rather than refactorizing the full covariance. The full data set is told
+        (and refactorized) when the GP is first initialized, when the data is replaced, or when incremental updates are
+        disabled. Training and hyperparameter changes refactorize the covariance in gpCAM, which also discards any
+        error accumulated through rank-k updates.
+        """
+        told = self._told_count if data is self._told_data else 0
+        if len(snapshot) == told:
+            return
+
+        append = bool(self.optimizer.gp and 0 < told < len(snapshot) and self.parameters['incremental_updates'])
+        if not append:
+            told = 0
+        x, y, v = snapshot.positions[told:], snapshot.scores[told:], snapshot.variances[told:]
+        self.optimizer.tell(x, y, v, append=append, gp_rank_n_update=append)
+        if self._multistart_pool:
+            self._multistart_pool.tell(x, y, v, append)
+
+        self._told_data = data
+        self._told_count = len(snapshot)
+        self._model_changed()
+
+    def _model_changed(self):
+        # must be called with the model write lock held
+        self.model_version += 1
+        self.posterior_cache.invalidate()
 
     def init_gp(self, hyperparameters, **opts):
         self.optimizer.init_gp(hyperparameters, **opts)
 
     def update_metrics(self, data: Data):
-        for graph in self.graphs:
-            try:
-                graph.compute(data, self)
-            except Exception as ex:
-                logger.exception(ex)
+        # threaded graphs are computed in the background; the rest are computed here
+        self.graph_scheduler.compute(self.graphs, data, self)
 
     def request_targets(self, position, **kwargs):
         self.last_position = position
@@ -161,27 +445,164 @@ class GPCAMInProcessEngine(Engine):
             kwargs.update({key: self.parameters[key] for key in ['acquisition_function', 'method', 'pop_size', 'tol']})
             kwargs.update({'input_set': bounds})
             kwargs.update(self.ask_opts)
-            return self.optimizer.ask(position=position,
-                                      n=n,
-                                      acquisition_function=gpcam_acquisition_functions[kwargs.pop('acquisition_function')],
-                                      x0=np.asarray(position),
-                                      **kwargs)['x'].astype(float)
+            acquisition_function_name = kwargs.pop('acquisition_function')
+            acquisition_function = self.acquisition_function(acquisition_function_name)
+            start = time.perf_counter()
+            with self.model_lock.r_locked(), log_time('asking for targets', cumulative_key='asking for targets'):
+                if n > 1 and self.parameters['batch_strategy'] != 'none':
+                    targets = self._batch_ask(position, n, acquisition_function_name, **kwargs)
+                elif kwargs['method'] == 'multistart':
+                    targets = self._multistart_ask(position, n, acquisition_function, **kwargs)
+                else:
+                    targets = self.optimizer.ask(position=position,
+                                                 n=n,
+                                                 acquisition_function=acquisition_function,
+                                                 x0=np.asarray(position),
+                                                 **kwargs)['x'].astype(float)
+            self.last_ask_time = time.perf_counter() - start
+            return targets
+
+    def _multistart_ask(self, position, n, acquisition_function, input_set, pop_size, tol, x_out=None, **_):
+        """
+        Maximizes the acquisition function with L-BFGS-B from `pop_size` starting points, spread over a pool of
+        `workers` processes (see `MultistartPool`). Starts are seeded from the previous optima, the current position,
+        and the best points of the last acquisition function graph; the rest are random. Must be called with the model
+        read lock held.
+        """
+        starts = self._multistart_seeds(position, input_set, max(pop_size, n))
+        pool = self._multistart_pool_of(max(1, self.parameters['workers']))
+        try:
+            optima = pool.maximize(starts, input_set, acquisition_function,
+                                   np.asarray(position) if position is not None else None, x_out, tol)
+        except RuntimeError:
+            self._close_multistart_pool()  # rebuilt on the next ask
+            raise
+
+        targets = distinct_optima(optima, n, 1e-3 * np.ptp(input_set, axis=1))
+        self._last_optima = targets
+        return np.asarray(targets, dtype=float)
+
+    def _batch_ask(self, position, n, acquisition_function_name, input_set, pop_size, x_out=None, **kwargs):
+        """
+        Selects a batch of `n` diverse targets from a set of candidates, using fantasized updates (kriging believer) or
+        local penalization. Candidates are seeded as for multistart optimization (and include the multistart optima
+        when that method is selected); the posterior is evaluated over them only once.
+        """
+        candidates = self._multistart_seeds(position, input_set, max(pop_size, 32 * n))
+        if kwargs['method'] == 'multistart':
+            optima = self._multistart_ask(position, pop_size, self.acquisition_function(acquisition_function_name),
+                                          input_set, pop_size, x_out=x_out, **kwargs)
+            candidates = np.vstack([optima, candidates])
+
+        posterior = cached_posterior(self.optimizer)
+        mean = posterior.posterior_mean(candidates)['m(x)']
+        strategy = self.parameters['batch_strategy']
+        if strategy == 'kriging believer' and acquisition_function_name in mean_variance_acquisition_functions:
+            covariance = posterior.posterior_covariance(candidates)['S']
+            noise = np.mean(self._told_data.snapshot().variances[:self._told_count])
+            selected = kriging_believer(mean, covariance, mean_variance_acquisition_functions[acquisition_function_name],
+                                        n, noise)
+        else:
+            if strategy == 'kriging believer':
+                logger.warning(f'Kriging believer is not supported for the {acquisition_function_name} acquisition '
+                               f'function; using local penalization instead.')
+            variance = posterior.posterior_covariance(candidates, variance_only=True)['v(x)']
+            if acquisition_function_name in self.cached_acquisition_functions:
+                values = mean_variance_acquisition_functions[acquisition_function_name](mean, variance)
+            else:
+                values = self.optimizer.evaluate_acquisition_function(candidates,
+                                                                      acquisition_function=gpcam_acquisition_functions[
+                                                                          acquisition_function_name],
+                                                                      origin=np.asarray(position) if position is not None else None,
+                                                                      x_out=x_out)
+            selected = local_penalization(candidates, np.ravel(values), mean, variance, n)
+
+        return candidates[selected]
+
+    def _multistart_seeds(self, position, bounds, count):
+        seeds = list(self._last_optima)
+        if position is not None and np.size(position) == self.dimensionality:
+            seeds.append(np.asarray(position, dtype=float))
+        if self.acquisition_grid is not None:
+            grid_positions, values = self.acquisition_grid
+            seeds.extend(grid_positions[np.argsort(values)[::-1][:max(count // 4, 1)]])
+
+        seeds = np.clip(np.asarray(seeds, dtype=float).reshape(-1, self.dimensionality)[:count], bounds[:, 0], bounds[:, 1])
+        random_starts = np.random.uniform(bounds[:, 0], bounds[:, 1], (count - len(seeds), self.dimensionality))
+        return np.vstack([seeds, random_starts])
+
+    def _multistart_pool_of(self, workers: int) -> MultistartPool:
+        # the pool is built from the told data, and kept current by _tell and _set_hyperparameters
+        if self._multistart_pool is None or self._multistart_pool.workers != workers:
+            self._close_multistart_pool()
+            snapshot = self._told_data.snapshot()
+            self._multistart_pool = MultistartPool(workers, type(self.optimizer),
+                                                   snapshot.positions[:self._told_count],
+                                                   snapshot.scores[:self._told_count],
+                                                   snapshot.variances[:self._told_count],
+                                                   self.optimizer.get_hyperparameters(),
+                                                   self.gp_opts)
+        return self._multistart_pool
+
+    def _close_multistart_pool(self):
+        if self._multistart_pool:
+            self._multistart_pool.close()
+            self._multistart_pool = None
 
     def train(self):
-        for method in ['global', 'local', 'mcmc']:
-            train_at = set(child.value() for child in self.parameters.child(f'{method}_training').children())
+        if self.background_trainer:
+            return self._train_in_background()
 
-            for N in train_at:
-                if len(self.optimizer.y_data) > N and N not in self._completed_training[method]:
-                    logger.info('Training in progress. This make take a while...')
-                    self.optimizer.train(hyperparameter_bounds=
-                                         np.asarray([[self.parameters[('hyperparameters', f'hyperparameter_{i}_{edge}')]
-                                                      for edge in ['min', 'max']]
-                                                     for i in range(self.num_hyperparameters)]),
-                                         init_hyperparameters=
-                                         np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
-                                                     for i in range(self.num_hyperparameters)]), method=method)
-                    self._completed_training[method].add(N)
-                    logger.info(f"New hyperparameters: {self.optimizer.get_hyperparameters()}")
+        methods = self._due_training_methods()
+        if methods:
+            logger.info('Training in progress. This make take a while...')
+            # a fresh model is trained on the told data, so that the current model keeps serving request_targets
+            hyperparameters = _training.trained_hyperparameters(*self._training_inputs(), methods)
+            with self.model_lock.w_locked():
+                self._set_hyperparameters(hyperparameters)
+            logger.info(f"New hyperparameters: {self.optimizer.get_hyperparameters()}")
 
         return True
+
+    def _train_in_background(self):
+        hyperparameters = self.background_trainer.result()
+        if hyperparameters is not None:
+            with self.model_lock.w_locked():
+                self._set_hyperparameters(hyperparameters)
+            logger.info(f"New hyperparameters from background training: {hyperparameters}")
+
+        methods = self._due_training_methods()
+        if methods:
+            # newer data supersedes a training in progress; keep any methods it hadn't finished
+            if self.background_trainer.training:
+                methods = [method for method in ['global', 'local', 'mcmc']
+                           if method in methods or method in self.background_trainer.methods]
+            self.background_trainer.start(*self._training_inputs(), methods)
+
+        return True
+
+    def _due_training_methods(self) -> List[str]:
+        # the training methods due at the told data's size; these are marked completed
+        methods = []
+        for method in ['global', 'local', 'mcmc']:
+            train_at = set(child.value() for child in self.parameters.child(f'{method}_training').children())
+            due = {N for N in train_at if self._told_count > N and N not in self._completed_training[method]}
+            if due:
+                methods.append(method)
+                self._completed_training[method].update(due)
+        return methods
+
+    def _training_inputs(self) -> tuple:
+        # the arguments, other than the methods, with which a fresh model is trained on the told data
+        with self.model_lock.r_locked():
+            snapshot, count = self._told_data.snapshot(), self._told_count
+        return (type(self.optimizer),
+                snapshot.positions[:count],
+                snapshot.scores[:count],
+                snapshot.variances[:count],
+                np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
+                            for i in range(self.num_hyperparameters)]),
+                np.asarray([[self.parameters[('hyperparameters', f'hyperparameter_{i}_{edge}')]
+                             for edge in ['min', 'max']]
+                            for i in range(self.num_hyperparameters)]),
+                self.gp_opts)
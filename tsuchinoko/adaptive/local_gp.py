@@ -0,0 +1,492 @@
+import heapq
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List
+
+import numpy as np
+from loguru import logger
+from scipy.linalg import cholesky, cho_solve, solve_triangular, LinAlgError
+from scipy.optimize import minimize, differential_evolution
+
+from .batch import mean_variance_acquisition_functions
+from .gpCAM_in_process import GPCAMInProcessEngine
+from .quadtree import LinearQuadTree, Rect
+from .sparse_gp import matern_kernel, JITTER
+from ..graphs.common import GPCamPosteriorCovariance
+from ..utils.buffers import ColumnBuffer
+
+# set in pool threads, so that work mapped from within a pool thread runs serially rather than waiting on the pool
+_worker = threading.local()
+
+
+def _in_worker(function, item):
+    _worker.active = True
+    try:
+        return function(item)
+    finally:
+        _worker.active = False
+
+
+def _maximize_within_leaves(view: '_LeavesView', leaves: List[int], **kwargs) -> list:
+    # runs in pool processes
+    return [view._maximize_within(leaf, **kwargs) for leaf in leaves]
+
+
+class LocalGP:
+    """
+    An exact Gaussian process over the measurements within one quadtree leaf and its halo. Leaves share
+    hyperparameters, but each has its own constant prior mean.
+    """
+
+    def __init__(self, indices: np.ndarray, x: np.ndarray, y: np.ndarray, v: np.ndarray, hyperparameters: np.ndarray,
+                 prior_mean: float):
+        self.indices = indices
+        self.x = x
+        self.hyperparameters = hyperparameters
+        self._L = None
+        self.prior_mean = prior_mean
+        if len(y):
+            self.prior_mean = np.mean(y)
+            K = matern_kernel(x, x, hyperparameters) + np.diag(v)
+            self._L = cholesky(K + JITTER * hyperparameters[0] * np.eye(len(y)), lower=True)
+            self._alpha = cho_solve((self._L, True), y - self.prior_mean)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def predict(self, x_pred: np.ndarray, covariance: bool = False):
+        """
+        Returns the posterior mean and variance at `x_pred`, and the posterior covariance between them if requested.
+        """
+        if self._L is None:
+            S = matern_kernel(x_pred, x_pred, self.hyperparameters) if covariance else None
+            return np.full(len(x_pred), self.prior_mean), np.full(len(x_pred), self.hyperparameters[0]), S
+
+        k = matern_kernel(x_pred, self.x, self.hyperparameters)
+        mean = self.prior_mean + k @ self._alpha
+        V = solve_triangular(self._L, k.T, lower=True)
+        variance = np.clip(self.hyperparameters[0] - np.sum(V ** 2, axis=0), 0, None)
+        S = matern_kernel(x_pred, x_pred, self.hyperparameters) - V.T @ V if covariance else None
+        return mean, variance, S
+
+    @staticmethod
+    def negative_log_likelihood(hyperparameters, x, y, v) -> float:
+        try:
+            K = matern_kernel(x, x, hyperparameters) + np.diag(v)
+            L = cholesky(K + JITTER * hyperparameters[0] * np.eye(len(y)), lower=True)
+        except (LinAlgError, ValueError):
+            return 1e20
+        r = y - np.mean(y)
+        alpha = cho_solve((L, True), r)
+        return .5 * (r @ alpha + 2 * np.sum(np.log(np.diag(L))) + len(y) * np.log(2 * np.pi))
+
+
+class LocalGPOptimizer:
+    """
+    A domain-decomposed Gaussian process over a 2-D domain, with the parts of gpCAM's `GPOptimizer` interface used by
+    `GPCAMInProcessEngine` and its graphs.
+
+    Measurements are partitioned by a linear quadtree holding at most `max_leaf_points` measurements per leaf. Each
+    leaf has an independent exact GP over the measurements within its halo: the leaf's region grown by `overlap` times
+    its size on every side. Predictions are blended across the leaves whose halos contain them, with weights falling
+    linearly from 1 within a leaf to 0 at the edge of its halo; the blended variance is that of the mixture.
+
+    Telling new measurements refits only the leaves whose halos contain them (or which were created by dividing a
+    leaf), each at a cost bounded by the leaf size rather than N. Likewise, the acquisition function is maximized
+    separately within each leaf, and the optima are cached until a refit leaf's halo reaches that leaf; asking for
+    targets re-optimizes only those leaves. Leaves are refit in parallel on a pool of `workers` threads (the work is
+    dominated by kernel evaluations and factorizations, which release the GIL). Leaves are optimized in parallel on a
+    pool of `workers` processes, since L-BFGS-B's iterations run in Python.
+
+    Cached optima assume that the acquisition function at a position depends only on the posterior near it.
+    """
+
+    def __init__(self, x_data=None, y_data=None, init_hyperparameters=None, noise_variances=None,
+                 parameter_bounds=None, max_leaf_points: int = 100, overlap: float = .25,
+                 max_training_points: int = 2000, workers: int = None, compute_device=None):
+        self.hyperparameters = np.asarray(init_hyperparameters, dtype=float)
+        self.parameter_bounds = np.asarray(parameter_bounds, dtype=float)
+        self.max_leaf_points = max_leaf_points
+        self.overlap = overlap
+        self.max_training_points = max_training_points
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = None
+        self._process_executor = None
+        self._clear()
+        if x_data is not None:
+            self.tell(x_data, y_data, noise_variances, append=False)
+
+    def __getstate__(self):
+        # the pools stay behind (i.e. when pickled for acquisition optimization in child processes)
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        state['_process_executor'] = None
+        return state
+
+    def _clear(self):
+        self._x = ColumnBuffer()
+        self._y = ColumnBuffer()
+        self._v = ColumnBuffer()
+        (x_min, x_max), (y_min, y_max) = self.parameter_bounds
+        self.quadtree = LinearQuadTree(Rect((x_min + x_max) / 2, (y_min + y_max) / 2, x_max - x_min, y_max - y_min),
+                                       self.max_leaf_points)
+        self._update_geometry()
+        self.models: Dict[int, LocalGP] = {}  # by leaf key
+        self._optima = {}  # leaf key -> (position, acquisition function value)
+        self._optima_key = None
+        self.refit_count = 0  # leaves refit by the last tell
+        self.reoptimized_count = 0  # leaves re-optimized by the last ask
+
+    @property
+    def gp(self) -> bool:
+        return bool(len(self._y))
+
+    @property
+    def x_data(self) -> np.ndarray:
+        return self._x.view()
+
+    @property
+    def points(self) -> np.ndarray:
+        return self.x_data
+
+    @property
+    def y_data(self) -> np.ndarray:
+        return self._y.view()
+
+    @property
+    def noise_variances(self) -> np.ndarray:
+        return self._v.view()
+
+    def get_hyperparameters(self) -> np.ndarray:
+        return self.hyperparameters
+
+    def set_hyperparameters(self, hyperparameters):
+        self.hyperparameters = np.asarray(hyperparameters, dtype=float)
+        self._refit(self.leaves)
+        self._optima.clear()
+
+    def tell(self, x, y, noise_variances=None, append=True, gp_rank_n_update=None):
+        x = np.asarray(x, dtype=float).reshape(-1, 2)
+        y = np.asarray(y, dtype=float).ravel()
+        if noise_variances is None:
+            noise_variances = np.full(len(y), abs(np.mean(y)) / 100.0)
+        noise_variances = np.clip(np.asarray(noise_variances, dtype=float).ravel(), np.finfo(float).tiny, None)
+
+        if not append:
+            self._clear()
+        self._x.extend(x)
+        self._y.extend(y)
+        self._v.extend(noise_variances)
+
+        previous_leaves = set(self.leaves)
+        # every (clipped) position is inside the quadtree, so its points are numbered by measurement row
+        self.quadtree.insert(self._partition_positions(x))
+        self._update_geometry()
+
+        touched = self._halos_containing(x) | np.array([leaf not in previous_leaves for leaf in self.leaves])
+        dirty = [leaf for leaf, is_dirty in zip(self.leaves, touched) if is_dirty]
+        self.models = {leaf: model for leaf, model in self.models.items() if leaf in self._leaf_index}
+        self._refit(dirty)
+
+        # optima are stale wherever the posterior changed: within the halos of refit leaves
+        stale = self._cores_intersecting(np.flatnonzero(touched))
+        for leaf in list(self._optima):
+            if leaf not in self._leaf_index or stale[self._leaf_index[leaf]]:
+                del self._optima[leaf]
+
+    def _partition_positions(self, x):
+        # the quadtree's regions are half-open, so positions are clipped just inside the upper bounds
+        lower, upper = self.parameter_bounds[:, 0], self.parameter_bounds[:, 1]
+        return np.clip(x, lower, upper - 1e-9 * (upper - lower))
+
+    def _update_geometry(self):
+        self.leaves: List[int] = self.quadtree.leaf_keys.tolist()
+        self._leaf_index = {leaf: i for i, leaf in enumerate(self.leaves)}
+        self._core_min = self.quadtree.leaf_min
+        self._core_max = self.quadtree.leaf_max
+        self._margin = self.overlap * (self._core_max - self._core_min)
+
+    def _halos_containing(self, x) -> np.ndarray:
+        # a mask over leaves, of those whose halos contain any of x
+        x = self._partition_positions(x)[:, None, :]
+        inside = (x >= self._core_min - self._margin) & (x <= self._core_max + self._margin)
+        return np.any(np.all(inside, axis=2), axis=0)
+
+    def _halos_intersecting(self, core_indices) -> np.ndarray:
+        # a mask over leaves, of those whose halos intersect the cores of the leaves at core_indices
+        core_min = self._core_min[core_indices][:, None, :]
+        core_max = self._core_max[core_indices][:, None, :]
+        intersects = (self._core_min - self._margin <= core_max) & (self._core_max + self._margin >= core_min)
+        return np.any(np.all(intersects, axis=2), axis=0)
+
+    def _cores_intersecting(self, halo_indices) -> np.ndarray:
+        # a mask over leaves, of those whose cores intersect the halos of the leaves at halo_indices
+        halo_min = (self._core_min - self._margin)[halo_indices][:, None, :]
+        halo_max = (self._core_max + self._margin)[halo_indices][:, None, :]
+        intersects = (halo_min <= self._core_max) & (halo_max >= self._core_min)
+        return np.any(np.all(intersects, axis=2), axis=0)
+
+    def _map(self, function, items) -> list:
+        items = list(items)
+        if len(items) < 2 or self.workers == 1 or getattr(_worker, 'active', False):
+            return list(map(function, items))
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='local GP')
+        return list(self._executor.map(partial(_in_worker, function), items))
+
+    def _refit(self, leaves: List[int]):
+        self.refit_count = len(leaves)
+        if not self.gp:
+            return
+        prior_mean = np.mean(self.y_data)
+        for leaf, model in zip(leaves, self._map(partial(self._fit, prior_mean=prior_mean), leaves)):
+            self.models[leaf] = model
+
+    def _fit(self, leaf: int, prior_mean: float) -> LocalGP:
+        index = self._leaf_index[leaf]
+        center = (self._core_min[index] + self._core_max[index]) / 2
+        size = (self._core_max[index] - self._core_min[index]) * (1 + 2 * self.overlap)
+        indices = self.quadtree.query(Rect(*center, *size))
+        # repeated measurements at one position can crowd a halo; keep its size bounded
+        max_points = 4 * self.max_leaf_points
+        if len(indices) > max_points:
+            indices = indices[np.linspace(0, len(indices) - 1, max_points).astype(int)]
+        return LocalGP(indices, self.x_data[indices], self.y_data[indices], self.noise_variances[indices],
+                       self.hyperparameters, prior_mean)
+
+    def _weights(self, x_pred) -> np.ndarray:
+        # the blending weight of each leaf (columns) at each position (rows), normalized over leaves
+        x = self._partition_positions(x_pred)[:, None, :]
+        outside = np.maximum(np.maximum(self._core_min - x, x - self._core_max), 0)
+        weights = np.prod(np.clip(1 - outside / np.maximum(self._margin, np.finfo(float).tiny), 0, 1), axis=2)
+        return weights / np.sum(weights, axis=1, keepdims=True)
+
+    def _blend(self, x_pred, covariance=False):
+        x_pred = np.atleast_2d(np.asarray(x_pred, dtype=float))
+        weights = self._weights(x_pred)
+
+        def predict(column):
+            rows = np.flatnonzero(weights[:, column])
+            return rows, self.models[self.leaves[column]].predict(x_pred[rows], covariance)
+
+        mean = np.zeros(len(x_pred))
+        second_moment = np.zeros(len(x_pred))
+        S = np.zeros((len(x_pred), len(x_pred))) if covariance else None
+        columns = np.flatnonzero(np.any(weights, axis=0))
+        for column, (rows, (m, v, S_leaf)) in zip(columns, self._map(predict, columns)):
+            w = weights[rows, column]
+            mean[rows] += w * m
+            second_moment[rows] += w * (v + m ** 2)
+            if covariance:
+                S[np.ix_(rows, rows)] += np.outer(w, w) * S_leaf
+        variance = np.clip(second_moment - mean ** 2, 0, None)
+        if covariance:
+            np.fill_diagonal(S, variance)
+        return x_pred, mean, variance, S
+
+    def posterior_mean(self, x_pred, x_out=None) -> dict:
+        x_pred, mean, _, _ = self._blend(x_pred)
+        return {'x': x_pred, 'm(x)': mean, 'f(x)': mean}
+
+    def posterior_covariance(self, x_pred, x_out=None, variance_only=False, add_noise=False) -> dict:
+        """
+        The blended posterior variance. The covariance between positions is approximated by blending each leaf's
+        covariance, and is zero between positions that share no leaf.
+        """
+        x_pred, _, variance, S = self._blend(x_pred, covariance=not variance_only)
+        return {'x': x_pred, 'v(x)': variance, 'S': S}
+
+    def posterior_mean_grad(self, x_pred, x_out=None, direction=None) -> dict:
+        # central differences of the blended mean, which includes the gradient of the blending weights
+        x_pred = np.atleast_2d(np.asarray(x_pred, dtype=float))
+        step = 1e-6 * np.ptp(self.parameter_bounds, axis=1)
+        gradient = np.stack([(self._blend(x_pred + offset)[1] - self._blend(x_pred - offset)[1]) / (2 * offset[i])
+                             for i, offset in enumerate(np.diag(step))], axis=1)
+        return {'x': x_pred, 'dm/dx': gradient, 'df/dx': gradient}
+
+    def evaluate_acquisition_function(self, x, x_out=None, acquisition_function='variance', origin=None, args=None):
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        if callable(acquisition_function):
+            return np.asarray(acquisition_function(x, self))
+        elif acquisition_function in mean_variance_acquisition_functions:
+            _, mean, variance, _ = self._blend(x)
+            return mean_variance_acquisition_functions[acquisition_function](mean, variance)
+        elif acquisition_function == 'gradient':
+            gradient = self.posterior_mean_grad(x)['dm/dx']
+            return np.linalg.norm(gradient, axis=1) * np.sqrt(self._blend(x)[2])
+        raise ValueError(f'The {acquisition_function} acquisition function is not supported by the local GP.')
+
+    def ask(self, input_set, x_out=None, acquisition_function='variance', position=None, n=1, method='global',
+            pop_size=20, max_iter=20, tol=1e-6, x0=None, **kwargs) -> dict:
+        """
+        Returns the acquisition function optima of the `n` best leaves. Each leaf's optimum is found by evaluating
+        `pop_size` random candidates within the leaf, then polishing the best with L-BFGS-B.
+        """
+        bounds = np.asarray(input_set, dtype=float)
+        key = (acquisition_function, bounds.tobytes())
+        if key != self._optima_key:
+            self._optima.clear()
+            self._optima_key = key
+
+        stale = [leaf for leaf in self.leaves if leaf not in self._optima]
+        optima = self._maximize_within_leaves(stale, bounds=bounds, acquisition_function=acquisition_function,
+                                              origin=position, pop_size=pop_size, max_iter=max_iter, tol=tol)
+        for leaf, optimum in zip(stale, optima):
+            self._optima[leaf] = optimum
+        self.reoptimized_count = len(stale)
+
+        optima = heapq.nlargest(n, (optimum for optimum in self._optima.values() if optimum[0] is not None),
+                                key=lambda optimum: optimum[1])
+        targets = [position for position, _ in optima]
+        # early on, there may be fewer leaves than targets requested
+        targets.extend(np.random.uniform(bounds[:, 0], bounds[:, 1], (n - len(targets), len(bounds))))
+        targets = np.asarray(targets, dtype=float)
+        values = self.evaluate_acquisition_function(targets, acquisition_function=acquisition_function, origin=position)
+        return {'x': targets, 'f(x)': np.ravel(values)}
+
+    def _maximize_within_leaves(self, leaves: List[int], **kwargs) -> list:
+        # spread over the process pool; each chunk is sent only the part of the model its leaves need
+        workers = min(self.workers, len(leaves))
+        if workers < 2:
+            return [self._maximize_within(leaf, **kwargs) for leaf in leaves]
+        if self._process_executor is None:
+            self._process_executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        chunks = [chunk.tolist() for chunk in np.array_split(leaves, workers)]
+        futures = [self._process_executor.submit(_maximize_within_leaves, _LeavesView(self, chunk), chunk, **kwargs)
+                   for chunk in chunks]
+        return [optimum for future in futures for optimum in future.result()]
+
+    def _maximize_within(self, leaf: int, bounds, acquisition_function, origin, pop_size, max_iter, tol):
+        lower = np.maximum(self._core_min[self._leaf_index[leaf]], bounds[:, 0])
+        upper = np.minimum(self._core_max[self._leaf_index[leaf]], bounds[:, 1])
+        if np.any(lower >= upper):
+            return None, -np.inf
+
+        def acquisition(x):
+            return np.ravel(self.evaluate_acquisition_function(np.atleast_2d(x), acquisition_function=
+                                                               acquisition_function, origin=origin))
+
+        candidates = np.random.uniform(lower, upper, (pop_size, len(lower)))
+        values = acquisition(candidates)
+        best = int(np.argmax(values))
+        result = minimize(lambda x: -acquisition(x)[0], candidates[best], method='L-BFGS-B',
+                          bounds=np.stack([lower, upper], axis=1), options={'ftol': tol, 'maxiter': max_iter})
+        if -result.fun > values[best]:
+            return result.x, -result.fun
+        return candidates[best], values[best]
+
+    def train(self, hyperparameter_bounds=None, init_hyperparameters=None, method='global', pop_size=20,
+              tolerance=1e-4, max_iter=120, **kwargs):
+        """
+        Trains the shared hyperparameters by maximizing the summed log marginal likelihood of the leaves' GPs, over a
+        random subset of leaves holding at most `max_training_points` measurements.
+        """
+        bounds = np.asarray(hyperparameter_bounds, dtype=float)
+        models = [model for model in self.models.values() if len(model)]
+        np.random.shuffle(models)
+        subsets = []
+        count = 0
+        for model in models:
+            if count + len(model) > self.max_training_points and subsets:
+                break
+            indices = model.indices
+            subsets.append((self.x_data[indices], self.y_data[indices], self.noise_variances[indices]))
+            count += len(model)
+
+        def objective(hyperparameters):
+            return sum(self._map(lambda subset: LocalGP.negative_log_likelihood(hyperparameters, *subset), subsets))
+
+        if method == 'global':
+            result = differential_evolution(objective, bounds, popsize=pop_size, maxiter=max_iter, tol=tolerance)
+        else:
+            start = self.hyperparameters if init_hyperparameters is None else init_hyperparameters
+            result = minimize(objective, np.clip(start, bounds[:, 0], bounds[:, 1]), method='L-BFGS-B', bounds=bounds,
+                              options={'maxiter': max_iter})
+        logger.info(f'Local GP training ({method}) over {len(subsets)} leaves finished with negative log likelihood '
+                    f'{result.fun}')
+        self.set_hyperparameters(result.x)
+
+
+class _LeavesView(LocalGPOptimizer):
+    """
+    The part of a `LocalGPOptimizer` needed to evaluate its posterior within some of its leaves: the models of the
+    leaves whose halos reach them (which hold their halo measurements), and those leaves' blending geometry. This is
+    what's sent to pool processes to optimize the acquisition function within leaves; the measurements, the quadtree
+    and the other leaves' models stay behind. Only the number of measurements is kept, for acquisition functions that
+    depend on it.
+    """
+
+    def __init__(self, optimizer: LocalGPOptimizer, leaves: List[int]):
+        indices = np.flatnonzero(optimizer._halos_intersecting([optimizer._leaf_index[leaf] for leaf in leaves]))
+        self.hyperparameters = optimizer.hyperparameters
+        self.parameter_bounds = optimizer.parameter_bounds
+        self.overlap = optimizer.overlap
+        self.workers = 1
+        self._executor = None
+        self._process_executor = None
+        self.leaves = [optimizer.leaves[index] for index in indices]
+        self._leaf_index = {leaf: i for i, leaf in enumerate(self.leaves)}
+        self._core_min = optimizer._core_min[indices]
+        self._core_max = optimizer._core_max[indices]
+        self._margin = optimizer._margin[indices]
+        self.models = {leaf: optimizer.models[leaf] for leaf in self.leaves if leaf in optimizer.models}
+        self._count = len(optimizer.y_data)
+
+    @property
+    def gp(self) -> bool:
+        return bool(self._count)
+
+    @property
+    def points(self) -> np.ndarray:
+        # placeholders, one per measurement
+        return np.broadcast_to(np.nan, (self._count, len(self.parameter_bounds)))
+
+
+class LocalGPEngine(GPCAMInProcessEngine):
+    """
+    A 2-D adaptive engine for very large campaigns, backed by a quadtree of local Gaussian processes (see
+    `LocalGPOptimizer`). The cost of each iteration is bounded by the size of the leaves near new measurements, rather
+    than growing with N. This is a drop-in replacement for `GPCAMInProcessEngine`, with the same parameters and graphs
+    (other than the posterior covariance between all measurements, which grows as N²).
+
+    The `shannon_ig` and `covariance` acquisition functions, which need the joint covariance of the evaluated points,
+    aren't offered.
+    """
+    unsupported_acquisition_functions = ('shannon_ig', 'covariance')
+    cached_acquisition_functions = tuple()  # the optimizer blends the mean and variance in one pass
+
+    def __init__(self, parameter_bounds, hyperparameters, hyperparameter_bounds, max_leaf_points: int = 100,
+                 overlap: float = .25, max_training_points: int = 2000, workers: int = None, gp_opts: dict = None,
+                 **kwargs):
+        """
+
+        Parameters
+        ----------
+        max_leaf_points
+            The maximum number of measurements held by each quadtree leaf. Each local GP costs O(m³) in the number of
+            measurements within its halo, which is a small multiple of this.
+        overlap
+            The width of each leaf's halo, as a fraction of the leaf's size.
+        max_training_points
+            The maximum number of measurements used to train hyperparameters.
+        workers
+            The number of threads used to refit leaves, and of processes used to optimize the acquisition function
+            within leaves. Defaults to the number of CPUs.
+        """
+        gp_opts = dict(gp_opts or {}, max_leaf_points=max_leaf_points, overlap=overlap,
+                       max_training_points=max_training_points, workers=workers)
+        super().__init__(2, parameter_bounds, hyperparameters, hyperparameter_bounds, gp_opts=gp_opts, **kwargs)
+        self.graphs = [graph for graph in self.graphs if not isinstance(graph, GPCamPosteriorCovariance)]
+
+    def init_optimizer(self):
+        hyperparameters = np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
+                                      for i in range(self.num_hyperparameters)])
+        # the bounds are kept in gp_opts so that background training builds the same domain
+        self.gp_opts['parameter_bounds'] = np.asarray([[self.parameters[('bounds', f'axis_{i}_{edge}')]
+                                                        for edge in ['min', 'max']]
+                                                       for i in range(self.dimensionality)])
+
+        self.optimizer = LocalGPOptimizer(init_hyperparameters=hyperparameters, **self.gp_opts)
@@ -0,0 +1,363 @@
+import heapq
+
+import numpy as np
+
+from tsuchinoko.adaptive import Data
+from tsuchinoko.adaptive.gpCAM_in_process import GPCAMInProcessEngine
+from tsuchinoko.utils.buffers import ColumnBuffer
+from tsuchinoko.utils.logging import log_time
+
+# leaf keys pack a Morton code and a 5-bit depth into 64 bits
+MAX_CODE_BITS = 59
+MAX_DEPTH = 24
+
+
+def morton_interleave(cells: np.ndarray, bits: int) -> np.ndarray:
+    """Interleaves the low `bits` bits of each column of integer cell coordinates (N, D) into Morton codes, with
+    dimension d in bits d, D + d, 2D + d, ..."""
+    cells = np.asarray(cells, dtype=np.uint64)
+    dimensionality = cells.shape[1]
+    codes = np.zeros(len(cells), dtype=np.uint64)
+    for bit in range(bits):
+        for d in range(dimensionality):
+            codes |= ((cells[:, d] >> np.uint64(bit)) & np.uint64(1)) << np.uint64(bit * dimensionality + d)
+    return codes
+
+
+def morton_deinterleave(codes: np.ndarray, dimensionality: int, bits: int) -> np.ndarray:
+    """Separates Morton codes back into integer cell coordinates (N, D)."""
+    codes = np.asarray(codes, dtype=np.uint64)
+    cells = np.zeros((len(codes), dimensionality), dtype=np.uint64)
+    for bit in range(bits):
+        for d in range(dimensionality):
+            cells[:, d] |= ((codes >> np.uint64(bit * dimensionality + d)) & np.uint64(1)) << np.uint64(bit)
+    return cells
+
+
+class LinearNDTree:
+    """A pointerless (linear) 2^D-tree (a quadtree in 2-D, an octree in 3-D) stored in NumPy arrays.
+
+    The domain is divided into a grid of 2**max_depth cells per side, and each point is keyed by the Morton code of its
+    cell. Points are kept sorted by code, so that the points within any node are contiguous. The tree itself is stored
+    as its leaves, each of which is the code of its first cell and its depth; as the leaves tile the domain in Z-order,
+    the leaf containing a point is found by a binary search of the leaf codes. Each leaf has a key (its code and depth)
+    which remains valid for as long as the leaf is not divided.
+
+    Leaves hold at most max_points points; inserting more divides them (up to max_depth). All operations are
+    vectorized over points and leaves. Codes are limited to 59 bits, so max_depth is at most 59 // D.
+
+    """
+
+    def __init__(self, lower, upper, max_points=4, max_depth=None):
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        self.dimensionality = len(self.lower)
+        if max_depth is None:
+            max_depth = min(MAX_DEPTH, MAX_CODE_BITS // self.dimensionality)
+        if max_depth * self.dimensionality > MAX_CODE_BITS:
+            raise ValueError(f'A {self.dimensionality}-D tree can be at most {MAX_CODE_BITS // self.dimensionality} '
+                             f'levels deep.')
+        self.max_points = max_points
+        self.max_depth = max_depth
+        self.positions = ColumnBuffer()
+        self.values = ColumnBuffer()
+        self.variances = ColumnBuffer()
+        self._codes = np.empty(0, dtype=np.uint64)  # point codes, sorted
+        self._order = np.empty(0, dtype=int)  # the point (row) at each sorted code
+        self.leaf_codes = np.zeros(1, dtype=np.uint64)
+        self.leaf_depths = np.zeros(1, dtype=np.uint64)
+        self._update_leaves()
+
+    def __len__(self):
+        """Return the number of points in the tree."""
+        return len(self._codes)
+
+    @property
+    def leaf_count(self) -> int:
+        return len(self.leaf_codes)
+
+    @property
+    def leaf_keys(self) -> np.ndarray:
+        """Keys of the leaves, in Z-order (which is also ascending)."""
+        return (self.leaf_codes << np.uint64(5)) | self.leaf_depths
+
+    @property
+    def volume(self) -> float:
+        return float(np.prod(self.upper - self.lower))
+
+    def leaf_index(self, keys) -> np.ndarray:
+        """Find the leaves (indices) with keys; keys of leaves that have since been divided map to -1."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        index = np.clip(np.searchsorted(self.leaf_keys, keys), 0, self.leaf_count - 1)
+        return np.where(self.leaf_keys[index] == keys, index, -1)
+
+    def _encode_cells(self, cells: np.ndarray) -> np.ndarray:
+        return morton_interleave(cells, self.max_depth)
+
+    def _decode_codes(self, codes: np.ndarray) -> np.ndarray:
+        return morton_deinterleave(codes, self.dimensionality, self.max_depth)
+
+    def encode(self, positions) -> np.ndarray:
+        """The Morton codes of the cells containing positions (clipped into the domain)."""
+        positions = np.asarray(positions, dtype=float).reshape(-1, self.dimensionality)
+        cells = 2 ** self.max_depth
+        indices = np.floor((positions - self.lower) / (self.upper - self.lower) * cells)
+        return self._encode_cells(np.clip(indices, 0, cells - 1).astype(np.uint64))
+
+    def contains(self, positions) -> np.ndarray:
+        positions = np.asarray(positions, dtype=float).reshape(-1, self.dimensionality)
+        return np.all((positions >= self.lower) & (positions < self.upper), axis=1)
+
+    def insert(self, positions, values=None, variances=None) -> np.ndarray:
+        """Insert points, dividing leaves which overflow. Returns a mask of the points inside the domain; points
+        outside it are not inserted. Inserted points are numbered (as rows) in order of insertion."""
+        positions = np.asarray(positions, dtype=float).reshape(-1, self.dimensionality)
+        inside = self.contains(positions)
+        if not np.any(inside):
+            return inside
+        positions = positions[inside]
+        rows = np.arange(len(self), len(self) + len(positions))
+        self.positions.extend(positions)
+        self.values.extend(np.full(len(positions), np.nan) if values is None else np.asarray(values)[inside])
+        self.variances.extend(np.full(len(positions), np.nan) if variances is None else np.asarray(variances)[inside])
+
+        codes = self.encode(positions)
+        sort = np.argsort(codes, kind='stable')
+        at = np.searchsorted(self._codes, codes[sort], side='right')
+        self._codes = np.insert(self._codes, at, codes[sort])
+        self._order = np.insert(self._order, at, rows[sort])
+        self._update_leaves()
+
+        while True:
+            overflowing = np.flatnonzero((self.leaf_point_counts() > self.max_points) &
+                                         (self.leaf_depths < self.max_depth))
+            if not len(overflowing):
+                return inside
+            self.divide(overflowing)
+
+    def divide(self, leaves) -> np.ndarray:
+        """Divide leaves (indices) into 2^D children each. Returns the indices of the children (in the same order as
+        the leaves, and in Z-order within each)."""
+        leaves = np.atleast_1d(np.asarray(leaves, dtype=int))
+        if np.any(self.leaf_depths[leaves] >= self.max_depth):
+            raise ValueError(f'Leaves at the maximum depth ({self.max_depth}) cannot be divided.')
+        children = 2 ** self.dimensionality
+        depths = self.leaf_depths[leaves] + np.uint64(1)
+        step = np.uint64(1) << (np.uint64(self.dimensionality) * (np.uint64(self.max_depth) - depths))
+        child_codes = (self.leaf_codes[leaves][:, None] +
+                       step[:, None] * np.arange(children, dtype=np.uint64)).ravel()
+        child_depths = np.repeat(depths, children)
+
+        keep = np.ones(self.leaf_count, dtype=bool)
+        keep[leaves] = False
+        codes = np.concatenate([self.leaf_codes[keep], child_codes])
+        order = np.argsort(codes, kind='stable')
+        self.leaf_codes = codes[order]
+        self.leaf_depths = np.concatenate([self.leaf_depths[keep], child_depths])[order]
+        self._update_leaves()
+        return np.searchsorted(self.leaf_codes, child_codes)
+
+    def _update_leaves(self):
+        self._leaf_starts = np.append(np.searchsorted(self._codes, self.leaf_codes), len(self._codes))
+        cell = (self.upper - self.lower) / 2 ** self.max_depth
+        cells = (np.uint64(2) ** (np.uint64(self.max_depth) - self.leaf_depths)).astype(float)
+        self.leaf_min = self.lower + self._decode_codes(self.leaf_codes).astype(float) * cell
+        self.leaf_max = self.leaf_min + cells[:, None] * cell
+
+    def leaf_point_counts(self) -> np.ndarray:
+        return np.diff(self._leaf_starts)
+
+    def leaf_volumes(self, leaves=None) -> np.ndarray:
+        volumes = self.volume / (2.0 ** self.dimensionality) ** self.leaf_depths.astype(float)
+        return volumes if leaves is None else volumes[leaves]
+
+    def locate(self, positions) -> np.ndarray:
+        """Find the leaves (indices) containing positions; positions outside the domain map to -1."""
+        leaves = np.searchsorted(self.leaf_codes, self.encode(positions), side='right') - 1
+        return np.where(self.contains(positions), leaves, -1)
+
+    def points_in(self, leaves) -> np.ndarray:
+        """Find the points (rows) within leaves (indices)."""
+        leaves = np.atleast_1d(np.asarray(leaves, dtype=int))
+        starts = self._leaf_starts[leaves]
+        lengths = self._leaf_starts[leaves + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self._order[offsets + np.arange(np.sum(lengths))]
+
+    def query_box(self, lower, upper) -> np.ndarray:
+        """Find the points (rows) that lie within the (half-open) box from lower to upper."""
+        lower, upper = np.asarray(lower, dtype=float), np.asarray(upper, dtype=float)
+        leaves = np.flatnonzero(np.all((self.leaf_min < upper) & (self.leaf_max > lower), axis=1))
+        rows = self.points_in(leaves)
+        positions = self.positions.view()[rows]
+        return rows[np.all((positions >= lower) & (positions < upper), axis=1)]
+
+    def query_radius(self, centre, radius) -> np.ndarray:
+        """Find the points (rows) that lie within radius of centre."""
+        centre = np.asarray(centre, dtype=float)
+        rows = self.query_box(centre - radius, centre + radius)
+        return rows[np.linalg.norm(self.positions.view()[rows] - centre, axis=1) <= radius]
+
+
+class NDTreeEngine(GPCAMInProcessEngine):
+    """
+    An adaptive engine which refines a 2^D-tree over the domain. Each time the targets of the last refinement have been
+    measured, the cell of the measurement with the largest acquisition value (scaled by its cell's volume) is divided,
+    and a random position in each of the new cells (other than the one holding that measurement) is targeted.
+    """
+
+    def __init__(self, dimensionality, parameter_bounds, hyperparameters, hyperparameter_bounds,
+                 update_radius: float = 3, **kwargs):
+        """
+
+        Parameters
+        ----------
+        update_radius
+            With incremental updates, acquisition values are only recomputed for points within this many kernel length
+            scales of new measurements (and for points whose cells have divided). All values are recomputed when the
+            hyperparameters or acquisition function change.
+        """
+        self.update_radius = update_radius
+        super(NDTreeEngine, self).__init__(dimensionality, parameter_bounds, hyperparameters, hyperparameter_bounds,
+                                           **kwargs)
+
+    def init_tree(self, lower, upper) -> LinearNDTree:
+        return LinearNDTree(lower, upper)
+
+    def reset(self):
+        parameter_bounds = np.asarray([[self.parameters[('bounds', f'axis_{i}_{edge}')]
+                                        for edge in ['min', 'max']]
+                                       for i in range(self.dimensionality)])
+
+        self.tree = self.init_tree(parameter_bounds[:, 0], parameter_bounds[:, 1])
+        # cells awaiting a measurement, as rows of (lower..., upper...)
+        self.target_queue = np.hstack([parameter_bounds[:, 0], parameter_bounds[:, 1]])[None, :]
+        # acquisition values (scaled by cell volume) of each point, and a heap of (-value, version, point) entries;
+        # entries are superseded (rather than removed) when a point's value is updated
+        self.acq_func_values = np.empty(0)
+        self._acq_func_versions = np.empty(0, dtype=int)
+        self._acq_func_heap = []
+        self._acq_func_key = None
+        self._dirty_points = []
+        super(NDTreeEngine, self).reset()
+
+    def request_targets(self, position, **kwargs):
+        if not len(self.target_queue):
+            largest_point = self.tree.positions.view()[self._pop_best_point()]
+            target_cell = self.tree.locate(largest_point)
+            # the points of the divided cell have smaller volumes now
+            self._dirty_points.append(self.tree.points_in(target_cell))
+            target_divisions = self.tree.divide(target_cell)
+            target_divisions = target_divisions[target_divisions != self.tree.locate(largest_point)[0]]
+
+            self.target_queue = np.hstack([self.tree.leaf_min[target_divisions],
+                                           self.tree.leaf_max[target_divisions]])
+
+        return list(map(tuple, np.random.uniform(self.target_queue[:, :self.dimensionality],
+                                                 self.target_queue[:, self.dimensionality:])))
+
+    def _pop_best_point(self) -> int:
+        # the point with the largest acquisition value, whose cell can still be divided
+        while self._acq_func_heap:
+            value, version, point = heapq.heappop(self._acq_func_heap)
+            if version == self._acq_func_versions[point] and \
+                    self.tree.leaf_depths[self.tree.locate(self.tree.positions[point])[0]] < self.tree.max_depth:
+                return point
+        # no point has a finite acquisition value
+        return np.random.randint(len(self.tree))
+
+    def update_measurements(self, data: Data):
+        snapshot = data.snapshot()  # consistent, read-only views; no lock or copy required
+        positions = snapshot.positions
+        scores = snapshot.scores
+        variances = snapshot.variances
+
+        told = self._told_count if data is self._told_data else 0
+        with self.model_lock.w_locked():
+            self._tell(data, snapshot)
+        measured = np.asarray(positions[told:], dtype=float).reshape(-1, self.dimensionality)
+        if not told:
+            # the data has been replaced
+            self._acq_func_key = None
+
+        # only check the last few points (2^D, a full batch of targets)
+        recent = np.asarray(positions[-2 ** self.dimensionality:], dtype=float).reshape(-1, self.dimensionality)
+        contained = np.all((recent[:, None, :] >= self.target_queue[None, :, :self.dimensionality]) &
+                           (recent[:, None, :] < self.target_queue[None, :, self.dimensionality:]), axis=2)
+        # each target cell is satisfied by the first recent measurement within it
+        satisfied = np.flatnonzero(np.any(contained, axis=0))
+        if len(satisfied):
+            first = np.argmax(contained[:, satisfied], axis=0)
+            rows = len(positions) - len(recent) + first
+            # the points of cells receiving new points may move into smaller cells
+            cells = self.tree.locate(recent[first])
+            self._dirty_points.append(self.tree.points_in(np.unique(cells[cells >= 0])))
+            count = len(self.tree)
+            self.tree.insert(recent[first], np.asarray(scores)[rows], np.asarray(variances)[rows])
+            self._dirty_points.append(np.arange(count, len(self.tree)))
+            self.target_queue = np.delete(self.target_queue, satisfied, axis=0)
+
+        # calculate acquisition function
+        with log_time('updating acq_func values', cumulative_key='updating acq_func values'):
+            self._update_acq_func_values(measured)
+
+    def _update_acq_func_values(self, measured: np.ndarray):
+        """
+        Recomputes the acquisition values of points near the measured positions (or which have moved into smaller
+        cells), or of all points if the hyperparameters or acquisition function have changed (or incremental updates
+        are disabled).
+        """
+        positions = self.tree.positions.view()
+        count = len(positions)
+        self.acq_func_values = np.append(self.acq_func_values, np.full(count - len(self.acq_func_values), np.nan))
+        self._acq_func_versions = np.append(self._acq_func_versions,
+                                            np.zeros(count - len(self._acq_func_versions), dtype=int))
+
+        # the model may be retrained concurrently (see `thread_safe`); hold it still from keying to evaluation
+        with self.model_lock.r_locked():
+            hyperparameters = np.asarray(self.optimizer.get_hyperparameters(), dtype=float)
+            key = (self.parameters['acquisition_function'], hyperparameters.tobytes())
+            # the radius is measured in length scales of the default (anisotropic) kernel
+            full_refresh = key != self._acq_func_key or not self.parameters['incremental_updates'] or \
+                len(hyperparameters) != self.dimensionality + 1
+            if full_refresh:
+                points = np.arange(count)
+            else:
+                points = np.unique(np.concatenate(self._dirty_points +
+                                                  [self._points_near(measured, hyperparameters[1:])]))
+            self._acq_func_key = key
+            self._dirty_points = []
+            if not len(points):
+                return
+
+            acquisition_function_values = self.optimizer.evaluate_acquisition_function(positions[points],
+                                                                                      acquisition_function=
+                                                                                      self.acquisition_function(
+                                                                                          self.parameters[
+                                                                                              'acquisition_function']))
+        self.acq_func_values[points] = np.ravel(acquisition_function_values) * \
+            self.tree.leaf_volumes(self.tree.locate(positions[points]))
+        self._acq_func_versions[points] += 1
+
+        # superseded entries are discarded as they're popped, but the heap is rebuilt before they accumulate
+        if full_refresh or len(self._acq_func_heap) > 2 * count:
+            points = np.arange(count)
+            self._acq_func_heap = []
+        finite = np.isfinite(self.acq_func_values[points])
+        entries = zip((-self.acq_func_values[points][finite]).tolist(),
+                      self._acq_func_versions[points][finite].tolist(), points[finite].tolist())
+        if self._acq_func_heap:
+            for entry in entries:
+                heapq.heappush(self._acq_func_heap, entry)
+        else:
+            self._acq_func_heap = list(entries)
+            heapq.heapify(self._acq_func_heap)
+
+    def _points_near(self, measured: np.ndarray, length_scales: np.ndarray) -> np.ndarray:
+        radii = np.maximum(self.update_radius * length_scales, np.finfo(float).tiny)
+        positions = self.tree.positions.view()
+        near = [np.empty(0, dtype=int)]
+        for centre in measured:
+            points = self.tree.query_box(centre - radii, centre + radii)
+            near.append(points[np.sum(((positions[points] - centre) / radii) ** 2, axis=1) <= 1])
+        return np.concatenate(near)
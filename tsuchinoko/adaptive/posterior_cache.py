@@ -0,0 +1,169 @@
+import hashlib
+import threading
+import weakref
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+DEFAULT_MAX_BYTES = 64 * 2 ** 20
+
+_caches = weakref.WeakKeyDictionary()
+
+
+def cached_posterior(gp):
+    """
+    Returns the `PosteriorEvaluationCache` serving `gp`, or `gp` itself if it has none. Either has the same
+    `posterior_mean`, `posterior_covariance` and `posterior_mean_grad` methods, so graphs and acquisition functions can
+    use this wherever they would evaluate the posterior directly.
+    """
+    return _caches.get(gp, gp)
+
+
+def grid_evaluation(gp):
+    """
+    Returns a context in which evaluations of `gp` through `cached_posterior` (in this thread) are stored for reuse.
+    Graphs evaluate the posterior over a grid within this context; elsewhere (e.g. while optimizing the acquisition
+    function) evaluations only reuse stored results, so one-off point sets don't evict the shared grid results.
+    """
+    cache = _caches.get(gp)
+    return cache.storing() if cache is not None else nullcontext()
+
+
+class PosteriorEvaluationCache:
+    """
+    Shares posterior evaluations between the graphs and acquisition functions of an engine.
+
+    Only evaluations within `storing` (see `grid_evaluation`) are stored. Other evaluations are served from stored
+    results when they match, and are otherwise passed directly to the GP; point sets whose shape matches no stored
+    result aren't hashed at all.
+
+    Results are keyed by the state of the GP (the cache version, number of observations and hyperparameters), the
+    evaluation method and its arguments, and the evaluated points. Results are held until the model changes (see
+    `invalidate`) or they are evicted; the least recently used results are evicted first once the cache holds more than
+    `max_bytes` of arrays.
+
+    Cached results are shared; callers must not modify them in-place.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+
+        Parameters
+        ----------
+        max_bytes
+            The maximum size of all cached arrays, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.gp = None
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.nbytes = 0
+        self._version = 0
+        self._entries = OrderedDict()
+        self._shapes = Counter()  # the shapes of the stored point sets
+        self._storing = threading.local()
+        self._lock = threading.Lock()
+
+    def bind(self, gp):
+        """
+        Serves `gp` from this cache, discarding results evaluated for any previous GP.
+        """
+        with self._lock:
+            if self.gp is not None:
+                _caches.pop(self.gp, None)
+            self.gp = gp
+            _caches[gp] = self
+        self.invalidate()
+
+    def invalidate(self):
+        """
+        Discards all cached results. This should be called whenever the GP's data or hyperparameters change.
+        """
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+            self._shapes.clear()
+            self.nbytes = 0
+
+    @contextmanager
+    def storing(self):
+        """
+        Stores the results of evaluations made in this thread within this context.
+        """
+        depth = getattr(self._storing, 'depth', 0)
+        self._storing.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._storing.depth = depth
+
+    def posterior_mean(self, x, **kwargs) -> dict:
+        return self._evaluate('posterior_mean', x, kwargs)
+
+    def posterior_covariance(self, x, **kwargs) -> dict:
+        return self._evaluate('posterior_covariance', x, kwargs)
+
+    def posterior_mean_grad(self, x, **kwargs) -> dict:
+        return self._evaluate('posterior_mean_grad', x, kwargs)
+
+    def _evaluate(self, method: str, x, kwargs: dict) -> dict:
+        x = np.asarray(x)
+        storing = getattr(self._storing, 'depth', 0) > 0
+        with self._lock:
+            version = self._version
+            bypass = not storing and x.shape not in self._shapes
+            if bypass:
+                self.bypassed += 1
+        if bypass:
+            return getattr(self.gp, method)(x, **kwargs)
+
+        key = (version, *self._gp_state(), method, self._digest(x), repr(sorted(kwargs.items())))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        result = getattr(self.gp, method)(x, **kwargs)
+        if storing:
+            self._store(key, result)
+        return result
+
+    def _gp_state(self):
+        y_data = getattr(self.gp, 'y_data', None)
+        try:
+            hyperparameters = np.asarray(self.gp.get_hyperparameters()).tobytes()
+        except Exception:  # the GP is not initialized
+            hyperparameters = None
+        return (len(y_data) if y_data is not None else None), hyperparameters
+
+    @staticmethod
+    def _digest(x: np.ndarray):
+        return x.shape, x.dtype.str, hashlib.blake2b(np.ascontiguousarray(x).data, digest_size=16).digest()
+
+    def _store(self, key, result: dict):
+        nbytes = sum(value.nbytes for value in result.values() if isinstance(value, np.ndarray))
+        if nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            if key[0] != self._version or key in self._entries:
+                return  # the model changed while evaluating; don't keep the stale result
+            self._entries[key] = result, nbytes
+            self._shapes[self._shape(key)] += 1
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                evicted_key, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self._shapes[self._shape(evicted_key)] -= 1
+                if not self._shapes[self._shape(evicted_key)]:
+                    del self._shapes[self._shape(evicted_key)]
+                self.nbytes -= evicted_nbytes
+
+    @staticmethod
+    def _shape(key) -> tuple:
+        return key[4][0]  # the shape in the digest of the points
@@ -1,11 +1,9 @@
 import time
-from typing import List
 
 import numpy as np
 
 from tsuchinoko.adaptive import Data
-from tsuchinoko.adaptive.gpCAM_in_process import GPCAMInProcessEngine, acquisition_functions
-from tsuchinoko.utils.logging import log_time
+from tsuchinoko.adaptive.ndtree import LinearNDTree, NDTreeEngine, MAX_DEPTH
 
 
 class Point:
@@ -253,123 +251,108 @@ class QuadTree:
         for div in self.divisions:
             yield from div.children_points
 
-class QuadTreeEngine(GPCAMInProcessEngine):
+# Morton (Z-order) codes interleave the bits of integer cell coordinates: x in the even bits and y in the odd bits
+_MORTON_MASKS = [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                 (2, 0x3333333333333333), (1, 0x5555555555555555)]
+# the same steps in reverse, each shifting back and masking to the previous step's spread
+_MORTON_COMPACT_MASKS = [(1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                         (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)]
 
-    def __init__(self, parameter_bounds, hyperparameters, hyperparameter_bounds, **kwargs):
-        super(QuadTreeEngine, self).__init__(2, parameter_bounds, hyperparameters, hyperparameter_bounds, **kwargs)
 
-    def reset(self):
-        parameter_bounds = np.asarray([[self.parameters[('bounds', f'axis_{i}_{edge}')]
-                                        for edge in ['min', 'max']]
-                                       for i in range(self.dimensionality)])
+def morton_encode(ix: np.ndarray, iy: np.ndarray) -> np.ndarray:
+    """Interleaves the bits of integer cell coordinates (of at most 32 bits) into Morton codes."""
 
-        cx = (parameter_bounds[0][1] + parameter_bounds[0][0]) / 2
-        cy = (parameter_bounds[1][1] + parameter_bounds[1][0]) / 2
+    def spread(v):
+        v = np.asarray(v, dtype=np.uint64) & np.uint64(0xFFFFFFFF)
+        for shift, mask in _MORTON_MASKS:
+            v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+        return v
 
-        width = parameter_bounds[0][1] - parameter_bounds[0][0]
-        height = parameter_bounds[1][1] - parameter_bounds[1][0]
+    return spread(ix) | (spread(iy) << np.uint64(1))
 
-        domain = Rect(cx, cy, width, height)
-        self.quadtree = QuadTree(domain)
-        self.target_queue: List[QuadTree] = [self.quadtree]
-        super(QuadTreeEngine, self).reset()
-        self._invalidate_all = False
 
-        self._update_counter = 0
+def morton_decode(codes: np.ndarray):
+    """Separates Morton codes back into integer cell coordinates."""
 
-    def request_targets(self, position):
-        if not self.target_queue:
-            points = list(self.quadtree.children_points)
-            acq_func_values = [point.acq_func_value for point in points]  # TODO: avoid list-comp
-            # n_largest = np.argpartition(acq_func_values, -n)[-n:]
-            largest_point = points[np.argmin(acq_func_values)]  # TODO: do nones affect this?
-            target_quad = self.quadtree.smallest_containing_quad(largest_point)
-            target_divisions = target_quad.divide()
-            target_divisions = [div for div in target_divisions if not div.boundary.contains(largest_point)]
+    def compact(v):
+        v = v & np.uint64(_MORTON_MASKS[-1][1])
+        for shift, mask in _MORTON_COMPACT_MASKS:
+            v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+        return v
 
-            self.target_queue = target_divisions
+    codes = np.asarray(codes, dtype=np.uint64)
+    return compact(codes), compact(codes >> np.uint64(1))
 
-        return [(np.random.uniform(div.boundary.west_edge, div.boundary.east_edge),
-                 np.random.uniform(div.boundary.south_edge, div.boundary.north_edge)) for div in self.target_queue]
 
-    def update_measurements(self, data: Data):
-        with data.r_lock():  # quickly grab values within lock before passing to optimizer
-            positions = data.positions.copy()
-            scores = data.scores.copy()
-            variances = data.variances.copy()
+class LinearQuadTree(LinearNDTree):
+    """A pointerless (linear) quadtree stored in NumPy arrays; see LinearNDTree.
 
-        self.optimizer.tell(positions, scores, variances)
+    This is the 2-D case over a Rect, with Morton codes computed by bit spreading.
 
-        for target_division in self.target_queue:
-            for i, position in enumerate(positions[-4:]):  # only check last 3 points (dim**2 - 1)
-                if target_division.boundary.contains(Point(*position)):
-                    self.quadtree.insert(Point(*position, scores[-i-1], variances[-i-1]))
-                    self.target_queue.remove(target_division)
-                    break
+    """
 
-        # TODO: this could be limited in range to only points nearby updated points
+    def __init__(self, boundary: Rect, max_points=4, max_depth=MAX_DEPTH):
+        self.boundary = boundary
+        super().__init__([boundary.west_edge, boundary.north_edge], [boundary.east_edge, boundary.south_edge],
+                         max_points, max_depth)
 
+    def _encode_cells(self, cells: np.ndarray) -> np.ndarray:
+        return morton_encode(cells[:, 0], cells[:, 1])
 
+    def _decode_codes(self, codes: np.ndarray) -> np.ndarray:
+        return np.stack(morton_decode(codes), axis=1)
 
-        positions = [(point.x, point.y) for point in self.quadtree.children_points]
+    def leaf_areas(self, leaves=None) -> np.ndarray:
+        return self.leaf_volumes(leaves)
 
-        # calculate acquisition function
-        with log_time('updating acq_func values', cumulative_key='updating acq_func values'):
+    def query(self, boundary: Rect) -> np.ndarray:
+        """Find the points (rows) that lie within boundary."""
+        return self.query_box([boundary.west_edge, boundary.north_edge], [boundary.east_edge, boundary.south_edge])
 
-            acquisition_function_values = self.optimizer.evaluate_acquisition_function(positions,
-                                                                                      acquisition_function=
-                                                                                      acquisition_functions[
-                                                                                          self.parameters[
-                                                                                              'acquisition_function']])
+    def draw(self, ax, c='k', lw=1, **kwargs):
+        """Draw the leaves on Matplotlib Axes ax."""
+        (x1, y1), (x2, y2) = self.leaf_min.T, self.leaf_max.T
+        gaps = np.full(self.leaf_count, np.nan)
+        ax.plot(np.stack([x1, x2, x2, x1, x1, gaps], axis=1).ravel(),
+                np.stack([y1, y1, y2, y2, y1, gaps], axis=1).ravel(), c=c, lw=lw, **kwargs)
 
-        for i, point in enumerate(self.quadtree.children_points):
-            point.acq_func_value = acquisition_function_values[i]*self.quadtree.smallest_containing_quad(point).boundary.area
 
-        if not len(data)%100:
-            import matplotlib.pyplot as plt
+class QuadTreeEngine(NDTreeEngine):
 
-            DPI = 72
-            # np.random.seed(60)
+    def __init__(self, parameter_bounds, hyperparameters, hyperparameter_bounds, update_radius: float = 3, **kwargs):
+        super(QuadTreeEngine, self).__init__(2, parameter_bounds, hyperparameters, hyperparameter_bounds,
+                                             update_radius=update_radius, **kwargs)
+
+    def init_tree(self, lower, upper) -> LinearQuadTree:
+        (x_min, y_min), (x_max, y_max) = lower, upper
+        return LinearQuadTree(Rect((x_min + x_max) / 2, (y_min + y_max) / 2, x_max - x_min, y_max - y_min))
+
+    @property
+    def quadtree(self) -> LinearQuadTree:
+        return self.tree
 
-            # width, height = image.shape[1], image.shape[0]
+    def reset(self):
+        super(QuadTreeEngine, self).reset()
+        self._invalidate_all = False
 
-            N = 15000
-            # coords = np.random.randn(N, 2) * height / 3 + (width / 2, height / 2)
-            # values = [bilinear_sample(pos) for pos in coords]
-            # points = [Point(*coord, payload=value) for coord, value in zip(coords, values)]
+        self._update_counter = 0
 
-            # domain = Rect(width / 2, height / 2, width, height)
-            # qtree = QuadTree(domain, 3)
-            # for point in points:
-            #     qtree.insert(point)
+    def update_measurements(self, data: Data):
+        super(QuadTreeEngine, self).update_measurements(data)
 
-            # print('Number of points in the domain =', len(qtree))
+        if not len(data)%100:
+            import matplotlib.pyplot as plt
+
+            DPI = 72
 
             fig = plt.figure(figsize=(700 / DPI, 500 / DPI), dpi=DPI)
             ax = plt.subplot()
-            # ax.set_xlim(0, width)
-            # ax.set_ylim(0, height)
             self.quadtree.draw(ax)
 
-            points = list(self.quadtree.children_points)
-            ax.scatter([p.x for p in points], [p.y for p in points], s=400, c=[p.value for p in points], cmap='gray')
-            # ax.set_xticks([])
-            # ax.set_yticks([])
-
-            # centre, radius = (width / 2, height / 2), 120
-            # found_points = []
-            # qtree.query_radius(centre, radius, found_points)
-            # print('Number of found points =', len(found_points))
-
-            # ax.scatter([p.x for p in found_points], [p.y for p in found_points],
-            #            facecolors='none', edgecolors='r', s=32)
-
-            # circle = plt.Circle(centre, radius, ec='r')
-            # Rect(*centre, 2 * radius, 2 * radius).draw(ax, c='r')
+            points = self.quadtree.positions.view()
+            ax.scatter(points[:, 0], points[:, 1], s=400, c=self.quadtree.values.view(), cmap='gray')
 
-            # ax.invert_yaxis()
             plt.tight_layout()
-            # plt.savefig('search-quadtree-circle.png')#, DPI=72)
             plt.show()
 
     def update_metrics(self, data: Data):
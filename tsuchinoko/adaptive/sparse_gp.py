@@ -0,0 +1,320 @@
+import numpy as np
+from loguru import logger
+from scipy.linalg import cholesky, solve_triangular, LinAlgError
+from scipy.optimize import minimize, differential_evolution
+from scipy.spatial.distance import cdist
+
+from .batch import mean_variance_acquisition_functions, local_penalization
+from .gpCAM_in_process import GPCAMInProcessEngine
+from ..graphs.common import GPCamPosteriorCovariance
+from ..utils.buffers import ColumnBuffer
+
+JITTER = 1e-8
+CHUNK_SIZE = 4096
+
+
+def matern_kernel(x1, x2, hyperparameters):
+    """
+    An anisotropic Matern kernel of first-order differentiability; the same as gpCAM's default kernel. The
+    hyperparameters are the signal variance followed by one length scale per dimension.
+    """
+    distance = cdist(x1 / hyperparameters[1:], x2 / hyperparameters[1:])
+    return hyperparameters[0] * (1 + np.sqrt(3) * distance) * np.exp(-np.sqrt(3) * distance)
+
+
+class SparseGPOptimizer:
+    """
+    A sparse (inducing point) Gaussian process, with the parts of gpCAM's `GPOptimizer` interface used by
+    `GPCAMInProcessEngine` and its graphs.
+
+    The posterior is the deterministic training conditional (DTC) approximation, conditioned on a set of at most
+    `max_inducing_points` inducing points. Inducing points are chosen from the measured positions as they are told: a
+    position becomes an inducing point if it is more than `inducing_distance` length scales from every existing one.
+    The sufficient statistics of the data are accumulated incrementally, so that telling k new points costs
+    O(k·M² + M³), and adding an inducing point costs O(N·M). Changing hyperparameters costs O(N·M²).
+
+    Hyperparameters are trained by maximizing the variational (Titsias) bound on the evidence over a random subset of
+    at most `max_training_points` measurements.
+    """
+
+    def __init__(self, x_data=None, y_data=None, init_hyperparameters=None, noise_variances=None,
+                 max_inducing_points: int = 500, inducing_distance: float = .5, max_training_points: int = 2000,
+                 compute_device=None):
+        self.hyperparameters = np.asarray(init_hyperparameters, dtype=float)
+        self.max_inducing_points = max_inducing_points
+        self.inducing_distance = inducing_distance
+        self.max_training_points = max_training_points
+        self._clear()
+        if x_data is not None:
+            self.tell(x_data, y_data, noise_variances, append=False)
+
+    def _clear(self):
+        self._x = ColumnBuffer()
+        self._y = ColumnBuffer()
+        self._v = ColumnBuffer()
+        self.inducing_points = np.empty((0, len(self.hyperparameters) - 1))
+        self._A = np.empty((0, 0))  # sum of k_i k_i^T / v_i over measurements, where k_i = k(Z, x_i)
+        self._b = np.empty(0)  # sum of k_i y_i / v_i
+        self._c = np.empty(0)  # sum of k_i / v_i
+        self._weights = None
+
+    @property
+    def gp(self) -> bool:
+        return bool(len(self._y))
+
+    @property
+    def x_data(self) -> np.ndarray:
+        return self._x.view()
+
+    @property
+    def points(self) -> np.ndarray:
+        return self.x_data
+
+    @property
+    def y_data(self) -> np.ndarray:
+        return self._y.view()
+
+    @property
+    def noise_variances(self) -> np.ndarray:
+        return self._v.view()
+
+    def get_hyperparameters(self) -> np.ndarray:
+        return self.hyperparameters
+
+    def set_hyperparameters(self, hyperparameters):
+        self.hyperparameters = np.asarray(hyperparameters, dtype=float)
+        self._accumulate()
+
+    def tell(self, x, y, noise_variances=None, append=True, gp_rank_n_update=None):
+        x = np.asarray(x, dtype=float).reshape(-1, len(self.hyperparameters) - 1)
+        y = np.asarray(y, dtype=float).ravel()
+        if noise_variances is None:
+            noise_variances = np.full(len(y), abs(np.mean(y)) / 100.0)
+        noise_variances = np.clip(np.asarray(noise_variances, dtype=float).ravel(), np.finfo(float).tiny, None)
+
+        if not append:
+            self._clear()
+        old_inducing_count = len(self.inducing_points)
+        self._x.extend(x)
+        self._y.extend(y)
+        self._v.extend(noise_variances)
+
+        # statistics of the new measurements over the existing inducing points
+        if old_inducing_count:
+            self._add_statistics(self.inducing_points, x, y, noise_variances)
+
+        # grow the inducing set from the new measurements, then add all measurements' statistics for the new points
+        self._grow_inducing_points(x)
+        if len(self.inducing_points) > old_inducing_count:
+            self._extend_statistics(old_inducing_count)
+
+        self._factorize()
+
+    def _grow_inducing_points(self, x):
+        scale = self.hyperparameters[1:]
+        inducing_points = list(self.inducing_points)
+        for position in x:
+            if len(inducing_points) >= self.max_inducing_points:
+                break
+            if not inducing_points or \
+                    np.min(np.linalg.norm((np.asarray(inducing_points) - position) / scale, axis=1)) > self.inducing_distance:
+                inducing_points.append(position)
+        self.inducing_points = np.asarray(inducing_points).reshape(-1, len(scale))
+
+    def _chunks(self):
+        x, y, v = self.x_data, self.y_data, self.noise_variances
+        for start in range(0, len(y), CHUNK_SIZE):
+            yield x[start:start + CHUNK_SIZE], y[start:start + CHUNK_SIZE], v[start:start + CHUNK_SIZE]
+
+    def _add_statistics(self, z, x, y, v):
+        K = matern_kernel(z, x, self.hyperparameters)
+        self._A += (K / v) @ K.T
+        self._b += K @ (y / v)
+        self._c += K @ (1 / v)
+
+    def _extend_statistics(self, old_count: int):
+        # adds rows/columns for the inducing points at and after old_count, over all measurements
+        count = len(self.inducing_points)
+        A = np.zeros((count, count))
+        A[:old_count, :old_count] = self._A
+        b = np.zeros(count)
+        b[:old_count] = self._b
+        c = np.zeros(count)
+        c[:old_count] = self._c
+        for x, y, v in self._chunks():
+            K = matern_kernel(self.inducing_points, x, self.hyperparameters)
+            K_new = K[old_count:]
+            A[old_count:, :] += (K_new / v) @ K.T
+            b[old_count:] += K_new @ (y / v)
+            c[old_count:] += K_new @ (1 / v)
+        A[:old_count, old_count:] = A[old_count:, :old_count].T
+        self._A, self._b, self._c = A, b, c
+
+    def _accumulate(self):
+        # recomputes the statistics from scratch (i.e. for new hyperparameters)
+        count = len(self.inducing_points)
+        self._A, self._b, self._c = np.zeros((count, count)), np.zeros(count), np.zeros(count)
+        for x, y, v in self._chunks():
+            self._add_statistics(self.inducing_points, x, y, v)
+        self._factorize()
+
+    def _factorize(self):
+        if not self.gp:
+            return
+        Kmm = matern_kernel(self.inducing_points, self.inducing_points, self.hyperparameters)
+        jitter = JITTER * self.hyperparameters[0] * np.eye(len(Kmm))
+        self._L_mm = cholesky(Kmm + jitter, lower=True)
+        self._L_sigma = cholesky(Kmm + self._A + jitter, lower=True)
+        self.prior_mean = np.mean(self.y_data)
+        rhs = self._b - self.prior_mean * self._c
+        self._weights = solve_triangular(self._L_sigma.T, solve_triangular(self._L_sigma, rhs, lower=True))
+
+    def posterior_mean(self, x_pred, x_out=None) -> dict:
+        x_pred = np.asarray(x_pred, dtype=float)
+        mean = self.prior_mean + matern_kernel(x_pred, self.inducing_points, self.hyperparameters) @ self._weights
+        return {'x': x_pred, 'm(x)': mean, 'f(x)': mean}
+
+    def posterior_covariance(self, x_pred, x_out=None, variance_only=False, add_noise=False) -> dict:
+        x_pred = np.asarray(x_pred, dtype=float)
+        K_mx = matern_kernel(self.inducing_points, x_pred, self.hyperparameters)
+        V_mm = solve_triangular(self._L_mm, K_mx, lower=True)
+        V_sigma = solve_triangular(self._L_sigma, K_mx, lower=True)
+
+        # DTC: k(x, x) - Q(x, x) + K(x, Z) (K(Z, Z) + A)^-1 K(Z, x)
+        variance = np.clip(self.hyperparameters[0] - np.sum(V_mm ** 2, axis=0) + np.sum(V_sigma ** 2, axis=0), 0, None)
+        covariance = None
+        if not variance_only:
+            covariance = matern_kernel(x_pred, x_pred, self.hyperparameters) - V_mm.T @ V_mm + V_sigma.T @ V_sigma
+        return {'x': x_pred, 'v(x)': variance, 'S': covariance}
+
+    def posterior_mean_grad(self, x_pred, x_out=None, direction=None) -> dict:
+        x_pred = np.asarray(x_pred, dtype=float)
+        scale = self.hyperparameters[1:]
+        distance = cdist(x_pred / scale, self.inducing_points / scale)
+        dk_dd = -3 * self.hyperparameters[0] * np.exp(-np.sqrt(3) * distance)
+        gradient = np.stack([(dk_dd * np.subtract.outer(x_pred[:, i], self.inducing_points[:, i]) / scale[i] ** 2)
+                             @ self._weights for i in range(len(scale))], axis=1)
+        return {'x': x_pred, 'dm/dx': gradient, 'df/dx': gradient}
+
+    def evaluate_acquisition_function(self, x, x_out=None, acquisition_function='variance', origin=None, args=None):
+        x = np.atleast_2d(np.asarray(x, dtype=float))
+        if callable(acquisition_function):
+            return np.asarray(acquisition_function(x, self))
+        elif acquisition_function in mean_variance_acquisition_functions:
+            mean = self.posterior_mean(x)['m(x)']
+            variance = self.posterior_covariance(x, variance_only=True)['v(x)']
+            return mean_variance_acquisition_functions[acquisition_function](mean, variance)
+        elif acquisition_function == 'gradient':
+            gradient = self.posterior_mean_grad(x)['dm/dx']
+            return np.linalg.norm(gradient, axis=1) * np.sqrt(self.posterior_covariance(x, variance_only=True)['v(x)'])
+        raise ValueError(f'The {acquisition_function} acquisition function is not supported by the sparse GP.')
+
+    def ask(self, input_set, x_out=None, acquisition_function='variance', position=None, n=1, method='global',
+            pop_size=20, max_iter=20, tol=1e-6, x0=None, **kwargs) -> dict:
+        """
+        Returns the acquisition function optimum. With `n` > 1, a batch of diverse targets is selected from the optimum
+        and a set of random candidates by local penalization (see `batch.local_penalization`).
+        """
+        bounds = np.asarray(input_set, dtype=float)
+
+        def objective(x):
+            # vectorized: x has shape (D, S)
+            return -self.evaluate_acquisition_function(np.asarray(x).T.reshape(-1, len(bounds)),
+                                                       acquisition_function=acquisition_function, origin=position)
+
+        if method == 'local' and x0 is not None:
+            result = minimize(lambda x: objective(x)[0], np.clip(np.ravel(x0), bounds[:, 0], bounds[:, 1]),
+                              method='L-BFGS-B', bounds=bounds, options={'ftol': tol})
+        else:
+            result = differential_evolution(objective, bounds, popsize=pop_size, maxiter=max_iter, tol=tol,
+                                            vectorized=True, updating='deferred', polish=False)
+        targets = np.atleast_2d(result.x)
+
+        if n > 1:
+            candidates = np.vstack([targets, np.random.uniform(bounds[:, 0], bounds[:, 1],
+                                                               (max(pop_size, 32 * n), len(bounds)))])
+            mean = self.posterior_mean(candidates)['m(x)']
+            variance = self.posterior_covariance(candidates, variance_only=True)['v(x)']
+            targets = candidates[local_penalization(candidates, -objective(candidates.T), mean, variance, n)]
+        return {'x': targets, 'f(x)': -objective(targets.T)}
+
+    def train(self, hyperparameter_bounds=None, init_hyperparameters=None, method='global', pop_size=20,
+              tolerance=1e-4, max_iter=120, **kwargs):
+        bounds = np.asarray(hyperparameter_bounds, dtype=float)
+        x, y, v = self.x_data, self.y_data, self.noise_variances
+        if len(y) > self.max_training_points:
+            subset = np.random.choice(len(y), self.max_training_points, replace=False)
+            x, y, v = x[subset], y[subset], v[subset]
+        z = self.inducing_points if len(self.inducing_points) else x[:self.max_inducing_points]
+
+        def objective(hyperparameters):
+            return self.negative_log_evidence(hyperparameters, x, y, v, z)
+
+        if method == 'global':
+            result = differential_evolution(objective, bounds, popsize=pop_size, maxiter=max_iter, tol=tolerance)
+        else:
+            start = self.hyperparameters if init_hyperparameters is None else init_hyperparameters
+            result = minimize(objective, np.clip(start, bounds[:, 0], bounds[:, 1]), method='L-BFGS-B', bounds=bounds,
+                              options={'maxiter': max_iter})
+        logger.info(f'Sparse GP training ({method}) finished with negative log evidence {result.fun}')
+        self.set_hyperparameters(result.x)
+
+    @staticmethod
+    def negative_log_evidence(hyperparameters, x, y, v, z) -> float:
+        """
+        The negative of the variational (Titsias) lower bound on the log evidence, with inducing points `z`.
+        """
+        try:
+            Kmm = matern_kernel(z, z, hyperparameters)
+            L = cholesky(Kmm + JITTER * hyperparameters[0] * np.eye(len(z)), lower=True)
+            sqrt_v = np.sqrt(v)
+            Q = solve_triangular(L, matern_kernel(z, x, hyperparameters), lower=True)
+            A = Q / sqrt_v
+            L_B = cholesky(np.eye(len(z)) + A @ A.T, lower=True)
+        except (LinAlgError, ValueError):
+            return 1e20
+        r = (y - np.mean(y)) / sqrt_v
+        c = solve_triangular(L_B, A @ r, lower=True)
+
+        log_det = 2 * np.sum(np.log(np.diag(L_B))) + np.sum(np.log(v))
+        quadratic = r @ r - c @ c
+        trace = np.sum((hyperparameters[0] - np.sum(Q ** 2, axis=0)) / v)
+        return .5 * (log_det + quadratic + len(y) * np.log(2 * np.pi) + trace)
+
+
+class SparseGPEngine(GPCAMInProcessEngine):
+    """
+    An adaptive engine for very large campaigns, backed by a sparse (inducing point) Gaussian process. This is a drop-in
+    replacement for `GPCAMInProcessEngine`, with the same parameters and graphs (other than the posterior covariance
+    between all measurements, which grows as N²).
+
+    The `shannon_ig` and `covariance` acquisition functions, which need the joint covariance of the evaluated points,
+    aren't offered.
+    """
+    unsupported_acquisition_functions = ('shannon_ig', 'covariance')
+
+    def __init__(self, dimensionality, parameter_bounds, hyperparameters, hyperparameter_bounds,
+                 max_inducing_points: int = 500, inducing_distance: float = .5, max_training_points: int = 2000,
+                 gp_opts: dict = None, **kwargs):
+        """
+
+        Parameters
+        ----------
+        max_inducing_points
+            The maximum number of inducing points. Cost scales as O(N·M²) in this number.
+        inducing_distance
+            The minimum distance between inducing points, in length scales.
+        max_training_points
+            The maximum number of measurements used to train hyperparameters.
+        """
+        gp_opts = dict(gp_opts or {}, max_inducing_points=max_inducing_points, inducing_distance=inducing_distance,
+                       max_training_points=max_training_points)
+        super().__init__(dimensionality, parameter_bounds, hyperparameters, hyperparameter_bounds, gp_opts=gp_opts,
+                         **kwargs)
+        self.graphs = [graph for graph in self.graphs if not isinstance(graph, GPCamPosteriorCovariance)]
+
+    def init_optimizer(self):
+        hyperparameters = np.asarray([self.parameters[('hyperparameters', f'hyperparameter_{i}')]
+                                      for i in range(self.num_hyperparameters)])
+
+        self.optimizer = SparseGPOptimizer(init_hyperparameters=hyperparameters, **self.gp_opts)
@@ -1,10 +1,14 @@
+import asyncio
 import os
 import threading
 import time
 from asyncio import events
+from collections import deque
+from contextlib import nullcontext
 from enum import Enum, auto
-from pickle import UnpicklingError
+from pickle import UnpicklingError, PicklingError
 from queue import Queue
+from typing import List, Dict
 from appdirs import user_state_dir
 
 from loguru import logger
@@ -14,9 +18,11 @@ from .messages import FullDataRequest, FullDataResponse, PartialDataRequest, Par
     UnknownResponse, PauseRequest, StateRequest, GetParametersRequest, SetParameterRequest, GetParametersResponse, \
     SetParameterResponse, StopRequest, StateResponse, MeasureRequest, \
     MeasureResponse, ConnectRequest, ConnectResponse, ExceptionResponse, PushDataRequest, PushDataResponse, \
-    GraphsResponse, ReplayResponse
+    GraphsResponse, ReplayResponse, PublishedDataResponse, PublishedStateResponse, HeartbeatRequest, HeartbeatResponse
+from .serialization import encode_message, decode_message, is_pickled, SerializationError
 from ..adaptive import Engine as AdaptiveEngine, Data
 from ..execution import Engine as ExecutionEngine
+from ..execution.scheduling import MotionScheduler
 from ..utils.logging import log_time
 
 user_state_dir = user_state_dir('tsuchinoko','camera')
@@ -35,19 +41,48 @@ class CoreState(Enum):
 
 
 SLEEP_FOR_FRESH_DATA_TIME = .1
+SESSION_TIMEOUT = 10  # seconds without requests after which a client's session (and control) lapses
+HEARTBEAT_INTERVAL = SESSION_TIMEOUT / 4  # seconds after which an otherwise idle client sends a HeartbeatRequest
+QUEUED_RESPONSE_RETRY_TIME = .01
 
 
 class Core:
     def __init__(self,
                  execution_engine: ExecutionEngine = None,
                  adaptive_engine: AdaptiveEngine = None,
-                 compute_metrics: bool = True):
+                 compute_metrics: bool = True,
+                 pipelined: bool = False,
+                 target_scheduler: MotionScheduler = None):
+        """
+
+        Parameters
+        ----------
+        execution_engine
+            The engine responsible for measuring targets.
+        adaptive_engine
+            The engine responsible for choosing targets.
+        compute_metrics
+            Compute metrics (graphs) every iteration.
+        pipelined
+            Run metrics and training on a background thread, so that new targets are dispatched to the execution engine
+            while the previous measurements are still being processed. Calls into the adaptive engine are serialized,
+            so engines need not be thread-safe; for engines that are (`thread_safe`), metrics and training run
+            concurrently with requesting targets.
+        target_scheduler
+            Reorders each batch of targets (i.e. to minimize travel time) before it is sent to the execution engine.
+        """
         self.execution_engine = execution_engine
         self.adaptive_engine = adaptive_engine
+        self.pipelined = pipelined
+        self.target_scheduler = target_scheduler
 
         self.iteration = 0
 
         self._state = CoreState.Inactive
+        # state changes wake the experiment thread (through the condition) and the server loop (through the event)
+        self._state_changed = threading.Condition()
+        self._state_event = None
+        self._loop = None
         self._exception_queue = Queue()
         self._forced_position_queue = Queue()
         self._forced_measurement_queue = Queue()
@@ -65,6 +100,13 @@ class Core:
 
         self.experiment_thread = None
 
+        # serializes calls into the adaptive engine between the experiment thread and the background stage
+        self._engine_lock = threading.RLock()
+        # background (pipelined) stage; work is coalesced so that only the latest data is processed
+        self._background_lock = threading.Lock()
+        self._background_thread = None
+        self._background_pending = None
+
     @property
     def state(self):
         return self._state
@@ -72,7 +114,22 @@ class Core:
     @state.setter
     def state(self, value):
         logger.info(f'Changing core state to {value}')
-        self._state = value
+        with self._state_changed:
+            self._state = value
+            self._state_changed.notify_all()
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._state_event.set)
+        if self.execution_engine and hasattr(self.execution_engine, 'notify_measurements'):
+            # interrupt any wait for measurements, so that the experiment thread sees the change
+            self.execution_engine.notify_measurements()
+        self.publish_state()
+
+    def wait_for_state(self, *states: CoreState, timeout: float = None) -> bool:
+        """
+        Blocks the calling thread until the core is in one of `states`, or until `timeout` elapses.
+        """
+        with self._state_changed:
+            return self._state_changed.wait_for(lambda: self._state in states, timeout)
 
     def set_execution_engine(self, engine: ExecutionEngine):
         self.execution_engine = engine
@@ -94,27 +151,29 @@ class Core:
                 events.set_event_loop(None)
                 loop.close()
 
-    async def _main(self, min_response_sleep=.1):
+    async def _main(self):
+        self._state_event = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+
         while self.state != CoreState.Exiting:
+            self._state_event.clear()
 
             if self.state == CoreState.Running:
                 pass
-                # await sleep(min_response_sleep)  # short-circuit case
             elif self.state == CoreState.Starting:
                 if not len(self.data):
                     self.data = Data(dimensionality=self.adaptive_engine.dimensionality)
-                self.adaptive_engine.reset()
+                with self._engine_lock:
+                    self.adaptive_engine.reset()
                 self.experiment_thread = threading.Thread(target=self.experiment_loop, args=())  # must hold ref
                 self.experiment_thread.start()
                 self.state = CoreState.Running
 
             elif self.state == CoreState.Inactive:
                 pass
-                # await sleep(min_response_sleep)
 
             elif self.state == CoreState.Paused:
                 pass
-                # await sleep(min_response_sleep)
 
             elif self.state == CoreState.Pausing:
                 self.state = CoreState.Paused
@@ -125,7 +184,6 @@ class Core:
             elif self.state == CoreState.Stopping:
                 self.state = CoreState.Inactive
                 self.data = Data()
-                # await sleep(min_response_sleep)
 
             if self.state not in [CoreState.Stopping, CoreState.Exiting, CoreState.Resuming, CoreState.Restarting]:
                 await self.notify_clients()
@@ -154,7 +212,7 @@ class Core:
             elif self.state in [CoreState.Stopping, CoreState.Inactive, CoreState.Exiting]:
                 return
             else:
-                time.sleep(.1)
+                self.wait_for_state(CoreState.Running, CoreState.Stopping, CoreState.Inactive, CoreState.Exiting)
 
     def experiment_iteration(self):
         with self.data.iteration():
@@ -166,8 +224,11 @@ class Core:
                         position = [0] * self.data.dimensionality
                     position = tuple(position)
                 if self._forced_position_queue.empty():
-                    with log_time('getting targets', cumulative_key='getting targets'):
+                    with log_time('getting targets', cumulative_key='getting targets'), self._engine_lock:
                         targets = self.adaptive_engine.request_targets(position)
+                    if self.target_scheduler:
+                        with log_time('scheduling targets', cumulative_key='scheduling targets'):
+                            targets = self.target_scheduler.schedule(position, targets)
                     logger.info(f'targets: {targets}')
                 else:
                     targets = [self._forced_position_queue.get()]
@@ -184,22 +245,88 @@ class Core:
                 new_measurements = [self._forced_measurement_queue.get()]
             if len(new_measurements):
                 self._has_fresh_data = True
+                if self.target_scheduler:
+                    self.target_scheduler.observe(new_measurements)
                 with log_time('stashing new measurements', cumulative_key='injecting new measurements'):
                     self.data.inject_new(new_measurements)
-                with log_time('updating engine with new measurements', cumulative_key='updating engine with new measurements'):
+                self.publish_data()
+                with log_time('updating engine with new measurements', cumulative_key='updating engine with new measurements'), self._engine_lock:
                     self.adaptive_engine.update_measurements(self.data)
-                if self.compute_metrics or len(self.data) in self.compute_metrics_at:
+                compute_metrics = self.compute_metrics or len(self.data) in self.compute_metrics_at
+                if self.pipelined:
+                    # metrics and training overlap with measuring the next targets
+                    self.submit_background(self.data, compute_metrics)
+                elif compute_metrics:
                     with log_time('updating metrics', cumulative_key='updating metrics'):
                         self.adaptive_engine.update_metrics(self.data)
+                    self.publish_data()
             else:
-                time.sleep(SLEEP_FOR_FRESH_DATA_TIME)
-            if self._has_fresh_data:
+                # wakes as soon as the execution engine has new measurements, or the state changes
+                self.execution_engine.wait_for_measurements(SLEEP_FOR_FRESH_DATA_TIME)
+            if not self._has_fresh_data:
+                logger.info('Current data is stale. Waiting for an update with fresh data.')
+            elif not self.pipelined:  # otherwise, training runs in the background stage
                 with log_time('training', cumulative_key='training'):
                     self.adaptive_engine.train()
-            else:
-                logger.info('Current data is stale. Waiting for an update with fresh data.')
+
+    def submit_background(self, data: Data, compute_metrics: bool):
+        """
+        Queues metrics and training on `data` for the background stage. If the stage is busy, the work is coalesced:
+        only the most recently submitted data is processed next, and work for superseded versions is dropped.
+        """
+        with self._background_lock:
+            if self._background_pending:
+                # a queued request to compute metrics isn't lost when superseded by one that doesn't
+                compute_metrics = compute_metrics or self._background_pending[1]
+            self._background_pending = (data, compute_metrics, data.version)
+            if not self._background_thread:
+                self._background_thread = threading.Thread(target=self._background_loop, name='tsuchinoko-background',
+                                                           daemon=True)
+                self._background_thread.start()
+
+    def _background_loop(self):
+        while True:
+            with self._background_lock:
+                if not self._background_pending:
+                    self._background_thread = None
+                    return
+                data, compute_metrics, version = self._background_pending
+                self._background_pending = None
+
+            logger.info(f'Processing data version {version} in background')
+            try:
+                # thread-safe engines keep serving request_targets (with the current model) in the meantime
+                with nullcontext() if self.adaptive_engine.thread_safe else self._engine_lock:
+                    if compute_metrics:
+                        with log_time('updating metrics', cumulative_key='updating metrics'):
+                            self.adaptive_engine.update_metrics(data)
+                    if data is self.data:  # the experiment may have been stopped since
+                        with log_time('training', cumulative_key='training'):
+                            self.adaptive_engine.train()
+                self.publish_data()
+            except Exception as ex:
+                self._exception_queue.put(ex)
+                self.state = CoreState.Pausing
+                logger.exception(ex)
 
     async def notify_clients(self):
+        """
+        Serves clients until there is something for the server loop to do. Without clients to serve, this waits for the
+        next state change.
+        """
+        await self._state_event.wait()
+
+    def publish_data(self):
+        """
+        Pushes data that has changed since the last publication to subscribed clients. Called from the experiment
+        thread as soon as new measurements (or metrics) are in.
+        """
+        ...
+
+    def publish_state(self):
+        """
+        Pushes the current state to subscribed clients.
+        """
         ...
 
     @property
@@ -237,31 +364,155 @@ class Core:
         dump(self.data.as_dict(), open(checkpoint_file_path, 'w'))
 
 
+class ClientSession:
+    """
+    Tracks a client connected to a `ZMQCore`, and holds its replies until its connection can accept them.
+    """
+
+    def __init__(self, identity: bytes, max_queued_responses: int):
+        self.identity = identity
+        self.envelope = [identity]
+        self.last_seen = time.monotonic()
+        self.outbound = deque(maxlen=max_queued_responses)
+        self.dropped = 0
+
+    def queue(self, frames: List):
+        if len(self.outbound) == self.outbound.maxlen:
+            if not self.dropped:
+                logger.warning(f'Client {self} is not keeping up; its oldest responses are being dropped.')
+            self.dropped += 1
+        self.outbound.append(frames)
+
+    def __repr__(self):
+        return self.identity.hex()
+
+
 class ZMQCore(Core):
-    def __init__(self, *args, **kwargs):
+    """
+    Serves any number of clients over ZMQ. Each client has a session, identified by its socket identity; the first
+    client to send a control request controls the experiment, and the others may only view it. A session (and with it,
+    control) lapses after `SESSION_TIMEOUT` seconds without a request from its client, so clients that are otherwise
+    idle (i.e. that follow published updates) send a `HeartbeatRequest` every `HEARTBEAT_INTERVAL` seconds.
+    """
+
+    def __init__(self, *args, allow_pickle: bool = False, client_hwm: int = 10, max_queued_responses: int = 10,
+                 publish_hwm: int = 1000, publish_port: int = 5556, **kwargs):
+        """
+
+        Parameters
+        ----------
+        allow_pickle
+            Accept pickled requests from clients (i.e. legacy clients). By default, only the binary wire format is
+            accepted, since unpickling data from the network can execute arbitrary code.
+        client_hwm
+            High-water mark of each client's outbound pipe (in messages). Replies to a client whose pipe is full are
+            held in its session's queue rather than blocking the server.
+        max_queued_responses
+            Length of each client's session queue. When a stalled client's queue is full, its oldest replies are
+            dropped.
+        publish_hwm
+            High-water mark of each subscriber's pipe. Publications to a subscriber that falls this far behind are
+            dropped; the subscriber detects the gap and re-synchronizes.
+        publish_port
+            Port on which data and state updates are published to subscribers. Clients must subscribe on the same port.
+        """
         super(ZMQCore, self).__init__(*args, **kwargs)
         # self.start_server()
         self.context = None
         self.poller = None
+        self.socket = None
+        self.allow_pickle = allow_pickle
+        self.client_hwm = client_hwm
+        self.max_queued_responses = max_queued_responses
+        self.publish_hwm = publish_hwm
+        self.publish_port = publish_port
+
+        # any number of clients may view the experiment; only the controller's control requests are accepted
+        self.sessions: Dict[bytes, ClientSession] = {}
+        self.controller = None
+
+        # publications are sent from both the experiment thread and the server loop; the lock serializes use of the
+        # socket and keeps the sequence number consistent with what has been published
+        self.publisher = None
+        self._publish_lock = threading.Lock()
+        self._sequence = 0
+        self._published_data = None
+        self._published_length = 0
+        self._published_state_versions = {}
 
     def start_server(self):
         import zmq
         from zmq.asyncio import Context, Poller
         self.poller = Poller()
         self.context = Context()
-        socket = self.context.socket(zmq.REP)
+        socket = self.context.socket(zmq.ROUTER)
+        socket.setsockopt(zmq.SNDHWM, self.client_hwm)
+        socket.setsockopt(zmq.ROUTER_MANDATORY, 1)
+        socket.setsockopt(zmq.ROUTER_HANDOVER, 1)  # clients that reconnect with the same identity keep their session
         socket.bind("tcp://*:5555")
         self.poller.register(socket, zmq.POLLIN)
+        self.socket = socket
+
+        # data and state updates are pushed to subscribers; requests/replies above remain for control. Publishing is
+        # done from the experiment thread as well as the server loop, so this is a plain (blocking API) socket on the
+        # same context; sends never block, since a PUB socket drops messages for subscribers at their high-water mark
+        publisher = zmq.Socket(self.context, zmq.PUB)
+        publisher.setsockopt(zmq.SNDHWM, self.publish_hwm)
+        publisher.bind(f"tcp://*:{self.publish_port}")
+        self.publisher = publisher
+
+    def publish_data(self):
+        if not self.publisher:
+            return
+
+        with self._publish_lock:
+            data = self.data
+            snapshot = data.snapshot()
+            replaced = data is not self._published_data
+            if replaced:
+                # the data set was replaced (i.e. stopped or pushed); subscribers receive it in full
+                self._published_data, self._published_length, self._published_state_versions = data, 0, {}
+            elif len(snapshot) == self._published_length and snapshot.state_versions == self._published_state_versions:
+                return
+
+            delta = snapshot.delta(self._published_length, self._published_state_versions)
+            self._sequence += 1
+            self._send_publication(PublishedDataResponse(delta.as_dict(as_lists=False),
+                                                         self._published_length,
+                                                         dict(snapshot.state_versions),
+                                                         self._sequence))
+            self._published_length, self._published_state_versions = len(snapshot), dict(snapshot.state_versions)
+
+    def publish_state(self):
+        if not self.publisher:
+            return
+
+        with self._publish_lock:
+            self._sequence += 1
+            self._send_publication(PublishedStateResponse(self.state, self.compute_metrics, self._sequence))
+
+    def _send_publication(self, publication):
+        with log_time('publishing', cumulative_key='publishing'):
+            try:
+                self.publisher.send_multipart(encode_message(publication), copy=False)
+            except Exception as ex:
+                # subscribers detect the gap in sequence numbers and re-synchronize
+                logger.exception(ex)
 
     def respond_FullDataRequest(self, request):
-        with self.data.r_lock():
-            return FullDataResponse(self.data.as_dict())
+        # the snapshot is taken under the publishing lock so that the sequence number marks where in the stream of
+        # publications the subscriber should pick up from
+        with self._publish_lock:
+            snapshot = self.data.snapshot()
+            sequence = self._sequence if self.publisher else None
+        return FullDataResponse(snapshot.as_dict(as_lists=False), dict(snapshot.state_versions), sequence)
 
     def respond_PartialDataRequest(self, request):
-        if self.data and request.iteration <= len(self.data) and self.state == CoreState.Running:
-            with self.data.r_lock():
-                partial_data = self.data[request.iteration:]
-            return PartialDataResponse(partial_data.as_dict(), request.iteration)
+        snapshot = self.data.snapshot()
+        if snapshot and request.iteration <= len(snapshot) and self.state == CoreState.Running:
+            # only send new rows, and states that have changed since the versions the client holds
+            delta = snapshot.delta(request.iteration, getattr(request, 'state_versions', None))
+            return PartialDataResponse(delta.as_dict(as_lists=False), request.iteration, dict(snapshot.state_versions))
         else:
             return StateResponse(self.state, self.compute_metrics)
 
@@ -309,6 +560,10 @@ class ZMQCore(Core):
     def respond_ConnectRequest(self, request):
         return ConnectResponse(self.state, self.compute_metrics)
 
+    def respond_HeartbeatRequest(self, request):
+        # receiving the request has refreshed the session
+        return HeartbeatResponse()
+
     def respond_PullGraphsRequest(self, request):
         return GraphsResponse(self.graphs)
 
@@ -341,37 +596,106 @@ class ZMQCore(Core):
         if not self.poller:
             self.start_server()
 
-        sockets = dict(await self.poller.poll(timeout=.1))
-        for socket in sockets:
+        # wait for a request or a state change; wake periodically to retry queued replies and expire sessions
+        timeout = QUEUED_RESPONSE_RETRY_TIME if any(session.outbound for session in self.sessions.values()) \
+            else SESSION_TIMEOUT
+        poll = asyncio.ensure_future(self.poller.poll(timeout=timeout * 1000))
+        state_changed = asyncio.ensure_future(self._state_event.wait())
+        await asyncio.wait([poll, state_changed], return_when=asyncio.FIRST_COMPLETED)
+        state_changed.cancel()
+        if not poll.done():
+            poll.cancel()
+
+        if poll.done() and not poll.cancelled() and self.socket in dict(poll.result()):
+            while True:
+                try:
+                    identity, *frames = await self.socket.recv_multipart(zmq.NOBLOCK, copy=False)
+                except zmq.error.Again:
+                    break
+                except zmq.ZMQError as ex:
+                    logger.exception(ex)
+                    break
+
+                # REQ clients prefix their messages with an empty delimiter frame, which must be echoed back
+                envelope = [identity.bytes]
+                if frames and not len(frames[0]):
+                    envelope.append(b'')
+                    frames = frames[1:]
+
+                session = self.sessions.get(identity.bytes)
+                if session is None:
+                    session = self.sessions[identity.bytes] = ClientSession(identity.bytes, self.max_queued_responses)
+                    logger.info(f'Client connected: {session}')
+                session.last_seen = time.monotonic()
+                session.envelope = envelope
+
+                session.queue(self.handle_request(session, frames))
+
+        await self._flush_sessions()
+        self._expire_sessions()
+
+    def handle_request(self, session: 'ClientSession', frames: List) -> List:
+        use_pickle = is_pickled(frames)
+        try:
+            request = decode_message(frames, allow_pickle=self.allow_pickle)
+        except (SerializationError, UnpicklingError) as ex:
+            logger.exception(ex)
+            logger.critical('The above error prevented unpacking data from the client.')
+            return encode_message(ExceptionResponse(ex), use_pickle=use_pickle)
+
+        logger.info(f"Received request: {request}")
+        with log_time('preparing response', cumulative_key='preparing response'):
+            responder = getattr(self, f'respond_{request.__class__.__name__}', None)
+            if not responder:
+                response = UnknownResponse()
+                logger.exception(ValueError(f'Unknown request received: {request}'))
+            elif request.WRITE_REQUIRED and not self._claim_control(session):
+                response = ExceptionResponse(PermissionError('Another client is controlling this experiment; '
+                                                             'this client may only view it.'))
+            else:
+                try:
+                    response = responder(request)
+                except Exception as ex:
+                    response = ExceptionResponse(ex)
+
+        logger.info(f'Sending response: {response}')
+        with log_time('encoding response', cumulative_key='encoding response'):
             try:
-                request = await socket.recv_pyobj(zmq.NOBLOCK)
-            except (zmq.ZMQError, zmq.error.Again) as ex:
-                logger.exception(ex)
-            except UnpicklingError as ex:
+                return encode_message(response, use_pickle=use_pickle)
+            except (SerializationError, PicklingError, TypeError) as ex:
                 logger.exception(ex)
-                logger.critical('The above error prevented unpacking data from the client.')
-            else:
-                if not request:
-                    time.sleep(.1)
-                    continue
+                return encode_message(ExceptionResponse(ex), use_pickle=use_pickle)
+
+    def _claim_control(self, session: 'ClientSession') -> bool:
+        # the first client to send a control request becomes the controller, until its session lapses
+        if self.controller not in self.sessions:
+            logger.info(f'Client {session} is now controlling the experiment.')
+            self.controller = session.identity
+        return self.controller == session.identity
 
-                logger.info(f"Received request: {request}")
-                with log_time('preparing response', cumulative_key='preparing response'):
-                    responder = getattr(self, f'respond_{request.__class__.__name__}', None)
-                    if responder:
-                        try:
-                            response = responder(request)
-                        except Exception as ex:
-                            response = ExceptionResponse(ex)
-                    else:
-                        response = UnknownResponse()
-
-                logger.info(f'Sending response: {response}')
-                await socket.send_pyobj(response)
-
-                if isinstance(response, UnknownResponse):
-                    logger.exception(ValueError(f'Unknown request received: {request}'))
-                    time.sleep(.1)
+    async def _flush_sessions(self):
+        import zmq
+        for session in list(self.sessions.values()):
+            while session.outbound:
+                try:
+                    # ROUTER_MANDATORY makes a full outbound pipe raise rather than block or silently drop
+                    await self.socket.send_multipart(session.envelope + session.outbound[0], zmq.NOBLOCK, copy=False)
+                except zmq.error.Again:
+                    break  # this client isn't keeping up; its replies stay queued
+                except zmq.ZMQError as ex:
+                    if ex.errno == zmq.EHOSTUNREACH:
+                        logger.info(f'Client disconnected: {session}')
+                        self.sessions.pop(session.identity, None)
+                        break
+                    raise
+                session.outbound.popleft()
+
+    def _expire_sessions(self):
+        now = time.monotonic()
+        for identity, session in list(self.sessions.items()):
+            if now - session.last_seen > SESSION_TIMEOUT:
+                logger.info(f'Client session expired: {session}')
+                del self.sessions[identity]
 
     def exit_later(self):
         self.state = CoreState.Exiting
@@ -81,6 +81,7 @@ class _DataResponse(Message):
 
 class PushDataRequest(Message):
     __slots__ = ('data',)
+    WRITE_REQUIRED = True
 
 
 class PushDataResponse(Message):
@@ -92,31 +93,44 @@ class FullDataRequest(Message):
 
 
 class FullDataResponse(_DataResponse):
-    __slots__ = ('data',)
+    __slots__ = ('data', 'state_versions', 'sequence')
 
 
 class PartialDataRequest(Message):
-    __slots__ = ('iteration',)
+    __slots__ = ('iteration', 'state_versions')
 
 
 class PartialDataResponse(_DataResponse):
-    __slots__ = ('data', 'last_data_size')
+    __slots__ = ('data', 'last_data_size', 'state_versions')
+
+
+class PublishedDataResponse(_DataResponse):
+    # pushed to subscribers; carries rows from `last_data_size` onward and the states changed since the last publication
+    __slots__ = ('data', 'last_data_size', 'state_versions', 'sequence')
+
+
+class PublishedStateResponse(Message):
+    __slots__ = ('state', 'compute_metrics', 'sequence')
 
 
 class StartRequest(Message):
     __slots__ = ()
+    WRITE_REQUIRED = True
 
 
 class StopRequest(Message):
     __slots__ = ()
+    WRITE_REQUIRED = True
 
 
 class PauseRequest(Message):
     __slots__ = ()
+    WRITE_REQUIRED = True
 
 
 class ExitRequest(Message):
     __slots__ = ()
+    WRITE_REQUIRED = True
 
 
 class StateRequest(Message):
@@ -137,6 +151,7 @@ class GetParametersResponse(Message):
 
 class SetParameterRequest(Message):
     __slots__ = ('child_path', 'value')
+    WRITE_REQUIRED = True
 
 
 class SetParameterResponse(Message):
@@ -153,6 +168,7 @@ class ExceptionResponse(Message):
 
 class MeasureRequest(Message):
     __slots__ = ('position',)
+    WRITE_REQUIRED = True
 
 
 class MeasureResponse(Message):
@@ -167,8 +183,18 @@ class ConnectResponse(Message):
     __slots__ = ('state', 'compute_metrics')
 
 
+class HeartbeatRequest(Message):
+    # sent by otherwise idle clients, so that their sessions don't lapse
+    __slots__ = ()
+
+
+class HeartbeatResponse(Message):
+    __slots__ = ()
+
+
 class PushGraphsRequest(Message):
     __slots__ = ('graphs',)
+    WRITE_REQUIRED = True
 
 
 class PullGraphsRequest(Message):
@@ -181,6 +207,7 @@ class GraphsResponse(Message):
 
 class ReplayRequest(Message):
     __slots__ = ('positions', 'measurements')
+    WRITE_REQUIRED = True
 
 
 class ReplayResponse(Message):
@@ -188,4 +215,5 @@ class ReplayResponse(Message):
 
 
 class SetComputeMetricsRequest(Message):
-    __slots__ = ('compute_metrics',)
\ No newline at end of file
+    __slots__ = ('compute_metrics',)
+    WRITE_REQUIRED = True
@@ -0,0 +1,203 @@
+"""
+Wire encoding for core messages.
+
+The default (binary) encoding sends a message as ZMQ multipart frames::
+
+    [BINARY_TAG, json header, buffer 0, buffer 1, ...]
+
+The JSON header holds the message type and its payload. NumPy arrays with a plain numeric dtype are replaced in the
+header by a reference to one of the trailing frames, which carry the raw array memory; these are sent with
+`copy=False` and rebuilt on the receiving end with `np.frombuffer` (i.e. without copying). Other types that JSON can't
+represent (tuples, sets, enums, exceptions, graphs) are tagged. Enums and graphs are only ever resolved to classes
+that have already been imported in the receiving process, so decoding never executes code from the network.
+
+Pickle remains available as an opt-in fallback: frames are then ``[PICKLE_TAG, pickled message]``. Legacy single-frame
+messages (from `send_pyobj`) are also treated as pickles. Receivers only accept pickles when `allow_pickle` is set.
+"""
+import builtins
+import json
+import pickle
+from enum import Enum
+from typing import List, Any, Sequence
+
+import numpy as np
+
+from .messages import Message, _commands
+
+BINARY_TAG = b'TSKB1'
+PICKLE_TAG = b'TSKP1'
+
+_BUFFER_KINDS = 'biufc'
+
+
+class SerializationError(ValueError):
+    pass
+
+
+def _find_subclass(base: type, qualified_name: str):
+    # Only classes already imported in this process are considered; nothing is imported on behalf of the sender
+    pending = [base]
+    while pending:
+        cls = pending.pop()
+        if f'{cls.__module__}.{cls.__qualname__}' == qualified_name:
+            return cls
+        pending.extend(cls.__subclasses__())
+    raise SerializationError(f'Unknown type received: {qualified_name}')
+
+
+def _qualified_name(obj_type: type):
+    return f'{obj_type.__module__}.{obj_type.__qualname__}'
+
+
+class _Encoder:
+    def __init__(self):
+        self.buffers = []
+
+    def encode(self, obj: Any):
+        from tsuchinoko.graphs import Graph  # avoid importing Qt at module import
+
+        if obj is None or isinstance(obj, (bool, int, float, str)) and not isinstance(obj, Enum):
+            return obj
+        elif isinstance(obj, np.generic):
+            return obj.item()
+        elif isinstance(obj, np.ndarray):
+            return self.encode_array(obj)
+        elif isinstance(obj, dict):
+            if all(isinstance(key, str) for key in obj):
+                return {key: self.encode(value) for key, value in obj.items()}
+            return {'__items__': [[self.encode(key), self.encode(value)] for key, value in obj.items()]}
+        elif isinstance(obj, list):
+            return [self.encode(value) for value in obj]
+        elif isinstance(obj, tuple):
+            return {'__tuple__': [self.encode(value) for value in obj]}
+        elif isinstance(obj, (set, frozenset)):
+            return {'__set__': [self.encode(value) for value in obj]}
+        elif isinstance(obj, (bytes, bytearray, memoryview)):
+            self.buffers.append(obj)
+            return {'__bytes__': len(self.buffers) - 1}
+        elif isinstance(obj, Enum):
+            return {'__enum__': _qualified_name(type(obj)), 'name': obj.name}
+        elif isinstance(obj, BaseException):
+            return {'__exception__': type(obj).__name__, 'message': str(obj)}
+        elif isinstance(obj, Graph):
+            return {'__graph__': _qualified_name(type(obj)), 'state': self.encode(vars(obj))}
+        elif hasattr(obj, '__array__'):
+            return self.encode_array(np.asarray(obj))
+        raise SerializationError(f'Objects of type {type(obj).__name__} can not be serialized.')
+
+    def encode_array(self, array: np.ndarray):
+        if array.dtype.kind in _BUFFER_KINDS:
+            shape = array.shape  # np.ascontiguousarray promotes 0-d arrays to 1-d
+            array = np.ascontiguousarray(array)
+            self.buffers.append(memoryview(array).cast('B') if array.size else b'')
+            return {'__ndarray__': len(self.buffers) - 1, 'dtype': array.dtype.str, 'shape': shape}
+        elif array.dtype.kind in 'US':
+            return {'__array__': array.tolist(), 'dtype': array.dtype.str}
+        return {'__objarray__': [self.encode(value) for value in array.ravel()], 'shape': array.shape}
+
+
+class _Decoder:
+    def __init__(self, buffers):
+        self.buffers = buffers
+
+    def decode(self, obj: Any):
+        if isinstance(obj, list):
+            return [self.decode(value) for value in obj]
+        elif not isinstance(obj, dict):
+            return obj
+        elif '__ndarray__' in obj:
+            buffer = self.buffers[obj['__ndarray__']]
+            return np.frombuffer(buffer, dtype=np.dtype(obj['dtype'])).reshape(tuple(obj['shape']))
+        elif '__bytes__' in obj:
+            return bytes(self.buffers[obj['__bytes__']])
+        elif '__tuple__' in obj:
+            return tuple(self.decode(value) for value in obj['__tuple__'])
+        elif '__set__' in obj:
+            return set(self.decode(value) for value in obj['__set__'])
+        elif '__items__' in obj:
+            return {self.decode(key): self.decode(value) for key, value in obj['__items__']}
+        elif '__array__' in obj:
+            return np.array(obj['__array__'], dtype=np.dtype(obj['dtype']))
+        elif '__objarray__' in obj:
+            array = np.empty(len(obj['__objarray__']), dtype=object)
+            for i, value in enumerate(obj['__objarray__']):
+                array[i] = self.decode(value)
+            return array.reshape(tuple(obj['shape']))
+        elif '__enum__' in obj:
+            return _find_subclass(Enum, obj['__enum__'])[obj['name']]
+        elif '__exception__' in obj:
+            exception_type = getattr(builtins, obj['__exception__'], None)
+            if isinstance(exception_type, type) and issubclass(exception_type, Exception):
+                return exception_type(obj['message'])
+            return RuntimeError(f"{obj['__exception__']}: {obj['message']}")
+        elif '__graph__' in obj:
+            from tsuchinoko.graphs import Graph
+            graph_type = _find_subclass(Graph, obj['__graph__'])
+            graph = graph_type.__new__(graph_type)
+            vars(graph).update(self.decode(obj['state']))
+            return graph
+        return {key: self.decode(value) for key, value in obj.items()}
+
+
+def encode_message(message: Message, use_pickle: bool = False) -> List:
+    """
+    Encodes a message as a list of frames suitable for `socket.send_multipart(frames, copy=False)`.
+    """
+    if use_pickle:
+        return [PICKLE_TAG, pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)]
+
+    encoder = _Encoder()
+    header = {'type': type(message).__name__,
+              'payload': [encoder.encode(value) for value in message.payload]}
+    return [BINARY_TAG, json.dumps(header).encode()] + encoder.buffers
+
+
+def decode_message(frames: List, allow_pickle: bool = False) -> Message:
+    """
+    Decodes frames received with `socket.recv_multipart(copy=False)` (or with `copy=True`) into a message. Raises
+    `SerializationError` if the frames are malformed, or are pickled and `allow_pickle` is not set.
+    """
+    frames = [getattr(frame, 'buffer', frame) for frame in frames]
+    tag = bytes(frames[0]) if len(frames) > 1 else None
+
+    if tag == BINARY_TAG:
+        header = json.loads(bytes(frames[1]))
+        message_type = next((cls for cls in _commands if cls.__name__ == header['type']), None)
+        if message_type is None:
+            raise SerializationError(f'Unknown message type received: {header["type"]}')
+        decoder = _Decoder(frames[2:])
+        return message_type(*(decoder.decode(value) for value in header['payload']))
+
+    if not allow_pickle:
+        raise SerializationError('Received a pickled message, but pickle messages are not allowed.')
+    if tag == PICKLE_TAG:
+        return pickle.loads(frames[1])
+    elif len(frames) == 1:  # legacy send_pyobj
+        return pickle.loads(frames[0])
+    raise SerializationError('Malformed message received.')
+
+
+def encode_values(values: Sequence) -> List:
+    """
+    Encodes a sequence of values (without a message type) as frames, in the same binary encoding as messages.
+    """
+    encoder = _Encoder()
+    header = [encoder.encode(value) for value in values]
+    return [json.dumps(header).encode()] + encoder.buffers
+
+
+def decode_values(frames: List) -> List:
+    """
+    Decodes frames encoded by `encode_values`.
+    """
+    frames = [getattr(frame, 'buffer', frame) for frame in frames]
+    try:
+        header = json.loads(bytes(frames[0]))
+    except (IndexError, ValueError) as ex:
+        raise SerializationError('Malformed values received.') from ex
+    decoder = _Decoder(frames[1:])
+    return [decoder.decode(value) for value in header]
+
+
+def is_pickled(frames: List) -> bool:
+    return len(frames) == 1 or bytes(getattr(frames[0], 'buffer', frames[0])) == PICKLE_TAG
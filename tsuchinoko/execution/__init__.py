@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from threading import Event
 from typing import Tuple, List
 
 
@@ -7,6 +8,9 @@ class Engine(ABC):
     The Execution Engine base class. This component is generally to be responsible for measuring targets.
     """
 
+    def __init__(self):
+        self._measurements_ready = Event()
+
     @abstractmethod
     def update_targets(self,  targets: List[Tuple]):
         """
@@ -51,3 +55,29 @@ class Engine(ABC):
             Any non-standard metric values to be used for visualization at the client.
         """
         ...
+
+    def notify_measurements(self):
+        """
+        Signals that new measurements are ready, waking any thread blocked in `wait_for_measurements`. Engines that
+        measure in the background should call this after stashing each new measurement.
+        """
+        self._measurements_ready.set()
+
+    def wait_for_measurements(self, timeout: float = None) -> bool:
+        """
+        Blocks until `notify_measurements` is called, or until `timeout` elapses. Engines that don't notify are
+        effectively polled every `timeout` seconds.
+
+        Parameters
+        ----------
+        timeout: float
+            The longest time to wait (in seconds).
+
+        Returns
+        -------
+        notified: bool
+            False if the timeout elapsed without notification.
+        """
+        notified = self._measurements_ready.wait(timeout)
+        self._measurements_ready.clear()
+        return notified
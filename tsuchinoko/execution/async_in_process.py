@@ -0,0 +1,165 @@
+import asyncio
+import inspect
+from collections import deque
+from threading import Thread, Lock
+from typing import Awaitable, Callable, List, Tuple, Set
+
+from loguru import logger
+
+from . import Engine
+
+
+class AsyncExecutionEngine(Engine):
+    """
+    An Execution Engine which measures targets with an asyncio coroutine function, such as those of ophyd-async
+    devices. Up to `concurrency` measurements run at once on an event loop in a background thread, so that I/O-bound
+    measurements overlap. Completed measurements are collected as they finish.
+
+    `measure_target` is awaited with each target, and returns a `(position, value, variance, metrics)` tuple (as with
+    `ThreadedInProcessEngine`).
+    """
+
+    def __init__(self, measure_target: Callable[[Tuple], Awaitable[Tuple]], get_position=None, concurrency: int = 8,
+                 timeout: float = None, cancel_superseded: bool = False, loop: asyncio.AbstractEventLoop = None):
+        """
+
+        Parameters
+        ----------
+        measure_target
+            An `async def` function which measures a target.
+        get_position
+            A function (or coroutine function) returning the current position.
+        concurrency
+            The most measurements run at once.
+        timeout
+            The longest a measurement may take (in seconds) before it is cancelled and discarded.
+        cancel_superseded
+            If True, measurements in progress are cancelled when new targets arrive. Otherwise only targets which
+            haven't started are superseded.
+        loop
+            An event loop, running in another thread, to measure on. By default, a new loop is run in a background
+            thread.
+        """
+        super().__init__()
+
+        self.measure_target = measure_target
+        self.position_getter = get_position
+        self.position = None
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.cancel_superseded = cancel_superseded
+
+        self.targets = deque()
+        self.new_measurements = []
+        self._lock = Lock()
+        self._tasks: Set[asyncio.Task] = set()
+
+        # counters
+        self.measured = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.cancelled = 0
+
+        self._loop_thread = None
+        if loop is None:
+            loop = asyncio.new_event_loop()
+            self._loop_thread = Thread(target=loop.run_forever, name='measurement event loop', daemon=True)
+            self._loop_thread.start()
+        self.loop = loop
+
+        if get_position:
+            self.position = tuple(self._run(self._get_position()))
+
+    def update_targets(self, targets: List[Tuple]):
+        self.loop.call_soon_threadsafe(self._update_targets, [tuple(target) for target in targets])
+
+    def get_position(self) -> Tuple:
+        return self.position
+
+    def get_measurements(self) -> List[Tuple]:
+        with self._lock:
+            measurements = self.new_measurements
+            self.new_measurements = []
+        return measurements
+
+    def cancel(self):
+        """
+        Discards all targets, and cancels measurements in progress.
+        """
+        self._run(self._cancel())
+
+    def stop(self):
+        """
+        Cancels measurements in progress, then stops the event loop (if it is owned by this engine).
+        """
+        self.cancel()
+        if self._loop_thread:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._loop_thread.join()
+            self.loop.close()
+
+    @property
+    def statistics(self) -> dict:
+        return {'queue_depth': len(self.targets),
+                'in_flight': len(self._tasks),
+                'measured': self.measured,
+                'failed': self.failed,
+                'timed_out': self.timed_out,
+                'cancelled': self.cancelled}
+
+    # The following run on the event loop
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _get_position(self):
+        position = self.position_getter()
+        if inspect.isawaitable(position):
+            position = await position
+        return position
+
+    async def _cancel(self):
+        self.cancelled += len(self.targets)
+        self.targets.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _update_targets(self, targets: List[Tuple]):
+        self.cancelled += len(self.targets)
+        self.targets.clear()
+        self.targets.extend(targets)
+        if self.cancel_superseded:
+            for task in self._tasks:
+                task.cancel()
+        self._fill()
+
+    def _fill(self):
+        while self.targets and len(self._tasks) < self.concurrency:
+            target = self.targets.popleft()
+            task = self.loop.create_task(self._measure(target))
+            self._tasks.add(task)
+            task.add_done_callback(self._measured)
+
+    async def _measure(self, target: Tuple):
+        self.position = target
+        try:
+            measurement = await asyncio.wait_for(self.measure_target(target), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            logger.warning(f'Measurement at {target} timed out after {self.timeout} s.')
+        except Exception:
+            self.failed += 1
+            logger.exception(f'Measurement at {target} failed.')
+        else:
+            with self._lock:
+                self.new_measurements.append(measurement)
+                self.measured += 1
+            self.notify_measurements()
+
+    def _measured(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if task.cancelled():
+            self.cancelled += 1
+        self._fill()
@@ -105,6 +105,10 @@ class BlueskyAdaptiveEngine(Engine):
             self.has_fresh_points_on_server = False
         return new_measurements
 
+    def wait_for_measurements(self, timeout: float = None) -> bool:
+        # measurements arrive on the socket; wake as soon as one is received
+        return bool(self.socket.poll(timeout * 1000 if timeout is not None else None))
+
     def get_position(self) -> Tuple:
         # return last measurement position received from bluesky-adaptive
         return self.position
@@ -14,6 +14,8 @@ class BlueskyInProcessEngine(Engine):
     https://nsls-ii.github.io/bluesky/index.html
     """
     def __init__(self, measure_target, get_position):
+        super().__init__()
+
         # These would normally be on the remote end
         self.targets = Queue()
         self.RE = get_run_engine()
@@ -40,6 +42,7 @@ class BlueskyInProcessEngine(Engine):
                 self.position = target
                 value, variance = (yield from measure_target(target))
                 self.new_measurements.append((self.position, value, variance, {}))  # TODO: Add variance; TODO: add metrics
+                self.notify_measurements()
 
     def get_position(self):
         return self.position
@@ -0,0 +1,384 @@
+"""
+An Execution Engine which distributes targets over any number of remote workers.
+
+The engine binds a ZMQ ROUTER socket; each worker connects a DEALER socket and announces itself with ``READY``. The
+engine then hands out one target at a time to workers that are ready (so faster workers receive more targets), and each
+result a worker returns marks it ready again. Both ends exchange heartbeats: a worker that is silent for `liveness`
+heartbeat intervals is dropped, and the targets it was measuring are dispatched to other workers. Workers likewise
+reconnect when the engine falls silent.
+
+Frames after the ROUTER envelope are ``[command, *arguments]``::
+
+    worker -> engine: READY | HEARTBEAT | DISCONNECT | RESULT task_id *measurement | FAILED task_id message
+    engine -> worker: HEARTBEAT | DISCONNECT | TARGET task_id *target
+
+Targets and measurements are sent in the binary encoding of `tsuchinoko.core.serialization` (never pickled).
+
+A worker wrapping any `measure_func` can be run with `run_worker`, or from the command line::
+
+    tsuchinoko_worker tcp://engine-host:5557 my_module:measure_func
+"""
+import importlib
+import itertools
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+import click
+import zmq
+from loguru import logger
+
+from . import Engine
+from ..core.serialization import encode_values, decode_values, SerializationError
+
+READY = b'READY'
+HEARTBEAT = b'HEARTBEAT'
+DISCONNECT = b'DISCONNECT'
+TARGET = b'TARGET'
+RESULT = b'RESULT'
+FAILED = b'FAILED'
+
+
+@dataclass
+class _Worker:
+    identity: bytes
+    last_seen: float
+    in_flight: Dict[bytes, Tuple[Tuple, int]] = field(default_factory=dict)  # task id -> (target, attempt)
+
+
+class DistributedEngine(Engine):
+    """
+    An Execution Engine which hands targets out to remote workers (see `run_worker`) over ZMQ, load-balanced by worker
+    readiness. Workers may join or leave at any time; targets held by a worker which stops responding are re-dispatched.
+
+    Each worker's `measure_func` returns a `(position, value, variance, metrics)` tuple (as with
+    `ThreadedInProcessEngine`).
+    """
+
+    def __init__(self, address: str = 'tcp://*:5557', heartbeat_interval: float = 1., liveness: int = 3,
+                 max_attempts: int = 3):
+        """
+
+        Parameters
+        ----------
+        address
+            The address to bind for workers to connect to. A wildcard port (i.e. 'tcp://127.0.0.1:*') binds any free
+            port; the bound address is then available as `endpoint`.
+        heartbeat_interval
+            The time between heartbeats (in seconds).
+        liveness
+            The number of heartbeat intervals without contact after which a worker is considered dead.
+        max_attempts
+            The most times a target is dispatched, in case it is the cause of workers dying.
+        """
+        super().__init__()
+
+        self.heartbeat_interval = heartbeat_interval
+        self.liveness = liveness
+        self.max_attempts = max_attempts
+        self.position = None
+
+        self.targets = deque()  # (target, attempt)
+        self.new_measurements = []
+        self._lock = threading.Lock()
+        self._workers: Dict[bytes, _Worker] = {}
+        self._ready = deque()  # identities of workers awaiting a target, once per target they are ready for
+        self._task_ids = itertools.count()
+        self._exiting = False
+
+        # counters
+        self.measured = 0
+        self.failed = 0
+        self.redispatched = 0
+
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.setsockopt(zmq.ROUTER_MANDATORY, 1)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.bind(address)
+        self.endpoint = self.socket.getsockopt_string(zmq.LAST_ENDPOINT)
+
+        # wakes the broker thread when targets are updated, or to stop
+        wake_address = f'inproc://distributed-engine-{id(self)}'
+        self._wake_receiver = self.context.socket(zmq.PAIR)
+        self._wake_receiver.bind(wake_address)
+        self._wake_sender = self.context.socket(zmq.PAIR)
+        self._wake_sender.connect(wake_address)
+        self._wake_lock = threading.Lock()
+
+        self.broker_thread = threading.Thread(target=self._broker_loop, name='distributed engine broker', daemon=True)
+        self.broker_thread.start()
+
+    def update_targets(self, targets: List[Tuple]):
+        with self._lock:
+            self.targets.clear()
+            self.targets.extend((tuple(target), 0) for target in targets)
+        self._wake()
+
+    def get_position(self) -> Tuple:
+        return self.position
+
+    def get_measurements(self) -> List[Tuple]:
+        with self._lock:
+            measurements = self.new_measurements
+            self.new_measurements = []
+        return measurements
+
+    def stop(self):
+        """
+        Disconnects all workers and closes the engine's sockets.
+        """
+        self._exiting = True
+        self._wake()
+        self.broker_thread.join()
+        self._wake_sender.close()
+        self.context.term()
+
+    @property
+    def workers(self) -> int:
+        return len(self._workers)
+
+    @property
+    def statistics(self) -> dict:
+        with self._lock:
+            queue_depth = len(self.targets)
+        return {'workers': len(self._workers),
+                'queue_depth': queue_depth,
+                'in_flight': sum(len(worker.in_flight) for worker in list(self._workers.values())),
+                'measured': self.measured,
+                'failed': self.failed,
+                'redispatched': self.redispatched}
+
+    def _wake(self):
+        with self._wake_lock:
+            self._wake_sender.send(b'')
+
+    # The following run on the broker thread
+
+    def _broker_loop(self):
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(self._wake_receiver, zmq.POLLIN)
+        next_heartbeat = time.monotonic() + self.heartbeat_interval
+
+        while not self._exiting:
+            timeout = max(next_heartbeat - time.monotonic(), 0)
+            events = dict(poller.poll(timeout * 1000))
+
+            if self._wake_receiver in events:
+                while self._wake_receiver.poll(0):
+                    self._wake_receiver.recv()
+            if self.socket in events:
+                while self.socket.poll(0):
+                    frames = self.socket.recv_multipart(copy=False)
+                    try:
+                        self._handle(*frames)
+                    except (TypeError, IndexError):
+                        logger.warning(f'Malformed message received from worker {frames[0].bytes.hex()}.')
+
+            now = time.monotonic()
+            if now >= next_heartbeat:
+                next_heartbeat = now + self.heartbeat_interval
+                for worker in list(self._workers.values()):
+                    if now - worker.last_seen > self.heartbeat_interval * self.liveness:
+                        logger.warning(f'Worker {worker.identity.hex()} stopped responding.')
+                        self._remove(worker)
+                    else:
+                        self._send(worker, HEARTBEAT)
+
+            self._dispatch()
+
+        for worker in list(self._workers.values()):
+            self._send(worker, DISCONNECT)
+        self.socket.close()
+        self._wake_receiver.close()
+
+    def _handle(self, identity, command, *arguments):
+        identity, command = identity.bytes, command.bytes
+        worker = self._workers.get(identity)
+        if worker is None:
+            if command == DISCONNECT:
+                return
+            logger.info(f'Worker {identity.hex()} connected.')
+            worker = self._workers[identity] = _Worker(identity, time.monotonic())
+        worker.last_seen = time.monotonic()
+
+        if command == READY:
+            self._ready.append(identity)
+        elif command == RESULT:
+            task = worker.in_flight.pop(arguments[0].bytes, None)
+            self._ready.append(identity)
+            if task is None:  # i.e. the worker was presumed dead, and the target has been re-dispatched
+                return
+            try:
+                measurement = tuple(decode_values(arguments[1:]))
+            except SerializationError:
+                logger.exception(f'Malformed measurement received for target {task[0]}.')
+                self.failed += 1
+                return
+            with self._lock:
+                self.new_measurements.append(measurement)
+                self.measured += 1
+            self.notify_measurements()
+        elif command == FAILED:
+            task = worker.in_flight.pop(arguments[0].bytes, None)
+            self._ready.append(identity)
+            if task is not None:
+                self.failed += 1
+                logger.error(f'Measurement at {task[0]} failed on worker {identity.hex()}: '
+                             f'{arguments[1].bytes.decode()}')
+        elif command == DISCONNECT:
+            logger.info(f'Worker {identity.hex()} disconnected.')
+            self._remove(worker)
+        elif command != HEARTBEAT:
+            logger.warning(f'Unknown command received from worker {identity.hex()}: {command!r}')
+
+    def _dispatch(self):
+        while self._ready:
+            with self._lock:
+                if not self.targets:
+                    return
+                target, attempt = self.targets.popleft()
+
+            worker = self._workers.get(self._ready.popleft())
+            task_id = next(self._task_ids).to_bytes(8, 'little')
+            if worker and self._send(worker, TARGET, task_id, *encode_values(target)):
+                worker.in_flight[task_id] = (target, attempt + 1)
+                self.position = target
+            else:
+                with self._lock:
+                    self.targets.appendleft((target, attempt))
+
+    def _send(self, worker: _Worker, *frames) -> bool:
+        try:
+            self.socket.send_multipart([worker.identity, *frames], copy=False)
+        except zmq.error.ZMQError:  # i.e. EHOSTUNREACH; the worker has gone
+            if worker.identity in self._workers:
+                logger.warning(f'Worker {worker.identity.hex()} is unreachable.')
+                self._remove(worker)
+            return False
+        return True
+
+    def _remove(self, worker: _Worker):
+        del self._workers[worker.identity]
+        self._ready = deque(identity for identity in self._ready if identity != worker.identity)
+
+        for target, attempt in worker.in_flight.values():
+            if attempt >= self.max_attempts:
+                self.failed += 1
+                logger.error(f'Target {target} was abandoned after {attempt} attempts.')
+                continue
+            self.redispatched += 1
+            with self._lock:
+                self.targets.appendleft((target, attempt))
+
+
+def run_worker(measure_func: Callable[[Tuple], Tuple], address: str, heartbeat_interval: float = 1.,
+               liveness: int = 3, stop: threading.Event = None):
+    """
+    Measures targets dispatched by a `DistributedEngine` with `measure_func` until the engine disconnects (or `stop` is
+    set). Measurements are made on a separate thread, so that heartbeats continue during long measurements.
+
+    Parameters
+    ----------
+    measure_func
+        A function which measures a target, returning a `(position, value, variance, metrics)` tuple.
+    address
+        The engine's address (i.e. 'tcp://engine-host:5557').
+    heartbeat_interval
+        The time between heartbeats (in seconds); this should match the engine's.
+    liveness
+        The number of heartbeat intervals without contact after which the worker reconnects.
+    stop
+        An event which stops the worker when set.
+    """
+    stop = stop or threading.Event()
+    context = zmq.Context()
+    measurements_address = f'inproc://distributed-worker-{id(stop)}'
+    measurements = context.socket(zmq.PAIR)
+    measurements.bind(measurements_address)
+    measure_thread = threading.Thread(target=_measure_loop, args=(measure_func, context, measurements_address),
+                                      name='measurement', daemon=True)
+    measure_thread.start()
+
+    busy = False
+    connected = True  # until the engine disconnects this worker
+    try:
+        while connected and not stop.is_set():
+            socket = context.socket(zmq.DEALER)
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(address)
+            if not busy:  # otherwise, the result announces readiness
+                socket.send(READY)
+            poller = zmq.Poller()
+            poller.register(socket, zmq.POLLIN)
+            poller.register(measurements, zmq.POLLIN)
+            last_heard = next_heartbeat = time.monotonic()
+
+            while not stop.is_set():
+                events = dict(poller.poll(max(next_heartbeat - time.monotonic(), 0) * 1000))
+
+                if measurements in events:
+                    socket.send_multipart(measurements.recv_multipart(copy=False), copy=False)
+                    busy = False
+                if socket in events:
+                    command, *arguments = socket.recv_multipart(copy=False)
+                    last_heard = time.monotonic()
+                    if command.bytes == TARGET:
+                        measurements.send_multipart(arguments, copy=False)
+                        busy = True
+                    elif command.bytes == DISCONNECT:
+                        connected = False
+                        break
+
+                now = time.monotonic()
+                if now >= next_heartbeat:
+                    next_heartbeat = now + heartbeat_interval
+                    socket.send(HEARTBEAT)
+                if now - last_heard > heartbeat_interval * liveness:
+                    logger.warning(f'Engine at {address} stopped responding; reconnecting.')
+                    break
+            else:
+                socket.send(DISCONNECT)
+            socket.close()
+    finally:
+        measurements.send_multipart([b''])
+        measure_thread.join()
+        measurements.close()
+        context.term()
+
+
+def _measure_loop(measure_func: Callable[[Tuple], Tuple], context: zmq.Context, address: str):
+    measurements = context.socket(zmq.PAIR)
+    measurements.connect(address)
+    while True:
+        task_id, *target = measurements.recv_multipart()
+        if not task_id:
+            break
+        try:
+            target = tuple(decode_values(target))
+            measurement = measure_func(target)
+        except Exception as ex:
+            logger.exception(f'Measurement at {target} failed.')
+            measurements.send_multipart([FAILED, task_id, str(ex).encode()])
+        else:
+            measurements.send_multipart([RESULT, task_id, *encode_values(measurement)], copy=False)
+    measurements.close()
+
+
+def _load_function(path: str) -> Callable:
+    module_name, _, function_name = path.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+@click.command()
+@click.argument('address')
+@click.argument('measure_func')
+@click.option('--heartbeat-interval', default=1., help='The time between heartbeats (in seconds).')
+def launch_worker(address, measure_func, heartbeat_interval=1.):
+    """
+    Measures targets from the DistributedEngine at ADDRESS with MEASURE_FUNC (given as 'module:function').
+    """
+    run_worker(_load_function(measure_func), address, heartbeat_interval=heartbeat_interval)
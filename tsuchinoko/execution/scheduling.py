@@ -0,0 +1,194 @@
+import time
+from typing import List, Sequence, Tuple, Union
+
+import numpy as np
+from loguru import logger
+
+
+class MotionScheduler:
+    """
+    Orders each batch of targets to minimize the estimated travel time of the instrument, starting from its current
+    position. Set as the `target_scheduler` of a `Core`, batches are reordered before they are sent to the execution
+    engine.
+
+    Move times are estimated per axis with a trapezoidal velocity profile (accelerating to `velocity` at
+    `acceleration`); axes move simultaneously, so a move takes as long as its slowest axis. The route is built by
+    nearest neighbour (or, with `snake`, as a boustrophedon raster along `fast_axis`), then improved with 2-opt.
+
+    The estimated time of each measured target (travel plus `dwell_time`) is compared with the actual time between
+    measurements; both are accumulated in `statistics`. Actual times are only meaningful when targets are measured one
+    at a time.
+    """
+
+    def __init__(self, velocity: Union[float, Sequence[float]], acceleration: Union[float, Sequence[float]] = None,
+                 settle_time: float = 0, dwell_time: float = 0, snake: bool = False, fast_axis: int = 0,
+                 row_pitch: float = None, two_opt: bool = True, max_passes: int = 100):
+        """
+
+        Parameters
+        ----------
+        velocity
+            The top speed along each axis (in domain units per second), or along all axes.
+        acceleration
+            The acceleration along each axis (in domain units per second squared), or along all axes. If None, axes
+            reach their top speed instantly.
+        settle_time
+            The time to settle after each move.
+        dwell_time
+            The expected time to measure each target, included in estimates.
+        snake
+            Start from a snake (boustrophedon) raster rather than from nearest neighbour. Combined with `two_opt=False`,
+            targets are measured in pure raster order.
+        fast_axis
+            The axis along which each row of the snake is traversed.
+        row_pitch
+            The width of snake rows along the slow axis. By default, the batch is divided into about √n rows.
+        two_opt
+            Improve the route with 2-opt.
+        max_passes
+            The most 2-opt passes over a route.
+        """
+        self.velocity = np.asarray(velocity, dtype=float)
+        self.acceleration = None if acceleration is None else np.asarray(acceleration, dtype=float)
+        self.settle_time = settle_time
+        self.dwell_time = dwell_time
+        self.snake = snake
+        self.fast_axis = fast_axis
+        self.row_pitch = row_pitch
+        self.two_opt = two_opt
+        self.max_passes = max_passes
+
+        self._pending = {}  # target -> estimated time
+        self._last_arrival = None
+
+        # counters
+        self.batches = 0
+        self.measured = 0
+        self.estimated_time = 0.  # estimated time of the measured targets
+        self.actual_time = 0.  # actual time of the measured targets
+        self.estimated_savings = 0.  # estimated travel time saved by reordering
+
+    def move_times(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Estimates the time to move from each origin (rows) to each destination (columns).
+        """
+        distance = np.abs(np.asarray(origins, dtype=float)[:, None, :] -
+                          np.asarray(destinations, dtype=float)[None, :, :])
+        if self.acceleration is None:
+            times = distance / self.velocity
+        else:
+            ramp = self.velocity ** 2 / self.acceleration  # the distance spent accelerating and decelerating
+            times = np.where(distance >= ramp,
+                             distance / self.velocity + self.velocity / self.acceleration,
+                             2 * np.sqrt(distance / self.acceleration))
+        times = times.max(axis=-1)
+        return times + self.settle_time * (times > 0)
+
+    def schedule(self, position: Tuple, targets: Sequence) -> List:
+        """
+        Returns `targets` in the order they should be measured, starting from `position`.
+        """
+        if not len(targets):
+            return list(targets)
+
+        points = np.asarray(targets, dtype=float).reshape(len(targets), -1)
+        start = np.asarray(position, dtype=float).reshape(1, -1)
+        # the start is the last node
+        cost = self.move_times(np.vstack([points, start]), np.vstack([points, start]))
+        start_index = len(points)
+
+        if len(points) < 3:
+            route = np.array([start_index, *np.argsort(cost[start_index, :-1], kind='stable')])
+        else:
+            if self.snake:
+                route = np.array([start_index, *self._snake_order(points, start[0])])
+            else:
+                route = self._nearest_neighbour(cost, start_index)
+            if self.two_opt:
+                route = self._two_opt(cost, route)
+
+        legs = cost[route[:-1], route[1:]]
+        unordered_time = cost[start_index, 0] + np.sum(cost[np.arange(len(points) - 1), np.arange(1, len(points))])
+        self.batches += 1
+        self.estimated_savings += unordered_time - legs.sum()
+        logger.info(f'Scheduled {len(points)} targets with an estimated {legs.sum():.3g} s of travel '
+                    f'({unordered_time:.3g} s unordered).')
+
+        ordered = [targets[i] for i in route[1:]]
+        self._pending = {tuple(np.asarray(target, dtype=float).ravel()): leg + self.dwell_time
+                         for target, leg in zip(ordered, legs)}
+        self._last_arrival = time.perf_counter()
+        return ordered
+
+    def observe(self, measurements: List[Tuple]):
+        """
+        Compares measurements of scheduled targets with their estimated times.
+        """
+        now = time.perf_counter()
+        for measurement in measurements:
+            estimate = self._pending.pop(tuple(np.asarray(measurement[0], dtype=float).ravel()), None)
+            if estimate is None:
+                continue
+            self.measured += 1
+            self.estimated_time += estimate
+            self.actual_time += now - self._last_arrival
+            self._last_arrival = now
+
+    @property
+    def statistics(self) -> dict:
+        return {'batches': self.batches,
+                'measured': self.measured,
+                'estimated_time': float(self.estimated_time),
+                'actual_time': float(self.actual_time),
+                'estimated_savings': float(self.estimated_savings)}
+
+    @staticmethod
+    def _nearest_neighbour(cost: np.ndarray, start_index: int) -> np.ndarray:
+        visited = np.zeros(len(cost), dtype=bool)
+        route = [start_index]
+        visited[start_index] = True
+        for i in range(len(cost) - 1):
+            route.append(np.argmin(np.where(visited, np.inf, cost[route[-1]])))
+            visited[route[-1]] = True
+        return np.array(route)
+
+    def _two_opt(self, cost: np.ndarray, route: np.ndarray) -> np.ndarray:
+        # route is an open path from a fixed start; reversing route[i:k + 1] replaces the edges (a, b) and (c, d) with
+        # (a, c) and (b, d), where a, b = route[i - 1], route[i] and c, d = route[k], route[k + 1]
+        route = route.copy()
+        for _ in range(self.max_passes):
+            improved = False
+            for i in range(1, len(route) - 1):
+                a, b = route[i - 1], route[i]
+                c = route[i + 1:]
+                d = route[i + 2:]
+                delta = cost[a, c] - cost[a, b]
+                delta[:-1] += cost[b, d] - cost[c[:-1], d]  # the last candidate reverses the tail, which has no d
+                k = np.argmin(delta)
+                if delta[k] < -1e-12:
+                    route[i:i + k + 2] = route[i:i + k + 2][::-1]
+                    improved = True
+            if not improved:
+                break
+        return route
+
+    def _snake_order(self, points: np.ndarray, start: np.ndarray) -> np.ndarray:
+        fast = self.fast_axis
+        if points.shape[1] == 1:
+            order = np.argsort(points[:, fast], kind='stable')
+            if abs(points[order[-1], fast] - start[fast]) < abs(points[order[0], fast] - start[fast]):
+                order = order[::-1]
+            return order
+
+        slow = (fast + 1) % points.shape[1]
+        low, high = points[:, slow].min(), points[:, slow].max()
+        pitch = self.row_pitch or (high - low) / max(round(np.sqrt(len(points))), 1) or 1
+        rows = np.floor((points[:, slow] - low) / pitch).astype(int)
+        _, rank = np.unique(rows, return_inverse=True)
+        if abs(high - start[slow]) < abs(low - start[slow]):  # begin with the row nearest the start
+            rank = rank.max() - rank
+
+        first_row = points[rank == 0, fast]
+        direction = 1 if abs(first_row.min() - start[fast]) <= abs(first_row.max() - start[fast]) else -1
+        direction = direction * np.where(rank % 2, -1, 1)
+        return np.lexsort((direction * points[:, fast], rank))
@@ -1,5 +1,8 @@
-from queue import Queue
-from typing import Callable, Tuple, List
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future
+from queue import Queue, Empty
+from threading import Lock
+from typing import Callable, Tuple, List, Dict
 
 from loguru import logger
 
@@ -7,7 +10,31 @@ from . import Engine
 
 
 class SimpleEngine(Engine):
-    def __init__(self, measure_func=Callable[[Tuple[float]], Tuple[float]], gives_variance=True, gives_position=True, gives_metrics=True):
+    """
+    An Execution Engine which measures targets with `measure_func`.
+
+    By default, targets are measured one at a time on the experiment thread, as they are requested. With `workers`,
+    targets are instead measured in parallel on a pool of threads (or processes, if `pool` is 'process'; `measure_func`
+    must then be picklable). Up to `max_in_flight` targets are submitted to the pool at once, and completed
+    measurements are returned as they finish. Submitted targets which haven't started are cancelled when superseded
+    by new targets.
+    """
+
+    def __init__(self, measure_func=Callable[[Tuple[float]], Tuple[float]], gives_variance=True, gives_position=True,
+                 gives_metrics=True, workers: int = 0, pool: str = 'thread', max_in_flight: int = None):
+        """
+
+        Parameters
+        ----------
+        workers
+            The number of measurements made in parallel. With 0, measurements are made serially on the experiment
+            thread.
+        pool
+            Either 'thread' or 'process'.
+        max_in_flight
+            The most targets submitted to the pool at once. This defaults to twice the number of workers, so that
+            workers stay busy while the experiment thread is occupied.
+        """
         super(SimpleEngine, self).__init__()
 
         self.measure_func = measure_func
@@ -18,6 +45,20 @@ class SimpleEngine(Engine):
         self._gives_position = gives_position
         self._gives_metrics = gives_metrics
 
+        self.workers = workers
+        self.max_in_flight = max_in_flight or 2 * workers
+        self.cancelled = 0
+        self._in_flight: Dict[Future, Tuple] = {}
+        self._lock = Lock()
+        self._executor = None
+        if workers:
+            if pool == 'thread':
+                self._executor = ThreadPoolExecutor(workers, thread_name_prefix='measurement')
+            elif pool == 'process':
+                self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                raise ValueError(f"Unknown pool type '{pool}'; expected 'thread' or 'process'.")
+
     def update_targets(self,  targets: List[Tuple]):
         with self.targets.mutex:
             self.targets.queue.clear()
@@ -25,30 +66,78 @@ class SimpleEngine(Engine):
         for target in targets:
             self.targets.put(target)
 
+        if self._executor:
+            with self._lock:
+                # targets already being measured finish; the rest are superseded
+                for future in list(self._in_flight):
+                    if future.cancel():
+                        del self._in_flight[future]
+                        self.cancelled += 1
+            self._submit()
+
     def get_position(self) -> Tuple:
         return self.position
 
     def get_measurements(self) -> List[Tuple]:
+        if self._executor:
+            self._submit()
+        else:
+            while not self.targets.empty():
+                self.position = tuple(self.targets.get())
+                self.new_measurements.append(self._format(self.position, self.measure_func(self.position)))
+                self.targets.task_done()
 
-        while not self.targets.empty():
-            self.position = tuple(self.targets.get())
-            measurement = self.measure_func(self.position)
-            if not self._gives_position and not self._gives_position and not self._gives_metrics:
-                measurement = [measurement]
-            if not self._gives_position:
-                measurement = [self.position, *measurement]
-            if not self._gives_variance:
-                measurement = [*measurement, .1]
-            if not self._gives_metrics:
-                measurement = [*measurement, {}]
-            self.new_measurements.append(tuple(measurement))
-            self.targets.task_done()
-
-        measurements = self.new_measurements
-        self.new_measurements = []
+        with self._lock:
+            measurements = self.new_measurements
+            self.new_measurements = []
         return measurements
 
+    @property
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def _format(self, position: Tuple, measurement) -> Tuple:
+        if not self._gives_position and not self._gives_variance and not self._gives_metrics:
+            measurement = [measurement]
+        if not self._gives_position:
+            measurement = [position, *measurement]
+        if not self._gives_variance:
+            measurement = [*measurement, .1]
+        if not self._gives_metrics:
+            measurement = [*measurement, {}]
+        return tuple(measurement)
+
+    def _submit(self):
+        submitted = []
+        with self._lock:
+            while len(self._in_flight) < self.max_in_flight:
+                try:
+                    target = tuple(self.targets.get_nowait())
+                except Empty:
+                    break
+                future = self._executor.submit(self.measure_func, target)
+                self._in_flight[future] = target
+                submitted.append(future)
+                self.targets.task_done()
+        # a future that has already finished runs its callback immediately, so callbacks are added outside the lock
+        for future in submitted:
+            future.add_done_callback(self._measured)
+
+    def _measured(self, future: Future):
+        if future.cancelled():
+            return
+        with self._lock:
+            target = self._in_flight.pop(future, None)
+            try:
+                measurement = future.result()
+            except Exception:
+                logger.exception(f'Measurement at {target} failed.')
+                return
+            self.position = target
+            self.new_measurements.append(self._format(target, measurement))
+        self.notify_measurements()
+
 
 class SimplestEngine(SimpleEngine):
-    def __init__(self, measure_func=Callable[[Tuple[float]], Tuple[float]]):
-        super().__init__(measure_func, gives_position=False, gives_variance=False, gives_metrics=False)
+    def __init__(self, measure_func=Callable[[Tuple[float]], Tuple[float]], **kwargs):
+        super().__init__(measure_func, gives_position=False, gives_variance=False, gives_metrics=False, **kwargs)
@@ -1,55 +1,135 @@
-from queue import Queue, Empty
-from threading import Thread
+from collections import deque
+from threading import Thread, Condition
 import time
 
 from loguru import logger
 
 from . import Engine
+from ..utils.buffers import RingBuffer
 
 
 class ThreadedInProcessEngine(Engine):
     """
-    A simple Execution Engine which performs measurements in a background thread.
+    A simple Execution Engine which performs measurements in background threads.
+
+    `workers` threads each take the next target and measure it. Completed measurements are stashed in a ring buffer of
+    `buffer_size` measurements until collected by `get_measurements`; if the buffer fills, workers wait for it to be
+    collected rather than dropping measurements. Workers block (rather than poll) while there are no targets.
     """
 
-    def __init__(self, measure_target, get_position=None):
+    def __init__(self, measure_target, get_position=None, workers: int = 1, buffer_size: int = 4096):
+        super().__init__()
+
         # These would normally be on the remote end
-        self.exiting = False
-        self.targets = Queue()
+        self._exiting = False
+        self.targets = deque()
+        self._targets_changed = Condition()
         self.position_getter = get_position
         if get_position:
             self.position = get_position()
         else:
             self.position = (0, 0)
 
-        self.new_measurements = []
+        self.new_measurements = RingBuffer(buffer_size)
         self.measure_target = measure_target
-        self.measure_thread = Thread(target=self.measure_loop)
-        self.measure_thread.start()
+
+        # counters
+        self.measured = 0
+        self.failed = 0
+        self.busy_workers = 0
+        self._busy_time = 0.
+        self._started_at = time.perf_counter()
+
+        self.measure_threads = [Thread(target=self.measure_loop, name=f'measurement worker {i}', daemon=True)
+                                for i in range(workers)]
+        for thread in self.measure_threads:
+            thread.start()
+
+    @property
+    def measure_thread(self) -> Thread:
+        return self.measure_threads[0]
 
     def update_targets(self, positions):
-        with self.targets.mutex:
-            self.targets.queue.clear()
+        with self._targets_changed:
+            self.targets.clear()
+            self.targets.extend(positions)
+            self._targets_changed.notify_all()
+
+    @property
+    def exiting(self) -> bool:
+        return self._exiting
+
+    @exiting.setter
+    def exiting(self, exiting: bool):
+        # wake idle workers so they see the change, and workers waiting on a full buffer so they return
+        with self._targets_changed:
+            self._exiting = exiting
+            self._targets_changed.notify_all()
+        if exiting:
+            self.new_measurements.close()
 
-        for position in positions:
-            self.targets.put(position)
+    def stop(self):
+        """
+        Stops the workers once their current measurements are complete. Measurements which can't be buffered (because
+        the buffer is full) are discarded.
+        """
+        self.exiting = True
+        for thread in self.measure_threads:
+            thread.join()
 
     def measure_loop(self):
-        while not self.exiting:
-            logger.critical('looking for target')
-            try:
-                target = tuple(self.targets.get(timeout=.1))
-            except Empty:
-                continue
-            else:
+        while True:
+            with self._targets_changed:
+                self._targets_changed.wait_for(lambda: self.targets or self._exiting)
+                if self._exiting:
+                    return
+                target = tuple(self.targets.popleft())
                 self.position = target
+                self.busy_workers += 1
+
+            start = time.perf_counter()
+            try:
                 measurement = self.measure_target(target)
-                self.new_measurements.append(measurement)
+            except Exception:
+                logger.exception(f'Measurement at {target} failed.')
+                measurement = None
+
+            with self._targets_changed:
+                self.busy_workers -= 1
+                self._busy_time += time.perf_counter() - start
+                if measurement is None:
+                    self.failed += 1
+                else:
+                    self.measured += 1
+
+            if measurement is not None:
+                # wait for the buffer to be collected, unless stopped
+                if not self.new_measurements.put(measurement):
+                    logger.warning(f'Discarded the measurement at {target}; the buffer was full when stopped.')
+                    return
+                self.notify_measurements()
 
     def get_position(self):
         return self.position or self.position_getter()
 
     def get_measurements(self):
-        measurements = self.new_measurements
-        self.new_measurements = []
-        return measurements
\ No newline at end of file
+        return self.new_measurements.drain()
+
+    @property
+    def statistics(self) -> dict:
+        """
+        Counters for monitoring throughput: targets waiting to be measured, measurements waiting to be collected,
+        measurements made, and the fraction of worker time spent measuring.
+        """
+        with self._targets_changed:
+            busy_time = self._busy_time
+            queue_depth = len(self.targets)
+        elapsed = (time.perf_counter() - self._started_at) * len(self.measure_threads)
+        return {'queue_depth': queue_depth,
+                'buffered': len(self.new_measurements),
+                'buffer_high_water': self.new_measurements.high_water,
+                'buffer_full_waits': self.new_measurements.waits,
+                'measured': self.measured,
+                'failed': self.failed,
+                'busy_workers': self.busy_workers,
+                'utilization': busy_time / elapsed if elapsed else 0.}
@@ -12,7 +12,9 @@ from qtpy.QtCore import Qt, QSignalBlocker, Signal, QRectF
 
 from tsuchinoko.graphics_items.mixins import ClickRequester, DomainROI, BetterButtons, LogScaleIntensity, \
     BetterAutoLUTRangeImageView, ViridisImageView, AspectRatioLock, YInvert
-from tsuchinoko.graphs import Graph, Location, graph_signal_relay
+from tsuchinoko.adaptive.posterior_cache import cached_posterior, grid_evaluation
+from tsuchinoko.graphs import Graph, Location, ComputeMode, graph_signal_relay
+from tsuchinoko.graphs.scheduler import model_inputs
 from tsuchinoko.widgets.displays import Configuration
 from tsuchinoko.widgets.graph_widgets import CloudWidget
 import sklearn
@@ -32,9 +34,9 @@ class Scatter(Graph):
         super().__init__(name)
 
     def update(self, widget, data, update_slice: slice):
-        with data.r_lock():
-            x = data[self.x_key].copy()
-            y = data[self.y_key].copy()
+        snapshot = data.snapshot()
+        x = np.asarray(snapshot[self.x_key])
+        y = np.asarray(snapshot[self.y_key])
 
         widget.clear()
 
@@ -57,12 +59,12 @@ class Table(Graph):
     def update(self, widget, data, update_slice: slice):
         # data = data[update_slice]
 
-        with data.r_lock():
-            x = data.positions.copy()
-            v = data.variances.copy()
-            y = data.scores.copy()
+        snapshot = data.snapshot()
+        x = snapshot.positions
+        v = snapshot.variances
+        y = snapshot.scores
 
-            extra_fields = {data_key: data[data_key].copy() for data_key in self.data_keys}
+        extra_fields = {data_key: snapshot[data_key] for data_key in self.data_keys}
 
         lengths = len(v), len(x), len(y), *map(len, extra_fields.values())
         min_length = min(lengths)
@@ -116,17 +118,16 @@ class Image(Graph):
             self.name = self.data_key
 
     def update(self, widget, data, update_slice: slice):
-        with data.r_lock():
-            try:
-                v = data[self.data_key].copy()
-            except ValueError:
-                if getattr(self, '_has_value_errors', False):
-                    pass
-                    # logger.warning(f'The {self.name} graph hasn\'t received data more than once. This is not normal.')
-                else:
-                    logger.info(f'The {self.name} graph hasn\'t received data once. This is normal for graphs computed by the adaptive engine.')
-                self._has_value_errors = True
-                return
+        try:
+            v = data.snapshot()[self.data_key]
+        except ValueError:
+            if getattr(self, '_has_value_errors', False):
+                pass
+                # logger.warning(f'The {self.name} graph hasn\'t received data more than once. This is not normal.')
+            else:
+                logger.info(f'The {self.name} graph hasn\'t received data once. This is normal for graphs computed by the adaptive engine.')
+            self._has_value_errors = True
+            return
 
         if self.accumulates:
             raise NotImplemented('Accumulation in Image graphs not implemented yet')
@@ -193,11 +194,11 @@ class Bar(Graph):
             self.bgi = BarGraphItem(x0=[], x1=[], height=[], pen='w', brush=(0, 0, 255, 150))
             widget.addItem(self.bgi)
 
-        with data.r_lock():
-            if self.data_key in data:
-                y, x = data[self.data_key].copy()
-            else:
-                logger.warning(f'A graph could not find the required key: {self.data_key}.')
+        snapshot = data.snapshot()
+        if self.data_key in snapshot:
+            y, x = snapshot[self.data_key]
+        else:
+            logger.warning(f'A graph could not find the required key: {self.data_key}.')
 
         self.bgi.setOpts(x0=x[:-1], x1=x[1:], height=y)
 
@@ -215,8 +216,7 @@ class Plot(Graph):
         self.widget_kwargs['label_key'] = label_key
 
     def update(self, widget, data, update_slice: slice):
-        with data.r_lock():
-            v = data[self.data_key].copy()
+        v = data.snapshot()[self.data_key]
         if self.accumulates:
             widget.plot(np.asarray(v), clear=True, label=self.label_key)
         else:
@@ -251,20 +251,20 @@ class MultiPlot(Plot):
         if update_slice.start == 0 or not self.stack_plots:
             widget.getPlotItem().clear()
 
-        with data.r_lock():
-            try:
-                v = data[self.data_key].copy()
-            except ValueError:
-                if getattr(self, '_has_value_errors', False):
-                    logger.warning(f'The {self.name} graph hasn\'t received data more than once. This is not normal.')
-                else:
-                    logger.info(
-                        f'The {self.name} graph hasn\'t received data once. This is normal for graphs computed by the adaptive engine.')
-                self._has_value_errors = True
-                return
-            labels = data[self.label_key].copy()
-            if self.pen_key is not None:
-                pens = data[self.pen_key].copy()
+        snapshot = data.snapshot()
+        try:
+            v = snapshot[self.data_key]
+        except ValueError:
+            if getattr(self, '_has_value_errors', False):
+                logger.warning(f'The {self.name} graph hasn\'t received data more than once. This is not normal.')
+            else:
+                logger.info(
+                    f'The {self.name} graph hasn\'t received data once. This is normal for graphs computed by the adaptive engine.')
+            self._has_value_errors = True
+            return
+        labels = snapshot[self.label_key]
+        if self.pen_key is not None:
+            pens = snapshot[self.pen_key]
 
         if self.stack_plots:
             plots = zip(count(update_slice.start), labels[update_slice], v[update_slice])
@@ -290,8 +290,7 @@ class DynamicColorMultiPlot(MultiPlot):
         self.item_colors = []
 
     def update(self, widget, data: 'Data', update_slice: slice):
-        with data.r_lock():
-            c = data[self.color_scalar_key].copy()
+        c = data.snapshot()[self.color_scalar_key]
         c_min = np.min(c)
         c_max = np.max(c)
         scaled_c = np.interp(c, (c_min, c_max), (0, 1))
@@ -327,19 +326,22 @@ class GPCamPosteriorCovariance(Image):
     data_key = 'Posterior Covariance'
     widget_kwargs: dict = field(default_factory=lambda: dict(invert_y=True))
     transform_to_parameter_space: ClassVar[bool] = False
+    compute_mode: ComputeMode = ComputeMode.Threaded  # O(N^2) in the number of measurements
 
     def compute(self, data, engine: 'GPCamInProcessEngine'):
-        with data.r_lock():  # quickly grab positions within lock before passing to optimizer
-            positions = np.asarray(data.positions.copy())
+        positions = data.snapshot().positions  # read-only view; no lock or copy required
 
         # if multi-task, extend the grid_positions to include the task dimension
         if hasattr(engine, 'output_number'):
             positions = np.vstack([np.hstack([positions, np.full((positions.shape[0], 1), i)]) for i in range(engine.output_number)])
 
-        # compute posterior covariance without lock
-        result_dict = engine.optimizer.posterior_covariance(positions)
+        # compute posterior covariance
+        with model_inputs(engine) as current:
+            result_dict = engine.optimizer.posterior_covariance(positions)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = result_dict['S']
 
@@ -365,24 +367,31 @@ class GPCamAcquisitionFunction(Image):
             logger.exception(ValueError('The selected acquisition_function is not available for display.'))
             return
 
-        extra_kwargs={}
-        output_num = getattr(engine.optimizer.gp, 'output_num', 1)
-        if output_num > 1:
-            extra_kwargs['x_out'] = np.arange(output_num)
-
-        # calculate acquisition function
-        acquisition_function_value = engine.optimizer.evaluate_acquisition_function(grid_positions,
-                                                                                    acquisition_function=
-                                                                                    gpcam_acquisition_functions[
-                                                                                        engine.parameters[
-                                                                                            'acquisition_function']],
-                                                                                    origin=engine.last_position,
-                                                                                    **extra_kwargs)
-
+        with model_inputs(engine) as current:
+            extra_kwargs={}
+            output_num = getattr(engine.optimizer.gp, 'output_num', 1)
+            if output_num > 1:
+                extra_kwargs['x_out'] = np.arange(output_num)
+
+            # calculate acquisition function
+            with grid_evaluation(engine.optimizer):
+                acquisition_function_value = engine.optimizer.evaluate_acquisition_function(grid_positions,
+                                                                                            acquisition_function=
+                                                                                            engine.acquisition_function(
+                                                                                                engine.parameters[
+                                                                                                    'acquisition_function']),
+                                                                                            origin=engine.last_position,
+                                                                                            **extra_kwargs)
+
+        if not current():
+            return
         try:
             acquisition_function_value = acquisition_function_value.reshape(*self.shape)
         except (ValueError, AttributeError):
             acquisition_function_value = np.array([[0]])
+        else:
+            # the engine seeds acquisition function optimization from the best of these
+            engine.acquisition_grid = grid_positions, acquisition_function_value.ravel()
 
         # assign to data object with lock
         with data.w_lock():
@@ -410,15 +419,19 @@ class GPCamPosteriorMean(Image):
         #     grid_positions = np.vstack([np.hstack([grid_positions, np.full((grid_positions.shape[0], 1), i)]) for i in range(engine.output_number)])
         #     shape = (*self.shape, engine.output_number)
 
-        extra_kwargs = dict()
-        if hasattr(engine.optimizer.gp, 'output_num'):
-            extra_kwargs['x_out'] = np.arange(engine.optimizer.gp.output_num)
-            shape = (*shape, engine.optimizer.gp.output_num)
+        with model_inputs(engine) as current:
+            extra_kwargs = dict()
+            if hasattr(engine.optimizer.gp, 'output_num'):
+                extra_kwargs['x_out'] = np.arange(engine.optimizer.gp.output_num)
+                shape = (*shape, engine.optimizer.gp.output_num)
 
-        # calculate acquisition function
-        posterior_mean_value = engine.optimizer.posterior_mean(grid_positions, **extra_kwargs)['m(x)'].reshape(*shape)
+            # calculate acquisition function
+            with grid_evaluation(engine.optimizer):
+                posterior_mean_value = cached_posterior(engine.optimizer).posterior_mean(grid_positions, **extra_kwargs)['m(x)'].reshape(*shape)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states['Posterior Mean'] = posterior_mean_value
 
@@ -560,13 +573,16 @@ class HighDimensionalityGPCamPosteriorMean(SliceImageGraph):
         grid_positions = slice_grid(tuple(bounds), self.shape, tuple(image_axes), tuple(self.slices))
 
         # calculate acquisition function
-        posterior_mean_value = engine.optimizer.posterior_mean(grid_positions)['f(x)'].reshape(*self.shape)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_mean_value = cached_posterior(engine.optimizer).posterior_mean(grid_positions)['f(x)'].reshape(*self.shape)
 
         # transpose if necessary
         if self.image_axes['x'] > self.image_axes['y']:
             posterior_mean_value = posterior_mean_value.T
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = posterior_mean_value
 
@@ -581,13 +597,36 @@ class GPCamHyperparameterPlot(MultiPlot):
     stack_plots: ClassVar[bool] = False
 
     def compute(self, data, engine: 'GPCAMInProcessEngine'):
-        if data.states.get(self.data_key, None) is None:
-            data.states[self.data_key] = [[] for i in range(len(engine.optimizer.get_hyperparameters()))]
-        # assign to data object with lock
+        with model_inputs(engine) as current:
+            hyperparameters = engine.optimizer.get_hyperparameters()
+        # assign to data object with lock; replace rather than append in place so published snapshots stay immutable
+        if not current():
+            return
+        with data.w_lock():
+            history = data.states.get(self.data_key, None) or [[] for i in range(len(hyperparameters))]
+            data.states[self.data_key] = [values + [value] for values, value in zip(history, hyperparameters)]
+            data.states[self.label_key] = [f"Hyperparameter #{i+1}" for i in range(len(hyperparameters))]
+
+@dataclass(eq=False)
+class GPCamTrainingStatus(Graph):
+    compute_with = Location.AdaptiveEngine
+    widget_class = TableWidget
+    widget_kwargs: dict = field(default_factory=lambda: dict(sortable=False))
+    data_key: ClassVar[str] = 'Training Status'
+    name = 'Training Status'
+
+    def compute(self, data, engine: 'GPCAMInProcessEngine'):
+        if not getattr(engine, 'background_trainer', None):
+            return
+
         with data.w_lock():
-            for i in range(len(engine.optimizer.get_hyperparameters())):
-                data.states[self.data_key][i].append(engine.optimizer.get_hyperparameters()[i])
-            data.states[self.label_key] = [f"Hyperparameter #{i+1}" for i in range(len(engine.optimizer.get_hyperparameters()))]
+            data.states[self.data_key] = engine.background_trainer.as_dict()
+
+    def update(self, widget, data, update_slice: slice):
+        status = data.snapshot().states.get(self.data_key)
+        if status:
+            widget.setData([{'Property': key, 'Value': value} for key, value in status.items()])
+
 
 @dataclass(eq=False)
 class GPCamHyperparameterLogPlot(MultiPlot):
@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+from loguru import logger
+
+from tsuchinoko.graphs import Graph, ComputeMode
+from tsuchinoko.utils.logging import log_time
+
+
+@contextmanager
+def model_inputs(engine: 'Engine'):
+    """
+    Holds the engine's model read lock (if it has one) while a graph takes its inputs from the model, i.e. evaluates
+    the posterior. Processing and publishing should follow outside of this context, so that the model's writers aren't
+    held up behind them.
+
+    Yields a callable returning whether the model is unchanged since the inputs were taken; results computed from a
+    superseded model shouldn't be published (a computation for the newer model follows).
+    """
+    lock = getattr(engine, 'model_lock', None)
+    with lock.r_locked() if lock else nullcontext():
+        version = getattr(engine, 'model_version', None)
+        yield lambda: getattr(engine, 'model_version', None) == version
+
+
+@dataclass
+class GraphComputeStatistics:
+    name: str
+    computations: int = 0
+    skipped: int = 0
+    last_compute_time: float = 0
+    total_compute_time: float = 0
+
+    @property
+    def average_compute_time(self):
+        return self.total_compute_time / self.computations if self.computations else 0
+
+
+class GraphComputeScheduler:
+    """
+    Computes an adaptive engine's graphs. Graphs with `ComputeMode.Blocking` are computed on the calling thread, in
+    order. Graphs with `ComputeMode.Threaded` are computed on a bounded pool of worker threads, so that expensive graphs
+    don't hold up the experiment.
+
+    Each threaded graph has at most one computation queued and one running. If newer data arrives while a computation
+    is queued, the queued computation is replaced; work for stale data is skipped rather than queued behind.
+
+    Graphs are computed without any lock held; graphs which read the engine's model lock it only while taking their
+    inputs (see `model_inputs`).
+    """
+
+    def __init__(self, max_workers: int = 2):
+        """
+
+        Parameters
+        ----------
+        max_workers
+            The number of threads used to compute threaded graphs.
+        """
+        self.executor = ThreadPoolExecutor(max_workers, thread_name_prefix='tsuchinoko-graph')
+        self.statistics: Dict[str, GraphComputeStatistics] = {}
+        self._pending = {}
+        self._scheduled = set()
+        self._pending_lock = threading.Lock()
+        self._idle = threading.Condition(self._pending_lock)
+
+    def compute(self, graphs: Iterable[Graph], data: 'Data', engine: 'Engine'):
+        for graph in graphs:
+            if graph.compute_mode == ComputeMode.Threaded:
+                self.submit(graph, data, engine)
+            else:
+                self._compute(graph, data, engine)
+
+    def submit(self, graph: Graph, data: 'Data', engine: 'Engine'):
+        with self._pending_lock:
+            if graph in self._pending:
+                self._statistics(graph).skipped += 1
+            self._pending[graph] = (data, engine)
+            if graph in self._scheduled:
+                return  # the worker handling this graph picks up the latest data when it's free
+            self._scheduled.add(graph)
+        self.executor.submit(self._run, graph)
+
+    def _run(self, graph: Graph):
+        while True:
+            with self._pending_lock:
+                if graph not in self._pending:
+                    self._scheduled.discard(graph)
+                    self._idle.notify_all()
+                    return
+                data, engine = self._pending.pop(graph)
+            self._compute(graph, data, engine)
+
+    def _compute(self, graph: Graph, data: 'Data', engine: 'Engine'):
+        statistics = self._statistics(graph)
+        start = time.perf_counter()
+        try:
+            with log_time(f'computing {statistics.name}', cumulative_key=f'computing {statistics.name}'):
+                graph.compute(data, engine)
+        except Exception as ex:
+            logger.exception(ex)
+        finally:
+            elapsed = time.perf_counter() - start
+            statistics.computations += 1
+            statistics.last_compute_time = elapsed
+            statistics.total_compute_time += elapsed
+
+    def _statistics(self, graph: Graph) -> GraphComputeStatistics:
+        if graph.id not in self.statistics:
+            self.statistics.setdefault(graph.id, GraphComputeStatistics(graph.name or type(graph).__name__))
+        return self.statistics[graph.id]
+
+    def wait(self, timeout: float = None) -> bool:
+        """
+        Blocks until all queued computations are complete, or until `timeout` elapses.
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._scheduled, timeout)
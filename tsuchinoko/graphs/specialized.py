@@ -9,8 +9,10 @@ from scipy.ndimage import median_filter
 
 from tsuchinoko.graphics_items.mixins import YInvert, ClickRequester, BetterButtons, LogScaleIntensity, AspectRatioLock, \
     BetterAutoLUTRangeImageView, DomainROI
-from tsuchinoko.graphs import Location
+from tsuchinoko.adaptive.posterior_cache import cached_posterior, grid_evaluation
+from tsuchinoko.graphs import Location, ComputeMode
 from tsuchinoko.graphs.common import Image, ImageViewBlendROI, image_grid, ImageViewBlend, Plot, Bar
+from tsuchinoko.graphs.scheduler import model_inputs
 
 
 class NonViridisBlend(YInvert,
@@ -114,6 +116,7 @@ class ReconstructionGraph(Image):
     data_key = 'Reconstruction'
     widget_class = NonViridisBlend
     transform_to_parameter_space = False
+    compute_mode: ComputeMode = ComputeMode.Threaded
 
     def compute(self, data, engine: 'GPCAMInProcessEngine'):
         scores = np.array(data.scores)
@@ -128,13 +131,14 @@ class ReconstructionGraph(Image):
         #                        linalg.block_diag(*[engine.optimizer.A] * num_sinograms),
         #                        num_iterations=1,
         #                        initial=getattr(self, 'last_recon', None))
-        try:
-            last_recon = getattr(engine.optimizer, 'last_recon', None)
-        except Exception:
-            last_recon = None
+        with model_inputs(engine) as current:
+            try:
+                last_recon = getattr(engine.optimizer, 'last_recon', None)
+            except Exception:
+                last_recon = None
 
         # assign to data object with lock
-        if last_recon is not None:
+        if last_recon is not None and current():
             with data.w_lock():
                 data.states[self.data_key] = np.rot90(last_recon.reshape(*self.shape))
 
@@ -202,12 +206,13 @@ class SinogramSpaceGPCamAcquisitionFunction(Image):
 
         # calculate acquisition function
         grid_positions = [grid_positions[:len(grid_positions)//2], grid_positions[len(grid_positions)//2:]]
-        acquisition_function_value = np.hstack([engine.optimizer.evaluate_acquisition_function(p,
-                                                                                    acquisition_function=
-                                                                                    gpcam_acquisition_functions[
-                                                                                        engine.parameters[
-                                                                                            'acquisition_function']],
-                                                                                    origin=engine.last_position) for p in grid_positions])
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            acquisition_function_value = np.hstack([engine.optimizer.evaluate_acquisition_function(p,
+                                                                                        acquisition_function=
+                                                                                        engine.acquisition_function(
+                                                                                            engine.parameters[
+                                                                                                'acquisition_function']),
+                                                                                        origin=engine.last_position) for p in grid_positions])
 
         try:
             acquisition_function_value = acquisition_function_value.reshape(*self.shape)
@@ -215,6 +220,8 @@ class SinogramSpaceGPCamAcquisitionFunction(Image):
             acquisition_function_value = np.array([[0]])
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = acquisition_function_value
 
@@ -238,16 +245,19 @@ class ReconHistogram(Bar):
         #                        linalg.block_diag(*[engine.optimizer.A] * num_sinograms),
         #                        num_iterations=1,
         #                        initial=getattr(self, 'last_recon', None))
-        try:
-            last_recon = getattr(engine.optimizer, 'last_recon', None)
-        except Exception:
-            last_recon = None
+        with model_inputs(engine) as current:
+            try:
+                last_recon = getattr(engine.optimizer, 'last_recon', None)
+            except Exception:
+                last_recon = None
 
         if last_recon is not None:
             # calculate histogram
             y, x = np.histogram(last_recon, bins=100)
 
             # assign to data object with lock
+            if not current():
+                return
             with data.w_lock():
                 data.states[self.data_key] = [y, x]
 
@@ -274,9 +284,12 @@ class RealSpacePosteriorMean(Image):
             shape = (*self.shape, engine.output_number)
 
         # calculate acquisition function
-        posterior_mean_value = np.rot90(np.fliplr(engine.optimizer.posterior_mean(grid_positions)['f(x)'].reshape(*shape)),3)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_mean_value = np.rot90(np.fliplr(cached_posterior(engine.optimizer).posterior_mean(grid_positions)['f(x)'].reshape(*shape)),3)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states['Posterior Mean'] = posterior_mean_value
 
@@ -303,9 +316,12 @@ class RealSpacePosteriorVariance(Image):
             shape = (*self.shape, engine.output_number)
 
         # calculate acquisition function
-        posterior_variance_value = np.rot90(np.fliplr(engine.optimizer.posterior_covariance(grid_positions)['v(x)'].reshape(*shape)),3)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_variance_value = np.rot90(np.fliplr(cached_posterior(engine.optimizer).posterior_covariance(grid_positions, variance_only=True)['v(x)'].reshape(*shape)),3)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states['Posterior Variance'] = posterior_variance_value
 
@@ -333,12 +349,15 @@ class InvertedRealSpacePosteriorMean(Image):
             shape = (*self.shape, engine.output_number)
 
         # calculate posterior_mean
-        posterior_mean = engine.optimizer.posterior_mean(grid_positions)['f(x)']
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_mean = cached_posterior(engine.optimizer).posterior_mean(grid_positions)['f(x)']
 
         # invert posterior_mean
         real_space_posterior_mean = np.rot90((self.A_inv @ posterior_mean).reshape(shape[0], shape[0]), 3)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = real_space_posterior_mean
 
@@ -366,12 +385,15 @@ class InvertedRealSpacePosteriorVariance(Image):
             shape = (*self.shape, engine.output_number)
 
         # calculate posterior_ variance
-        posterior_variance = engine.optimizer.posterior_covariance(grid_positions)['v(x)']
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_variance = cached_posterior(engine.optimizer).posterior_covariance(grid_positions, variance_only=True)['v(x)']
 
         # invert posterior_variance
         real_space_posterior_variance = np.rot90((self.A_inv @ posterior_variance).reshape(shape[0], shape[0]), 3)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = real_space_posterior_variance
 
@@ -394,12 +416,15 @@ class InvertedSinoSpacePosteriorMean(Image):
         #     shape = (*self.shape, engine.output_number)
 
         # calculate posterior_mean
-        posterior_mean = engine.optimizer.posterior_mean(grid_positions)['f(x)'].reshape(*grid_shape)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_mean = cached_posterior(engine.optimizer).posterior_mean(grid_positions)['f(x)'].reshape(*grid_shape)
 
         # invert posterior_mean
         real_space_posterior_mean = posterior_mean
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = real_space_posterior_mean
 
@@ -423,12 +448,15 @@ class InvertedSinoSpacePosteriorVariance(Image):
         #     shape = (*self.shape, engine.output_number)
 
         # calculate posterior_mean
-        posterior_variance = engine.optimizer.posterior_covariance(grid_positions)['v(x)'].reshape(*grid_shape)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            posterior_variance = cached_posterior(engine.optimizer).posterior_covariance(grid_positions, variance_only=True)['v(x)'].reshape(*grid_shape)
 
         # invert posterior_mean
         real_space_posterior_mean = posterior_variance.reshape(self.shape)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = real_space_posterior_mean
 
@@ -458,7 +486,8 @@ class InvertedRecon(Image):
         #     shape = (*self.shape, engine.output_number)
 
         # calculate posterior_mean
-        sinogram = engine.optimizer.posterior_mean(grid_positions)['f(x)'].reshape(*grid_shape)
+        with model_inputs(engine) as current, grid_evaluation(engine.optimizer):
+            sinogram = cached_posterior(engine.optimizer).posterior_mean(grid_positions)['f(x)'].reshape(*grid_shape)
 
         # filter and clip
         sinogram = median_filter(sinogram, 3)
@@ -476,7 +505,7 @@ class InvertedRecon(Image):
                                         ind=0,
                                         tol=0.01,
                                         sinogram_order=True)
-            data.states['recon_last_center_found'] = len(data)
+            last_center_found = len(data)
         else:
             center = self.shape[0] / 2
         recon = tomopy.recon(sinogram.T[np.newaxis, :, :],
@@ -489,6 +518,9 @@ class InvertedRecon(Image):
         recon = tomopy.circ_mask(recon, axis=0, ratio=0.95)
 
         # assign to data object with lock
+        if not current():
+            return
         with data.w_lock():
             data.states[self.data_key] = np.rot90(recon.reshape(self.shape[0]*self.upsampling,
-                                                                self.shape[0]*self.upsampling), 3)
\ No newline at end of file
+                                                                self.shape[0]*self.upsampling), 3)
+            data.states['recon_last_center_found'] = last_center_found
\ No newline at end of file
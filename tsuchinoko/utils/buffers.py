@@ -0,0 +1,211 @@
+from threading import Condition, Lock
+from typing import Iterable, Any, List
+
+import numpy as np
+
+
+class ColumnBuffer:
+    """
+    An append-only column of values backed by a NumPy array with amortized (geometric) growth. The row shape and dtype
+    are inferred from the first value appended; numeric values are stored as float64, anything else (or any value that
+    doesn't match the established row shape) falls back to an object column.
+
+    Readers receive read-only views of the committed rows, so the same memory can be handed out repeatedly without
+    conversion. Since rows are never modified once appended, a view remains valid (and unchanged) even after the buffer
+    grows or more rows are appended.
+
+    The list-like API (`len`, indexing, iteration, `append`, `extend`, `copy`, `+=`) is preserved for existing callers.
+    """
+
+    def __init__(self, values: Iterable = None, dtype=None, initial_capacity: int = 16):
+        self._array = None
+        self._length = 0
+        self._dtype = dtype
+        self._initial_capacity = initial_capacity
+        if values is not None:
+            self.extend(values)
+
+    def _allocate(self, sample):
+        sample = np.asarray(sample, dtype=self._dtype) if self._dtype is not None else np.asarray(sample)
+        if self._dtype is not None:
+            dtype = self._dtype
+        elif sample.dtype.kind in 'biuf':
+            dtype = np.float64
+        elif sample.dtype.kind == 'c':
+            dtype = np.complex128
+        else:
+            dtype = object
+        row_shape = sample.shape if dtype is not object else ()
+        self._array = np.empty((self._initial_capacity, *row_shape), dtype=dtype)
+
+    def _reserve(self, count: int):
+        required = self._length + count
+        capacity = len(self._array)
+        if required <= capacity:
+            return
+        while capacity < required:
+            capacity *= 2
+        grown = np.empty((capacity, *self._array.shape[1:]), dtype=self._array.dtype)
+        grown[:self._length] = self._array[:self._length]
+        self._array = grown
+
+    def _demote_to_object(self):
+        rows = list(self._array[:self._length])
+        self._array = np.empty(max(len(self._array), 1), dtype=object)
+        for i, row in enumerate(rows):
+            self._array[i] = row
+
+    def _fits(self, value) -> bool:
+        if self._array.dtype == object:
+            return True
+        return np.shape(value) == self._array.shape[1:]
+
+    def append(self, value: Any):
+        if self._array is None:
+            self._allocate(value)
+        elif not self._fits(value):
+            self._demote_to_object()
+        self._reserve(1)
+        self._array[self._length] = value
+        self._length += 1
+
+    def extend(self, values: Iterable):
+        if isinstance(values, ColumnBuffer):
+            values = values.view()
+        if not isinstance(values, np.ndarray):
+            values = list(values)
+        if not len(values):
+            return
+        if self._array is None:
+            self._allocate(values[0])
+
+        # bulk copy when the incoming rows share the buffer's row shape
+        if self._array.dtype != object:
+            try:
+                block = np.asarray(values, dtype=self._array.dtype)
+            except (ValueError, TypeError):
+                block = None
+            if block is not None and block.shape[1:] == self._array.shape[1:]:
+                self._reserve(len(block))
+                self._array[self._length:self._length + len(block)] = block
+                self._length += len(block)
+                return
+
+        for value in values:
+            self.append(value)
+
+    def view(self) -> np.ndarray:
+        """
+        Returns a read-only view of the committed rows.
+        """
+        if self._array is None:
+            return np.empty((0,))
+        view = self._array[:self._length]
+        view.flags.writeable = False
+        return view
+
+    @property
+    def dtype(self):
+        return self.view().dtype
+
+    @property
+    def shape(self):
+        return self.view().shape
+
+    def copy(self) -> np.ndarray:
+        return self.view().copy()
+
+    def tolist(self) -> list:
+        return self.view().tolist()
+
+    def __array__(self, dtype=None, copy=None):
+        if copy:
+            return np.array(self.view(), dtype=dtype)
+        return np.asarray(self.view(), dtype=dtype)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, item):
+        return self.view()[item]
+
+    def __iter__(self):
+        return iter(self.view())
+
+    def __iadd__(self, other: Iterable):
+        self.extend(other)
+        return self
+
+    def __reduce__(self):
+        return self.__class__, (self.view(), self._dtype)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.view()!r})'
+
+
+class RingBuffer:
+    """
+    A bounded FIFO of objects in a preallocated circular array, guarded by a single lock. Producers block while the
+    buffer is full (so that nothing is dropped), and a consumer takes everything buffered at once with `drain`. Once
+    closed, producers no longer block; items that don't fit are refused.
+    """
+
+    def __init__(self, capacity: int):
+        self._items = [None] * capacity
+        self._head = 0
+        self._count = 0
+        self._lock = Lock()
+        self._not_full = Condition(self._lock)
+        self._not_empty = Condition(self._lock)
+        self._closed = False
+        self.high_water = 0  # the most items ever buffered at once
+        self.waits = 0  # puts which blocked on a full buffer
+
+    @property
+    def capacity(self) -> int:
+        return len(self._items)
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """
+        Wakes producers blocked on a full buffer, and stops them blocking from now on.
+        """
+        with self._lock:
+            self._closed = True
+            self._not_full.notify_all()
+
+    def put(self, item: Any) -> bool:
+        """
+        Appends an item, blocking while the buffer is full. Returns False if the buffer is (or becomes) closed while
+        full.
+        """
+        with self._not_full:
+            if self._count == self.capacity:
+                self.waits += 1
+                self._not_full.wait_for(lambda: self._count < self.capacity or self._closed)
+                if self._count == self.capacity:
+                    return False
+            self._items[(self._head + self._count) % self.capacity] = item
+            self._count += 1
+            self.high_water = max(self.high_water, self._count)
+            self._not_empty.notify()
+        return True
+
+    def drain(self, timeout: float = 0) -> List[Any]:
+        """
+        Removes and returns all buffered items, in order. With a `timeout` (or None, to wait indefinitely), blocks until
+        at least one item is buffered.
+        """
+        with self._not_empty:
+            if timeout != 0:
+                self._not_empty.wait_for(lambda: self._count, timeout)
+            end = self._head + self._count
+            items = self._items[self._head:min(end, self.capacity)] + self._items[:max(end - self.capacity, 0)]
+            for start, stop in [(self._head, min(end, self.capacity)), (0, max(end - self.capacity, 0))]:
+                self._items[start:stop] = [None] * (stop - start)
+            self._head = end % self.capacity
+            self._count = 0
+            self._not_full.notify_all()
+        return items
@@ -7,14 +7,24 @@
     https://en.wikipedia.org/wiki/Readers%E2%80%93writer_lock#Using_two_mutexes
     Code written by Tyler Neylon at Unbox Research.
     This file is public domain.
+
+    FairRWLock is a writer-preferring alternative with optional timeouts and
+    runtime statistics (wait/hold times, contention, longest holder).
 """
 
 
 # _______________________________________________________________________
 # Imports
 
+import inspect
+import os
+import sys
+import threading
+import weakref
 from contextlib import contextmanager
-from threading  import Lock
+from dataclasses import dataclass, replace
+from threading  import Lock, Condition
+from time import perf_counter
 
 
 # _______________________________________________________________________
@@ -84,4 +94,196 @@ class RWLock(object):
             self.w_acquire()
             yield
         finally:
-            self.w_release()
\ No newline at end of file
+            self.w_release()
+
+# _______________________________________________________________________
+# Fair, instrumented variant
+
+_registry = weakref.WeakSet()
+_this_file = os.path.normcase(__file__)
+_wrapper_codes = set()
+
+
+@dataclass
+class LockStatistics:
+    """ Accumulated timing statistics for a FairRWLock. All times are in seconds. """
+    name: str = None
+    read_acquisitions: int = 0
+    write_acquisitions: int = 0
+    read_contentions: int = 0
+    write_contentions: int = 0
+    read_wait_time: float = 0
+    write_wait_time: float = 0
+    longest_read_wait: float = 0
+    longest_write_wait: float = 0
+    read_hold_time: float = 0
+    write_hold_time: float = 0
+    longest_hold_time: float = 0
+    longest_holder: str = None
+    timeouts: int = 0
+
+
+def lock_wrapper(function):
+    """ Registers `function` (i.e. a context manager which acquires a FairRWLock on behalf of its caller) to be
+        skipped when reporting call sites, so that the caller is reported instead. Usable as a decorator.
+    """
+    _wrapper_codes.add(inspect.unwrap(function).__code__)
+    return function
+
+
+def _call_site():
+    """ Returns (file, line, function) for the first frame outside this module, contextlib, and registered wrappers.
+    """
+    frame = sys._getframe(2)
+    while frame and (frame.f_code in _wrapper_codes
+                     or os.path.normcase(frame.f_code.co_filename) == _this_file
+                     or frame.f_code.co_filename.endswith('contextlib.py')):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return frame.f_code.co_filename, frame.f_lineno, frame.f_code.co_name
+
+
+class FairRWLock(object):
+    """ A writer-preferring read-write lock. Once a writer is waiting, new
+        readers queue behind it, so a steady stream of readers can't starve
+        writers. Readers may re-enter while already holding a read lock, and
+        the thread holding the write lock may also read.
+
+        Acquisition accepts an optional timeout; the context managers raise
+        TimeoutError when it expires. Wait/hold times and contention counts
+        are accumulated and can be read at runtime with `statistics()` (or
+        for all live locks, with `lock_statistics()`).
+        Usage is identical to RWLock:
+            with my_obj_rwlock.r_locked():
+                do_read_only_things_with(my_obj)
+            with my_obj_rwlock.w_locked(timeout=1):
+                mutate(my_obj)
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self._condition = Condition(Lock())
+        self._readers = 0
+        self._writer = None
+        self._waiting_writers = 0
+        self._local = threading.local()
+        self._statistics = LockStatistics(name=name)
+        _registry.add(self)
+
+    def statistics(self):
+        """ Returns a copy of the accumulated statistics. """
+        with self._condition:
+            return replace(self._statistics)
+
+    def reset_statistics(self):
+        with self._condition:
+            self._statistics = LockStatistics(name=self.name)
+
+    def _hold_stack(self):
+        stack = getattr(self._local, 'holds', None)
+        if stack is None:
+            stack = self._local.holds = []
+        return stack
+
+    def _record_hold(self, held):
+        # the holder is looked up (within its frame, as it releases) only when its hold is the longest yet, rather than
+        # walking the stack on every acquisition
+        if held > self._statistics.longest_hold_time:
+            site = _call_site()
+            self._statistics.longest_hold_time = held
+            self._statistics.longest_holder = '{}:{} ({})'.format(*site) if site else None
+
+    # ___________________________________________________________________
+    # Reading methods.
+
+    def r_acquire(self, timeout=None):
+        thread = threading.get_ident()
+        reentrant = bool(getattr(self._local, 'reads', 0)) or self._writer == thread
+        start = perf_counter()
+        with self._condition:
+            can_read = lambda: self._writer in (None, thread) and (reentrant or not self._waiting_writers)
+            contended = not can_read()
+            if contended and not self._condition.wait_for(can_read, timeout):
+                self._statistics.timeouts += 1
+                return False
+            self._readers += 1
+            waited = perf_counter() - start
+            self._statistics.read_acquisitions += 1
+            self._statistics.read_contentions += contended
+            self._statistics.read_wait_time += waited
+            self._statistics.longest_read_wait = max(self._statistics.longest_read_wait, waited)
+        self._local.reads = getattr(self._local, 'reads', 0) + 1
+        self._hold_stack().append(perf_counter())
+        return True
+
+    def r_release(self):
+        held = perf_counter() - self._hold_stack().pop()
+        self._local.reads -= 1
+        with self._condition:
+            assert self._readers > 0
+            self._readers -= 1
+            self._statistics.read_hold_time += held
+            self._record_hold(held)
+            if not self._readers:
+                self._condition.notify_all()
+
+    @contextmanager
+    def r_locked(self, timeout=None):
+        """ This method is designed to be used via the `with` statement. """
+        if not self.r_acquire(timeout):
+            raise TimeoutError(f'Timed out waiting for read lock on {self.name or self}.')
+        try:
+            yield
+        finally:
+            self.r_release()
+
+    # ___________________________________________________________________
+    # Writing methods.
+
+    def w_acquire(self, timeout=None):
+        thread = threading.get_ident()
+        start = perf_counter()
+        with self._condition:
+            can_write = lambda: self._writer is None and not self._readers
+            contended = not can_write()
+            self._waiting_writers += 1
+            try:
+                if contended and not self._condition.wait_for(can_write, timeout):
+                    self._statistics.timeouts += 1
+                    return False
+            finally:
+                self._waiting_writers -= 1
+                if not self._waiting_writers:
+                    self._condition.notify_all()  # queued readers may now proceed
+            self._writer = thread
+            waited = perf_counter() - start
+            self._statistics.write_acquisitions += 1
+            self._statistics.write_contentions += contended
+            self._statistics.write_wait_time += waited
+            self._statistics.longest_write_wait = max(self._statistics.longest_write_wait, waited)
+        self._hold_stack().append(perf_counter())
+        return True
+
+    def w_release(self):
+        held = perf_counter() - self._hold_stack().pop()
+        with self._condition:
+            self._writer = None
+            self._statistics.write_hold_time += held
+            self._record_hold(held)
+            self._condition.notify_all()
+
+    @contextmanager
+    def w_locked(self, timeout=None):
+        """ This method is designed to be used via the `with` statement. """
+        if not self.w_acquire(timeout):
+            raise TimeoutError(f'Timed out waiting for write lock on {self.name or self}.')
+        try:
+            yield
+        finally:
+            self.w_release()
+
+
+def lock_statistics():
+    """ Returns statistics for every live FairRWLock. """
+    return [lock.statistics() for lock in list(_registry)]
@@ -26,6 +26,7 @@ class DebuggableMenuBar(QMenuBar):
 
         self._debugmenu = QMenu("Debugging")
         self._debugmenu.addAction("Debug widget", self.startDebugging)
+        self._debugmenu.addAction("Log lock statistics", self.log_lock_statistics)
         self._loggingmenu = QMenu("Logging level")
         self._debugmenu.addMenu(self._loggingmenu)
         self._levels_group = QActionGroup(self)
@@ -46,6 +47,11 @@ class DebuggableMenuBar(QMenuBar):
         displays.log_handler_id = logger.add(displays.LogHandler(), level=level.upper())
         logger.critical(f'Log level set to {level.upper()}')
 
+    def log_lock_statistics(self):
+        from tsuchinoko.utils.mutex import lock_statistics
+        for statistics in lock_statistics():
+            logger.critical(f'Lock statistics: {statistics}')
+
     def showDebugMenu(self):
         self.addMenu(self._debugmenu)
 
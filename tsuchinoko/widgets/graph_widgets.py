@@ -208,9 +208,9 @@ class CloudWidget(QWidget):
         # require_clear = False
         timeline_at_end = not self.cache or self.timeline.getXPos() == len(self.cache['v']) - 1
 
-        with data.r_lock():
-            v = np.asarray(data[self.data_key].copy())
-            x, y = zip(*data.positions)
+        snapshot = data.snapshot()
+        v = np.asarray(snapshot[self.data_key])
+        x, y = snapshot.positions[:, :2].T
 
         if v.ndim == 2:
             if len(v[0]) > 1:
@@ -8,6 +8,7 @@ from signal import SIGINT
 from typing import Any, Type, Union
 import sys
 from pathlib import Path
+from uuid import uuid4
 
 from tsuchinoko.utils.dependencies import check_dependencies
 from tsuchinoko.widgets.debugmenubar import DebuggableMenuBar
@@ -30,12 +31,14 @@ from qtpy.QtWidgets import QMainWindow, QApplication, QHBoxLayout, QWidget, QMen
 
 from tsuchinoko.assets import path
 from tsuchinoko.adaptive import Data
-from tsuchinoko.core import CoreState
+from tsuchinoko.core import CoreState, HEARTBEAT_INTERVAL
 from tsuchinoko.core.messages import PauseRequest, StartRequest, GetParametersRequest, SetParameterRequest, \
     PartialDataRequest, FullDataRequest, StopRequest, Message, StateRequest, StateResponse, GetParametersResponse, \
     FullDataResponse, PartialDataResponse, MeasureRequest, \
     ConnectRequest, ConnectResponse, PushDataRequest, ExceptionResponse, PullGraphsRequest, GraphsResponse, \
-    ReplayRequest, ExitRequest, PushGraphsRequest, SetComputeMetricsRequest
+    ReplayRequest, ExitRequest, PushGraphsRequest, SetComputeMetricsRequest, PublishedDataResponse, \
+    PublishedStateResponse, HeartbeatRequest
+from tsuchinoko.core.serialization import encode_message, decode_message, SerializationError
 from tsuchinoko.graphics_items.clouditem import CloudItem
 from tsuchinoko.graphics_items.indicatoritem import BetterCurveArrow
 from tsuchinoko.graphics_items.mixins import ClickRequester, request_relay, ClickRequesterPlot
@@ -48,7 +51,7 @@ class ImageViewBlend(ClickRequester):
 
 
 class MainWindow(QMainWindow):
-    def __init__(self, core_address='localhost'):
+    def __init__(self, core_address='localhost', use_pickle=False, publish_port=5556):
         super(MainWindow, self).__init__()
 
         menubar = DebuggableMenuBar()
@@ -105,7 +108,11 @@ class MainWindow(QMainWindow):
 
         self.context = zmq.Context()
         self.socket = None
+        self.subscriber = None
+        self.client_id = uuid4().bytes  # kept across reconnects, so that the server recognizes this client's session
         self.core_address = core_address
+        self.publish_port = publish_port  # the port on which the core server publishes updates (see ZMQCore)
+        self.use_pickle = use_pickle  # talk to legacy servers that only understand pickled messages
         self.init_socket()
 
         self.state_manager_widget.sigPause.connect(self.pause)
@@ -123,13 +130,21 @@ class MainWindow(QMainWindow):
 
         self.data: Data = Data()
         self.last_data_size = None
+        self.state_versions = {}  # versions of the server's state entries held in self.data
+        self.sequence = None  # sequence number of the last publication applied; None when a snapshot is needed
+        self.streaming = True  # False for servers that don't publish; data is then polled
+        self.state_stale = True  # state changes are published; the state is only requested when some may be missed
+        self.last_request_time = 0  # an idle client sends heartbeats, so that its session on the server doesn't lapse
         self.callbacks = defaultdict(list)
 
         self.subscribe(self.state_manager_widget.update_state, StateResponse)
+        self.subscribe(self._state_callback, StateResponse)
         self.subscribe(self.state_manager_widget.update_state, ConnectResponse)
         self.subscribe(self.configuration_widget.update_parameters, GetParametersResponse, invoke_as_event=True)
-        self.subscribe(partial(self._data_callback, response_type='full'), FullDataResponse)
+        self.subscribe(self._full_data_callback, FullDataResponse)
         self.subscribe(partial(self._data_callback, response_type='partial'), PartialDataResponse)
+        self.subscribe(partial(self._data_callback, response_type='published'), PublishedDataResponse)
+        self.subscribe(self._published_state_callback, PublishedStateResponse)
         self.subscribe(self.refresh_state, ConnectResponse)
         self.subscribe(self.log_widget.log_exception, ExceptionResponse)
         self.subscribe(self.set_graphs, GraphsResponse, invoke_as_event=True)
@@ -145,10 +160,21 @@ class MainWindow(QMainWindow):
         logger.info("Connecting to core server…")
         self.socket = self.context.socket(zmq.REQ)
         self.socket.setsockopt(zmq.LINGER, 5)
+        self.socket.setsockopt(zmq.IDENTITY, self.client_id)
         self.socket.connect(f"tcp://{self.core_address}:5555")
         self.socket.RCVTIMEO = 5000
         self.message_queue = Queue()
 
+        # data and state updates are pushed by the server; a new snapshot is needed to follow them
+        if self.subscriber:
+            self.subscriber.close()
+        self.subscriber = self.context.socket(zmq.SUB)
+        self.subscriber.setsockopt(zmq.LINGER, 0)
+        self.subscriber.setsockopt(zmq.SUBSCRIBE, b'')
+        self.subscriber.connect(f"tcp://{self.core_address}:{self.publish_port}")
+        self.sequence = None
+        self.state_stale = True
+
     def try_connect(self):
         self.message_queue.put(ConnectRequest())
 
@@ -197,6 +223,7 @@ class MainWindow(QMainWindow):
             if self.state_manager_widget.state == CoreState.Stopping:
                 self.last_data_size = 0
                 self.data = Data()
+                self.sequence = None
 
             if self.state_manager_widget.state == CoreState.Connecting:
                 self.try_connect()
@@ -204,24 +231,37 @@ class MainWindow(QMainWindow):
             if self.state_manager_widget.state in [CoreState.Pausing, CoreState.Starting, CoreState.Resuming, CoreState.Resuming, CoreState.Stopping]:
                 self.get_state()
 
+            if self.message_queue.empty():
+                # wait on publications from the server; queued control requests are still sent within .2 s
+                self.receive_publications(timeout=200)
+            else:
+                self.receive_publications()
+
             try:
-                request = self.message_queue.get(timeout=.2)
+                request = self.message_queue.get_nowait()
             except Empty:
                 if self.state_manager_widget.state == CoreState.Running:
-                    if self.data:
-                        request = PartialDataRequest(len(self.data))
+                    if self.streaming:
+                        if self.sequence is None:
+                            request = FullDataRequest()
+                    elif self.data:
+                        request = PartialDataRequest(len(self.data), self.state_versions)
                     else:
                         request = FullDataRequest()
 
             if not request:
-                self.get_state()
-                continue
-            else:
-                logger.info(f'request: {request}')
+                if self.state_stale or not self.streaming:
+                    self.get_state()
+                    continue
+                elif time.monotonic() - self.last_request_time < HEARTBEAT_INTERVAL:
+                    continue
+                request = HeartbeatRequest()
+            logger.info(f'request: {request}')
 
             try:
-                self.socket.send_pyobj(request)
-                response = self.socket.recv_pyobj()
+                self.socket.send_multipart(encode_message(request, use_pickle=self.use_pickle), copy=False)
+                response = decode_message(self.socket.recv_multipart(copy=False), allow_pickle=self.use_pickle)
+                self.last_request_time = time.monotonic()
             except (ZMQError, Again) as ex:
                 logger.warning(f'Unable to connect to core server at {self.core_address}...')
                 time.sleep(1)
@@ -230,8 +270,10 @@ class MainWindow(QMainWindow):
                     self.init_socket()
                 self.data = Data()  # wipeout data and get a full update next time
                 self.last_data_size = 0
+                self.sequence = None
+                self.streaming = True
                 self.state_manager_widget.update_state(CoreState.Connecting, True)
-            except UnpicklingError as ex:
+            except (SerializationError, UnpicklingError) as ex:
                 logger.exception(ex)
                 logger.critical('The above error prevented unpacking data from the server.')
             else:
@@ -241,28 +283,87 @@ class MainWindow(QMainWindow):
                 else:
                     if self.state_manager_widget.state == CoreState.Connecting:
                         logger.critical(f'Successfully connected to server at {self.core_address}.')
-                    for callback, as_event in self.callbacks[type(response)]:
-                        if as_event:
-                            invoke_as_event(callback, *response.payload)
-                        else:
-                            callback(*response.payload)
+                    self._dispatch(response)
+
+    def receive_publications(self, timeout=0):
+        while self.subscriber.poll(timeout):
+            timeout = 0
+            try:
+                publication = decode_message(self.subscriber.recv_multipart(copy=False))
+            except SerializationError as ex:
+                logger.exception(ex)
+                continue
+
+            if self.sequence is not None:
+                if publication.sequence <= self.sequence:
+                    continue  # already included in the last snapshot
+                elif publication.sequence > self.sequence + 1:
+                    logger.warning(f'Missed {publication.sequence - self.sequence - 1} publication(s) from the server; '
+                                   f'requesting a new snapshot.')
+                    self.sequence = None
+                    self.state_stale = True
+                else:
+                    self.sequence = publication.sequence
 
-    def _data_callback(self, data_payload, last_data_size=None, response_type='partial'):
+            # data can only be applied on top of a snapshot; states are always current
+            if self.sequence is None and isinstance(publication, PublishedDataResponse):
+                continue
+
+            self._dispatch(publication)
+
+    def _dispatch(self, response):
+        for callback, as_event in self.callbacks[type(response)]:
+            if as_event:
+                invoke_as_event(callback, *response.payload)
+            else:
+                callback(*response.payload)
+
+    def _state_callback(self, state, compute_metrics):
+        self.state_stale = False
+
+    def _published_state_callback(self, state, compute_metrics, sequence):
+        self.state_manager_widget.update_state(state, compute_metrics)
+
+    def _full_data_callback(self, data_payload, state_versions=None, sequence=None):
+        self._data_callback(data_payload, state_versions=state_versions, response_type='full')
+        # servers that don't publish send no sequence number
+        self.streaming = sequence is not None
+        self.sequence = sequence
+
+    def _data_callback(self, data_payload, last_data_size=None, state_versions=None, sequence=None,
+                       response_type='partial'):
         if not isinstance(data_payload, dict):  # TODO: Remove when responses are mapped to callbacks
             return
 
-        if last_data_size is not None and last_data_size < len(self.data):
+        if response_type == 'partial' and last_data_size is not None and last_data_size < len(self.data):
             raise IndexError('Overwriting of previous data prevented.')
 
+        if response_type == 'published':
+            if not last_data_size:
+                response_type = 'full'  # the server's data set was replaced
+            elif last_data_size > len(self.data):
+                self.sequence = None  # doesn't line up with the data held; request a new snapshot
+                return
+            else:
+                # the last snapshot may already include some of the published rows
+                data_payload = Data(**data_payload)[len(self.data) - last_data_size:].as_dict(as_lists=False)
+                response_type = 'partial'
+
         if response_type == 'full':
             self.data = Data(**data_payload)
             self.last_data_size = 0
+            self.state_versions = dict(state_versions or {})
         elif response_type == 'partial':
-            self.data.extend(Data(**data_payload))
+            if state_versions is None:
+                self.data.extend(Data(**data_payload))
+            else:
+                # the payload only carries changed states; merge them over those already held
+                self.data.extend(Data(**data_payload), state_keys=state_versions.keys())
+                self.state_versions = dict(state_versions)
         else:
             raise ValueError()
 
-        if len(data_payload['positions']):
+        if len(data_payload['positions']) or data_payload.get('states'):
             # stash the length of new data early to avoid events getting confused when pausing this thread
             old_last_data_size, self.last_data_size = self.last_data_size, len(self.data)
             invoke_as_event(self.update_graphs, self.data, old_last_data_size)
@@ -307,6 +408,8 @@ class MainWindow(QMainWindow):
 
         self.data = Data(**load(open(name, 'r'), Loader=Loader))
         self.last_data_size = len(self.data)
+        self.state_versions = {}
+        self.sequence = None
         # self.graph_manager_widget.reset()
         self.message_queue.put(PullGraphsRequest())
         # self.update_graphs(self.data, 0)
@@ -325,8 +428,7 @@ class MainWindow(QMainWindow):
         name, filter = QFileDialog.getSaveFileName(filter=("YAML (*.yml)"))
         if not name:
             return
-        with self.data.r_lock():
-            dump(self.data.as_dict(), open(name, 'w'), Dumper=Dumper)
+        dump(self.data.as_dict(), open(name, 'w'), Dumper=Dumper)
 
     def open_parameters(self):
         name, filter = QFileDialog.getOpenFileName(filter=("YAML (*.yml)"))
@@ -353,6 +455,8 @@ class MainWindow(QMainWindow):
                 return
 
         self.data = Data()
+        self.state_versions = {}
+        self.sequence = None
         self.graph_manager_widget.reset()
 
     def close_zmq(self):
@@ -364,6 +468,9 @@ class MainWindow(QMainWindow):
             logger.debug('Closing socket')
             self.socket.close()
             self.socket = None
+        if self.subscriber:
+            self.subscriber.close()
+            self.subscriber = None
         if self.context:
             logger.debug('Closing context')
             self.context.term()